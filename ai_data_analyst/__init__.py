@@ -1 +1,11 @@
-from . import agent
\ No newline at end of file
+from dotenv import load_dotenv
+
+# Before any module reads its settings from the environment
+load_dotenv()
+
+from .logging_config import configure_logging  # noqa: E402
+
+# Once for the process, before the agents log their initialization
+configure_logging()
+
+from . import agent  # noqa: E402, F401
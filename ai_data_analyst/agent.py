@@ -4,6 +4,12 @@ from dotenv import load_dotenv
 from google.adk.agents import LlmAgent
 from google.adk.tools.agent_tool import AgentTool
 
+from .artifacts import resolve_tool_arguments, store_large_output
+from .llm_scheduler import scheduled_model
+from .metrics import configure_metrics
+from .model_router import apply_model_route, log_routed_latency, route_request
+from .speculation import start_speculation
+from .tracing import configure_tracing, record_tool_result
 from .sub_agents.analysis_agent import analysis_agent
 from .sub_agents.data_agent import data_agent
 from .sub_agents.visualization_agent import visualization_agent
@@ -13,8 +19,9 @@ from google.genai import types
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+configure_tracing()
+configure_metrics()
 
 ORCHESTRATOR_INSTRUCTION = """
 You are the Master Orchestrator for data analysis. Your primary role is to understand a user's request, create a plan to fulfill it, and then execute that plan methodically.
@@ -38,7 +45,15 @@ You must follow a strict workflow.
 2.  **EXECUTE THE PLAN:** The `planner_agent_tool` will return a JSON object containing a multi-step plan. You must then execute this plan step-by-step.
     - For each step in the plan, call the specified agent tool with the provided instruction.
     - You must pass the output of one step as input to the next, where appropriate.
+    - Large outputs are returned as a handle such as `artifact://data_engineer_agent_tool/1` with a short preview.
+      To pass such an output to another agent, write its handle in the request; it is replaced with the full output
+      before the agent runs. **DO NOT** copy data from previews into requests.
+    - Query results with too many rows are stored and summarized with a `dataset://...` handle. Pass the summary
+      (or its handle) to the analysis and visualization agents as the dataset, unchanged; they read the full data
+      themselves.
     - Keep track of the results from each step.
+    - Simple lookup requests may skip the analysis step: if `descriptive_analyzer_agent_tool` returns a result
+      with `"analysis_type": "skipped"`, continue with the next step.
 
 3.  **GENERATE THE FINAL REPORT:** After executing ALL steps in the plan, your final action is to call the `narrative_agent_tool`. This agent will synthesize all the gathered information (original request, data, analysis, visualizations) into a final, comprehensive report for the user.
 
@@ -62,10 +77,18 @@ narrative_agent_tool = AgentTool(agent=narrative_agent)
 
 root_agent = LlmAgent(
     name="ai_data_analyst_orchestrator",
-    model="gemini-2.5-pro",
+    model=scheduled_model("gemini-2.5-pro", agent="ai_data_analyst_orchestrator"),
     instruction=ORCHESTRATOR_INSTRUCTION,
     description="Orchestrates specialized agents for data analysis.",
     tools=[planner_agent_tool, data_agent_tool, analysis_agent_tool, visualization_agent_tool, narrative_agent_tool],
+    # Picks the model tier per agent from the request's complexity (model_router), and
+    # prefetches the schema and likely queries while the plan is written (speculation)
+    before_agent_callback=[route_request, start_speculation],
+    before_model_callback=apply_model_route,
+    after_agent_callback=log_routed_latency,
+    # Large outputs are exchanged by handle instead of being copied into every turn, see artifacts
+    before_tool_callback=resolve_tool_arguments,
+    after_tool_callback=[record_tool_result, store_large_output],
     generate_content_config=types.GenerateContentConfig(
         temperature=0.1,
         max_output_tokens=8192,
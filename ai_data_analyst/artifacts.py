@@ -0,0 +1,123 @@
+import logging
+import re
+from collections.abc import Mapping
+from typing import Any, Optional
+
+from google.adk.tools import BaseTool, ToolContext
+
+# Tool outputs at least this long are stored in session state and replaced by a handle
+ARTIFACT_MIN_CHARS = 1500
+
+# Characters of a stored output shown to the orchestrator next to its handle
+ARTIFACT_PREVIEW_CHARS = 300
+
+# Stored outputs kept per session; older ones are cleared as new ones are stored
+MAX_ARTIFACTS = 50
+
+# The orchestrator reads the plan and returns the report verbatim, so their outputs stay inline
+INLINE_TOOLS = frozenset({"planner_agent", "narrative_agent_tool"})
+
+# Session state keys of the artifact counter and of the stored handles, oldest first
+ARTIFACT_COUNT_KEY = "artifact_count"
+ARTIFACT_INDEX_KEY = "artifact_handles"
+
+# Key of the handle in a replaced tool response
+HANDLE_FIELD = "artifact"
+
+HANDLE_PATTERN = re.compile(r"artifact://[\w-]+/\d+")
+
+logger = logging.getLogger(__name__)
+
+
+def lookup(handle: str, state: Mapping[str, Any]) -> Optional[str]:
+    """Returns the output stored under `handle`, or None if it is unknown or was cleared."""
+    # Handles are used as state keys directly
+    value = state.get(handle)
+    return value if isinstance(value, str) else None
+
+
+def resolve_handles(value: Any, state: Mapping[str, Any]) -> Any:
+    """
+    Replaces the artifact handles in a string, or in the strings nested in a dict or list,
+    with the outputs they refer to. Unknown handles are left as they are.
+    """
+    if isinstance(value, str):
+        def replace(match: re.Match) -> str:
+            stored = lookup(match.group(0), state)
+            if stored is None:
+                logger.warning("Artifact %s not found in session state", match.group(0))
+                return match.group(0)
+            return stored
+        return HANDLE_PATTERN.sub(replace, value)
+    if isinstance(value, dict):
+        return {key: resolve_handles(item, state) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_handles(item, state) for item in value]
+    return value
+
+
+def _contains_handle(value: Any) -> bool:
+    if isinstance(value, str):
+        return HANDLE_PATTERN.search(value) is not None
+    if isinstance(value, dict):
+        return any(_contains_handle(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_contains_handle(item) for item in value)
+    return False
+
+
+def store(tool_context: ToolContext, step: str, text: str) -> str:
+    """Stores a tool output in session state and returns its handle."""
+    state = tool_context.state
+    count = (state.get(ARTIFACT_COUNT_KEY) or 0) + 1
+    handle = f"artifact://{step}/{count}"
+    handles = list(state.get(ARTIFACT_INDEX_KEY) or []) + [handle]
+    # State keys cannot be removed through an event, so old outputs are cleared instead
+    for expired in handles[:-MAX_ARTIFACTS]:
+        state[expired] = None
+    state[handle] = text
+    state[ARTIFACT_COUNT_KEY] = count
+    state[ARTIFACT_INDEX_KEY] = handles[-MAX_ARTIFACTS:]
+    return handle
+
+
+async def resolve_tool_arguments(tool: BaseTool, args: dict[str, Any], tool_context: ToolContext) -> Optional[dict]:
+    """
+    Orchestrator before_tool_callback: calls the tool with the artifact handles in its
+    arguments replaced by the outputs they refer to.
+
+    The arguments are part of the orchestrator's history, so they are not changed in
+    place; the tool is called here with resolved copies instead.
+    """
+    if not _contains_handle(args):
+        return None
+    result = await tool.run_async(args=resolve_handles(args, tool_context.state), tool_context=tool_context)
+    # The same wrapping the runner applies to non-dict results
+    return result if isinstance(result, dict) else {"result": result}
+
+
+def store_large_output(
+        tool: BaseTool, args: dict[str, Any], tool_context: ToolContext, tool_response: Any
+) -> Optional[dict]:
+    """
+    Orchestrator after_tool_callback: replaces a large output with a handle and a preview.
+
+    The output is kept in session state, where later tool calls resolve the handle, so
+    each dataset reaches the orchestrator's prompt once as a preview instead of in full
+    on every turn.
+    """
+    if tool.name in INLINE_TOOLS:
+        return None
+    text = tool_response.get("result") if isinstance(tool_response, dict) else tool_response
+    if not isinstance(text, str) or len(text) < ARTIFACT_MIN_CHARS:
+        return None
+    handle = store(tool_context, tool.name, text)
+    logger.info("Stored %d characters of %s output as %s", len(text), tool.name, handle)
+    preview = text[:ARTIFACT_PREVIEW_CHARS]
+    return {
+        "result": (
+            f"Output stored as {handle} ({len(text)} characters). Write {handle} in a request to pass "
+            f"this output to another agent. Preview:\n{preview}..."
+        ),
+        HANDLE_FIELD: handle,
+    }
@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.runners import InMemoryRunner
+
+from . import event_stream, llm_scheduler, tracing
+from .render_cache import ChartSegment, parse_message_content
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = "ai_data_analyst_batch"
+BATCH_USER_ID = "batch"
+DEFAULT_WORKERS = 4
+
+
+@dataclass
+class BatchQuestion:
+    id: str
+    question: str
+    data_context: str = ""
+
+
+@dataclass
+class BatchResult:
+    id: str
+    question: str
+    status: str  # "ok", "error" or "timeout"
+    seconds: float
+    # Seconds spent in each agent the orchestrator called
+    steps: dict[str, float] = field(default_factory=dict)
+    report: Optional[str] = None
+    charts: list[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"\W+", "_", text.lower()).strip("_")[:40] or "question"
+
+
+def load_questions(path: str, data_context: str = "") -> list[BatchQuestion]:
+    """
+    Reads the questions of a batch from a text file (one question per line, "#" for
+    comments), a JSON list, or JSON lines. JSON entries are either questions or
+    objects with "question" and optionally "id" and "data_context".
+    """
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    if path.endswith(".jsonl"):
+        entries = [json.loads(line) for line in content.splitlines() if line.strip()]
+    elif path.endswith(".json"):
+        entries = json.loads(content)
+    else:
+        entries = [line.strip() for line in content.splitlines() if line.strip() and not line.startswith("#")]
+
+    questions = []
+    ids = set()
+    for number, entry in enumerate(entries, start=1):
+        if isinstance(entry, str):
+            entry = {"question": entry}
+        question_id = entry.get("id") or f"{number:03d}_{_slug(entry['question'])}"
+        if question_id in ids:
+            raise ValueError(f"Duplicate question id: {question_id}")
+        ids.add(question_id)
+        questions.append(BatchQuestion(
+            id=question_id,
+            question=entry["question"],
+            data_context=entry.get("data_context", data_context),
+        ))
+    return questions
+
+
+async def _run_agent(agent: BaseAgent, question: BatchQuestion):
+    """Runs one question in its own session; returns the final answer and the seconds spent per step."""
+    runner = InMemoryRunner(agent=agent, app_name=APP_NAME)
+    session = await runner.session_service.create_session(app_name=APP_NAME, user_id=BATCH_USER_ID)
+    answer = ""
+    steps: dict[str, float] = {}
+    called_at: dict[str, float] = {}
+    message = event_stream.user_message(question.question, question.data_context)
+    async for event in runner.run_async(user_id=BATCH_USER_ID, session_id=session.id, new_message=message):
+        for call in event.get_function_calls():
+            called_at[call.id] = event.timestamp
+        for response in event.get_function_responses():
+            if response.id in called_at:
+                steps[response.name] = steps.get(response.name, 0.0) + event.timestamp - called_at.pop(response.id)
+        for update in event_stream.interpret_event(event):
+            if update.kind == "final_text":
+                answer += update.text
+    return answer, {step: round(seconds, 3) for step, seconds in steps.items()}
+
+
+def write_report(output_dir: str, question: BatchQuestion, answer: str):
+    """Writes the report as markdown and each of its charts as a Vega-Lite spec; returns the file names."""
+    report = f"{question.id}.md"
+    with open(os.path.join(output_dir, report), "w", encoding="utf-8") as f:
+        f.write(f"# {question.question}\n\n{answer}\n")
+    charts = []
+    for segment in parse_message_content(answer).segments:
+        if isinstance(segment, ChartSegment) and segment.chart_spec:
+            chart = f"{question.id}_chart{segment.index + 1}.vl.json"
+            with open(os.path.join(output_dir, chart), "w", encoding="utf-8") as f:
+                json.dump(segment.chart_spec, f, ensure_ascii=False, indent=2)
+            charts.append(chart)
+    return report, charts
+
+
+def _run_question(agent: BaseAgent, question: BatchQuestion, output_dir: str, timeout: Optional[float]) -> BatchResult:
+    started_at = time.perf_counter()
+    result = BatchResult(id=question.id, question=question.question, status="ok", seconds=0.0)
+    try:
+        # Interactive requests served by the same process go first; retries stop at the timeout
+        with llm_scheduler.priority(llm_scheduler.BATCH), \
+                llm_scheduler.deadline(timeout) if timeout else nullcontext(), \
+                tracing.request_span(question.question, session_id=f"batch-{question.id}"):
+            answer, result.steps = asyncio.run(asyncio.wait_for(_run_agent(agent, question), timeout))
+        if not answer:
+            raise RuntimeError("The agents returned no answer.")
+        result.report, result.charts = write_report(output_dir, question, answer)
+    except (asyncio.TimeoutError, llm_scheduler.DeadlineExceeded):
+        result.status, result.error = "timeout", f"No answer within {timeout}s"
+    except Exception as e:
+        logger.exception("Question %s failed", question.id)
+        result.status, result.error = "error", str(e)
+    result.seconds = round(time.perf_counter() - started_at, 3)
+    return result
+
+
+def run_batch(
+        questions: list[BatchQuestion],
+        output_dir: str,
+        workers: int = DEFAULT_WORKERS,
+        timeout: Optional[float] = None,
+        agent: Optional[BaseAgent] = None,
+) -> list[BatchResult]:
+    """
+    Answers the questions with up to `workers` running at once, and writes the
+    reports, charts and a summary (summary.json, summary.csv) to `output_dir`.
+
+    Each question runs on its own thread and event loop, so one question's
+    database calls do not hold up the others. All of them share the process'
+    connection pool, schema and query caches, and the model call scheduler.
+    """
+    if agent is None:
+        from .agent import root_agent as agent
+    os.makedirs(output_dir, exist_ok=True)
+    done = 0
+    done_lock = threading.Lock()
+
+    def run(question: BatchQuestion) -> BatchResult:
+        nonlocal done
+        result = _run_question(agent, question, output_dir, timeout)
+        with done_lock:
+            done += 1
+            logger.info("[%d/%d] %s: %s in %.1fs", done, len(questions), question.id, result.status, result.seconds)
+        return result
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        results = list(executor.map(run, questions))
+    elapsed = time.perf_counter() - started_at
+
+    summary = {
+        "questions": len(results),
+        "succeeded": sum(1 for result in results if result.status == "ok"),
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "questions_per_minute": round(len(results) / elapsed * 60, 2) if elapsed else None,
+        "results": [asdict(result) for result in results],
+    }
+    with open(os.path.join(output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(output_dir, "summary.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "status", "seconds", "report", "charts", "error", "question"])
+        for result in results:
+            writer.writerow([
+                result.id, result.status, result.seconds, result.report or "",
+                " ".join(result.charts), result.error or "", result.question,
+            ])
+    return results
+
+
+def _use_connection(name: str) -> None:
+    """Points the database tools at a connection saved in the app, as selecting it in the sidebar does."""
+    from . import config_manager
+
+    config = config_manager.get_config_by_name(name)
+    if not config:
+        raise SystemExit(f"No saved connection named '{name}'.")
+    os.environ["POSTGRES_HOST"] = config["db_host"]
+    os.environ["POSTGRES_PORT"] = str(config["db_port"])
+    os.environ["POSTGRES_DB"] = config["db_name"]
+    os.environ["POSTGRES_USER"] = config["db_user"]
+    os.environ["POSTGRES_PASSWORD"] = config["db_password"]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m ai_data_analyst.batch",
+        description="Answers a file of questions without the chat, writing a report per question.",
+    )
+    parser.add_argument("questions", help="A .txt file (one question per line), .json list or .jsonl file")
+    parser.add_argument("-o", "--output-dir", help="Where to write the reports (default: batch_output/<time>)")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS, help="Questions answered at once")
+    parser.add_argument("--timeout", type=float, help="Seconds allowed per question")
+    parser.add_argument("--data-context", default="", help="Context about the data, as in the connection settings")
+    parser.add_argument("--connection", help="Use this connection saved in the app instead of the POSTGRES_* settings")
+    args = parser.parse_args(argv)
+
+    if args.connection:
+        _use_connection(args.connection)
+    questions = load_questions(args.questions, data_context=args.data_context)
+    output_dir = args.output_dir or os.path.join(
+        "batch_output", f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    )
+    results = run_batch(questions, output_dir, workers=args.workers, timeout=args.timeout)
+    failed = [result for result in results if result.status != "ok"]
+    print(f"{len(results) - len(failed)}/{len(results)} questions answered; reports in {output_dir}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# Chart blocks in assistant messages, with the same fences the renderer looks for
+CHART_BODY_PATTERN = re.compile(r'```(?:json|vega-lite)\n(.*?)\n```', re.DOTALL)
+
+# Start of an inline Vega-Lite dataset ("values": [...])
+VALUES_PATTERN = re.compile(r'"values"\s*:\s*(?=\[)')
+
+# Assistant messages shorter than this are stored as plain text
+PACK_MIN_CHARS = 4096
+
+# Chart bodies and datasets shorter than this stay inline in the message
+BLOB_MIN_CHARS = 1024
+
+COMPRESSION_LEVEL = 6
+
+# Bound for the process-wide cache of resolved blob texts
+MAX_CACHED_BLOB_BYTES = 32 * 1024 * 1024
+
+# Placeholder for a content-addressed block. Model output never contains NUL
+# characters, and messages that do are not packed.
+_REF = "\x00{}\x00"
+_REF_PATTERN = re.compile("\x00([0-9a-f]{32})\x00")
+
+# Shown instead of a block whose blob is missing from the database
+MISSING_BLOB_TEXT = "[missing content: {}]"
+
+_decoder = json.JSONDecoder()
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PackedMessage:
+    """A message split into a compressed skeleton and the content-addressed blocks it references."""
+    preview: str  # Text before the first chart block, kept readable in chat_history.content
+    data: bytes  # zlib-compressed skeleton with placeholders for the blocks
+    blobs: dict[str, str]  # blob key -> text, for every block referenced directly or by another block
+
+
+def blob_key(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def compress(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+
+def should_pack(role: str, content: str) -> bool:
+    """Only large assistant messages (reports with embedded charts) are packed."""
+    return role == "assistant" and len(content) >= PACK_MIN_CHARS and "\x00" not in content
+
+
+def search_text(content: str) -> str:
+    """The text indexed for full-text search: the message without its chart blocks."""
+    return CHART_BODY_PATTERN.sub(" ", content)
+
+
+def pack_message(content: str, preview_chars: int) -> PackedMessage:
+    """
+    Splits a message into a skeleton and content-addressed blocks.
+
+    Each large chart block body becomes a blob, and each large `"values"` array
+    inside it becomes a blob of its own, so the same dataset is stored once even
+    when it is plotted by different specs. Blocks are replaced verbatim, so
+    unpacking restores the exact original text.
+
+    Args:
+        content: The message text.
+        preview_chars: Length of the plain-text prefix kept for previews.
+    """
+    blobs: dict[str, str] = {}
+
+    def store(text: str) -> str:
+        key = blob_key(text)
+        blobs[key] = text
+        return _REF.format(key)
+
+    def replace_values(body: str) -> str:
+        parts = []
+        position = 0
+        for match in VALUES_PATTERN.finditer(body):
+            start = match.end()
+            if start < position:
+                continue  # Nested in a dataset that was already replaced
+            try:
+                _, end = _decoder.raw_decode(body, start)
+            except ValueError:
+                continue
+            if end - start >= BLOB_MIN_CHARS:
+                parts.append(body[position:start])
+                parts.append(store(body[start:end]))
+                position = end
+        parts.append(body[position:])
+        return "".join(parts)
+
+    def replace_chart(match: re.Match) -> str:
+        body = match.group(1)
+        if len(body) < BLOB_MIN_CHARS:
+            return match.group(0)
+        offset = match.start(0)
+        block = match.group(0)
+        return block[:match.start(1) - offset] + store(replace_values(body)) + block[match.end(1) - offset:]
+
+    skeleton = CHART_BODY_PATTERN.sub(replace_chart, content)
+    preview = skeleton.split("\x00", 1)[0][:preview_chars]
+    return PackedMessage(preview=preview, data=compress(skeleton), blobs=blobs)
+
+
+def unpack_message(
+        data: bytes,
+        fetch_blobs: Callable[[list[str]], dict[str, bytes]],
+        cache: Optional["BlobCache"] = None,
+) -> str:
+    """
+    Restores a packed message.
+
+    Args:
+        data: The compressed skeleton.
+        fetch_blobs: Returns the compressed data of the requested blob keys.
+        cache: Cache of resolved blob texts. Defaults to the process-wide cache.
+    """
+    return _resolve(decompress(data), fetch_blobs, blob_cache if cache is None else cache)
+
+
+def _resolve(text: str, fetch_blobs: Callable[[list[str]], dict[str, bytes]], cache: "BlobCache") -> str:
+    """Replaces the placeholders in `text`, resolving the blocks nested in fetched blobs first."""
+    keys = set(_REF_PATTERN.findall(text))
+    if not keys:
+        return text
+    resolved = {}
+    missing = []
+    for key in keys:
+        cached = cache.get(key)
+        if cached is None:
+            missing.append(key)
+        else:
+            resolved[key] = cached
+    if missing:
+        for key, blob in fetch_blobs(missing).items():
+            # Charts reference datasets; caching the resolved chart skips that step next time
+            resolved[key] = _resolve(decompress(blob), fetch_blobs, cache)
+            cache.put(key, resolved[key])
+        lost = [key for key in missing if key not in resolved]
+        if lost:
+            # E.g. an interrupted write or a manual cleanup; the rest of the message is still shown
+            logger.error("Chat blobs missing from the database: %s", ", ".join(sorted(lost)))
+            for key in lost:
+                resolved[key] = MISSING_BLOB_TEXT.format(key)
+    return _REF_PATTERN.sub(lambda match: resolved[match.group(1)], text)
+
+
+class BlobCache:
+    """
+    A thread-safe LRU cache of resolved blob texts, bounded by size.
+
+    Blobs are content-addressed and never change, so entries never go stale;
+    a repeated dataset is decompressed once per process.
+    """
+
+    def __init__(self, max_bytes: int = MAX_CACHED_BLOB_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            return text
+
+    def put(self, key: str, text: str) -> None:
+        if len(text) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = text
+            self._nbytes += len(text)
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+blob_cache = BlobCache()
@@ -1,7 +1,20 @@
-import sqlite3
+import atexit
+import contextlib
+import logging
 import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import weakref
+from contextlib import contextmanager
+
 from cryptography.fernet import Fernet, InvalidToken
 
+from . import chat_storage
+
 # --- Key Management ---
 # For a real production app, this key should be managed securely,
 # e.g., via a secret manager service (AWS Secrets Manager, GCP Secret Manager, HashiCorp Vault).
@@ -20,23 +33,177 @@ else:
         ENCRYPTION_KEY = Fernet.generate_key()
         with open(KEY_FILE, "wb") as f:
             f.write(ENCRYPTION_KEY)
-        print(f"Generated new encryption key and saved to {KEY_FILE}. Add this file to .gitignore.")
-        print("For production, set the CONFIG_ENCRYPTION_KEY environment variable instead.")
+        logging.getLogger(__name__).warning(
+            "Generated new encryption key and saved to %s. Add this file to .gitignore. "
+            "For production, set the CONFIG_ENCRYPTION_KEY environment variable instead.", KEY_FILE
+        )
 
 fernet = Fernet(ENCRYPTION_KEY)
 
 # --- Database Management ---
 DB_FILE = "configs.db"
 
+# Pragmas applied once to every new connection. WAL lets readers work while a
+# session is writing, and synchronous=NORMAL is safe in WAL mode (a power loss
+# may drop the last commits but cannot corrupt the database).
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", 5000),  # milliseconds to wait for a lock held by another session
+    ("cache_size", -16000),  # negative values are in KiB: a 16 MB page cache
+    ("mmap_size", 64 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+)
+
+# Operations slower than this are logged as warnings
+SLOW_OPERATION_MS = 200
+
+logger = logging.getLogger(__name__)
+
+
+class _ThreadConnections:
+    """A thread's connections by database file. They are closed once the thread has ended."""
+
+    def __init__(self, manager):
+        self.by_file = {}
+        # Thread-local data is released when its thread ends, which runs the finalizer
+        weakref.finalize(self, manager._close, self.by_file)
+
+
+class ConnectionManager:
+    """
+    Reuses one tuned SQLite connection per thread and database file.
+
+    Streamlit runs each session in its own thread, so per-thread connections
+    avoid sharing a connection across threads while still skipping the
+    connect/pragma cost on every call. A thread's connections are closed when
+    the thread ends (Streamlit reruns, agent runs and heartbeats all use
+    short-lived threads). Latency is recorded per operation.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._metrics = {}
+        self.connections_opened = 0
+
+    def get(self, db_file):
+        """Returns this thread's connection to `db_file`, opening it on first use."""
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = _ThreadConnections(self)
+        conn = connections.by_file.get(db_file)
+        if conn is None:
+            conn = self._open(db_file)
+            connections.by_file[db_file] = conn
+        return conn
+
+    def _open(self, db_file):
+        # check_same_thread=False only so connections can be closed by another thread,
+        # on shutdown or once their own thread has ended; each is used by a single thread.
+        conn = sqlite3.connect(db_file, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in SQLITE_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        with self._lock:
+            self._connections.add(conn)
+            self.connections_opened += 1
+        return conn
+
+    def _close(self, by_file):
+        with self._lock:
+            self._connections.difference_update(by_file.values())
+        for conn in by_file.values():
+            with contextlib.suppress(sqlite3.Error):
+                conn.close()
+        by_file.clear()
+
+    @property
+    def open_connections(self):
+        """Number of connections currently open, across threads."""
+        with self._lock:
+            return len(self._connections)
+
+    @contextmanager
+    def connection(self, operation, db_file=None):
+        """
+        Yields this thread's connection and records how long `operation` took.
+        A transaction left open by a failed operation is rolled back.
+        """
+        conn = self.get(db_file or DB_FILE)
+        start = time.perf_counter()
+        try:
+            yield conn
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._record(operation, (time.perf_counter() - start) * 1000)
+
+    def _record(self, operation, elapsed_ms):
+        with self._lock:
+            stats = self._metrics.setdefault(operation, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if elapsed_ms > SLOW_OPERATION_MS:
+            logger.warning("Slow config database operation '%s': %.1f ms", operation, elapsed_ms)
+
+    def metrics(self):
+        """Returns latency statistics per operation."""
+        with self._lock:
+            return {
+                operation: {**stats, "avg_ms": stats["total_ms"] / stats["count"]}
+                for operation, stats in self._metrics.items()
+            }
+
+    def reset_metrics(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def close_all(self):
+        """Closes every connection opened by any thread."""
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            with contextlib.suppress(sqlite3.Error):
+                conn.close()
+        # A new thread-local dict makes every thread reopen its connections
+        self._local = threading.local()
+
+
+connection_manager = ConnectionManager()
+
+
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """
+    Returns the current thread's persistent connection to the SQLite database.
+    The connection is shared by later calls on this thread and must not be closed.
+    """
+    return connection_manager.get(DB_FILE)
+
+def get_db_metrics():
+    """Returns latency statistics (count, total/avg/max ms) per config database operation."""
+    return connection_manager.metrics()
+
+def reset_db_metrics():
+    """Clears the recorded latency statistics."""
+    connection_manager.reset_metrics()
+
+def close_all_connections():
+    """Closes all pooled connections, e.g. on shutdown or when switching database files."""
+    connection_manager.close_all()
 
 def initialize_db():
     """Initializes the database and creates the configurations table if it doesn't exist."""
-    conn = get_db_connection()
+    with connection_manager.connection("initialize_db") as conn:
+        _create_tables(conn)
+        conn.commit()
+
+def _create_tables(conn):
+    """Creates the configuration and chat history tables if they don't exist."""
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS configurations (
@@ -51,6 +218,14 @@ def initialize_db():
             data_context TEXT
         )
     """)
+    # Bumped with every configuration write, so each process can tell its cached configs are stale
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS config_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO config_generation (id, generation) VALUES (1, 0)")
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS chat_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -60,8 +235,267 @@ def initialize_db():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    conn.commit()
-    conn.close()
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_session_timestamp ON chat_history (session_id, timestamp)"
+    )
+    _migrate_chat_history_columns(cursor)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_blobs (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL
+        )
+    """)
+    _create_chat_sessions_table(cursor)
+    _create_search_index(cursor)
+
+def _migrate_chat_history_columns(cursor):
+    """
+    Adds the columns introduced after chat_history was created. For a packed
+    message, `content` only holds its plain-text preview and the compressed
+    skeleton is in `packed_content`; `blob_refs` lists the chat_blobs rows it
+    references.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(chat_history)").fetchall()}
+    added_columns = (("content_encoding", "TEXT"), ("packed_content", "BLOB"), ("blob_refs", "TEXT"))
+    for column, column_type in added_columns:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE chat_history ADD COLUMN {column} {column_type}")
+
+def _create_chat_sessions_table(cursor):
+    """
+    Creates the chat_sessions summary table, kept up to date by a trigger on chat_history,
+    and backfills it from existing history the first time it is created.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            session_id TEXT PRIMARY KEY,
+            preview TEXT NOT NULL,
+            created_at DATETIME NOT NULL,
+            last_activity DATETIME NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_created_at ON chat_sessions (created_at, session_id)")
+    # The preview is taken from the session's first message. Every UI-created session
+    # starts with the user's prompt, so this is the first user message.
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_history_update_session AFTER INSERT ON chat_history
+        BEGIN
+            INSERT INTO chat_sessions (session_id, preview, created_at, last_activity, message_count)
+            VALUES (NEW.session_id, substr(NEW.content, 1, {PREVIEW_STORED_CHARS}), NEW.timestamp, NEW.timestamp, 1)
+            ON CONFLICT (session_id) DO UPDATE SET
+                preview = CASE WHEN excluded.created_at < chat_sessions.created_at
+                               THEN excluded.preview ELSE chat_sessions.preview END,
+                created_at = MIN(chat_sessions.created_at, excluded.created_at),
+                last_activity = MAX(chat_sessions.last_activity, excluded.last_activity),
+                message_count = chat_sessions.message_count + 1;
+        END
+    """)
+    needs_backfill = cursor.execute(
+        "SELECT NOT EXISTS (SELECT 1 FROM chat_sessions) AND EXISTS (SELECT 1 FROM chat_history)"
+    ).fetchone()[0]
+    if needs_backfill:
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO chat_sessions (session_id, preview, created_at, last_activity, message_count)
+            SELECT session_id, substr(content, 1, {PREVIEW_STORED_CHARS}), timestamp, last_activity, message_count
+            FROM (
+                SELECT
+                    session_id, content, timestamp,
+                    ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY timestamp, id) AS position,
+                    MAX(timestamp) OVER (PARTITION BY session_id) AS last_activity,
+                    COUNT(*) OVER (PARTITION BY session_id) AS message_count
+                FROM chat_history
+            )
+            WHERE position = 1
+        """)
+
+# --- Configuration Cache ---
+
+# Seconds a decrypted password is kept in memory. After that the cached
+# encrypted token is decrypted again, without querying the database.
+CONFIG_PASSWORD_TTL = 60
+
+
+class ConfigCache:
+    """
+    In-process cache of parsed configurations, shared by every Streamlit session.
+
+    Writes go through add_config/update_config/update_schema_and_context/
+    delete_config, which bump the generation stored in the database in the same
+    transaction. Readers check the stored generation before using the cache and
+    drop the entries read at another one, so a write made by another process
+    (a worker, the agent service) is seen at once. A value read from the
+    database is only stored if no write happened meanwhile, so a reader can
+    never repopulate the cache with a stale row.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generations = {}  # db_file -> stored generation the entries were read at
+        self._configs = {}  # (db_file, name) -> config row without the decrypted password, or None
+        self._passwords = {}  # (db_file, name) -> (password, expires_at)
+        self._names = {}  # db_file -> sorted config names
+        self.hits = 0
+        self.misses = 0
+
+    def validate(self, db_file, generation):
+        """Drops the entries of `db_file` unless they were read at the stored `generation`."""
+        with self._lock:
+            if self._generations.get(db_file) == generation:
+                return
+            self._generations[db_file] = generation
+            for key in [key for key in self._configs if key[0] == db_file]:
+                del self._configs[key]
+                self._passwords.pop(key, None)
+            self._names.pop(db_file, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._generations.clear()
+            self._configs.clear()
+            self._passwords.clear()
+            self._names.clear()
+
+    def get_config(self, db_file, name):
+        """Returns (found, config). `config` is a copy including the decrypted password, or None."""
+        key = (db_file, name)
+        with self._lock:
+            if key not in self._configs:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            config = self._configs[key]
+            if config is None:
+                return True, None
+            password, expires_at = self._passwords.get(key, (None, 0.0))
+            if time.monotonic() >= expires_at:
+                password = _decrypt(config["encrypted_password"])
+                self._passwords[key] = (password, time.monotonic() + CONFIG_PASSWORD_TTL)
+            return True, {**config, "db_password": password}
+
+    def put_config(self, db_file, name, config, generation):
+        """Stores a config read at `generation` (None for a missing config)."""
+        with self._lock:
+            if generation != self._generations.get(db_file):
+                return
+            key = (db_file, name)
+            if config is None:
+                self._configs[key] = None
+                return
+            config = dict(config)
+            password = config.pop("db_password")
+            self._configs[key] = config
+            self._passwords[key] = (password, time.monotonic() + CONFIG_PASSWORD_TTL)
+
+    def get_names(self, db_file):
+        with self._lock:
+            names = self._names.get(db_file)
+            if names is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return list(names)
+
+    def put_names(self, db_file, names, generation):
+        with self._lock:
+            if generation == self._generations.get(db_file):
+                self._names[db_file] = list(names)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "configs": len(self._configs),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+config_cache = ConfigCache()
+
+
+def _config_generation():
+    """The stored configuration generation, after dropping cached configs read at an older one."""
+    with connection_manager.connection("config_generation") as conn:
+        generation = conn.execute("SELECT generation FROM config_generation WHERE id = 1").fetchone()[0]
+    config_cache.validate(DB_FILE, generation)
+    return generation
+
+def _bump_config_generation(conn):
+    """Marks every process' cached configs stale; part of the caller's transaction."""
+    conn.execute("UPDATE config_generation SET generation = generation + 1 WHERE id = 1")
+
+def get_config_cache_stats():
+    """Returns the stored configuration generation and the cache's size and hit/miss counts."""
+    return {"generation": _config_generation(), **config_cache.stats()}
+
+def invalidate_config_cache():
+    """Drops every cached configuration, e.g. after editing configs.db outside this module."""
+    config_cache.invalidate()
+
+def _create_search_index(cursor):
+    """
+    Creates the chat_history_fts full-text index. It is contentless: messages are
+    tokenized but their text is not stored a second time next to the compressed
+    content, so this module adds each message to the index when inserting it and
+    removes it when deleting it. The first time, existing messages are indexed.
+    Without FTS5 in this SQLite build the index is skipped and search falls back
+    to LIKE over the stored content.
+    """
+    existing = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'chat_history_fts'").fetchone()
+    if existing and "content=''" in existing["sql"]:
+        return
+    if existing:
+        # The index of earlier versions read a plain-text copy of each message kept in chat_history
+        for trigger in ("insert", "delete", "update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS chat_history_fts_{trigger}")
+        cursor.execute("DROP TABLE chat_history_fts")
+    _drop_search_text_column(cursor)
+    try:
+        # remove_diacritics lets "avaliacao" match "avaliação"
+        cursor.execute("""
+            CREATE VIRTUAL TABLE chat_history_fts USING fts5(
+                search_text, content='',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        logger.warning("SQLite has no FTS5 support; chat search falls back to LIKE queries")
+        return
+    _index_existing_messages(cursor.connection)
+
+def _drop_search_text_column(cursor):
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(chat_history)").fetchall()}
+    if "search_text" not in columns:
+        return
+    try:
+        cursor.execute("ALTER TABLE chat_history DROP COLUMN search_text")
+    except sqlite3.OperationalError:
+        # SQLite before 3.35 cannot drop columns; emptying it frees the space all the same
+        cursor.execute("UPDATE chat_history SET search_text = NULL")
+
+def _index_existing_messages(conn, batch_size=500):
+    """Adds the messages stored before the index existed to it."""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            """
+            SELECT id, content, content_encoding, packed_content FROM chat_history
+            WHERE id > ? ORDER BY id LIMIT ?
+            """,
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        conn.executemany(
+            "INSERT INTO chat_history_fts (rowid, search_text) VALUES (?, ?)",
+            [(row["id"], chat_storage.search_text(_message_content(conn, row))) for row in rows]
+        )
+        last_id = rows[-1]["id"]
+
+def _has_search_index(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chat_history_fts'").fetchone() is not None
 
 def _encrypt(password: str) -> str:
     """Encrypts a password."""
@@ -79,8 +513,7 @@ def _decrypt(encrypted_password: str) -> str:
 
 def add_config(name, db_host, db_port, db_name, db_user, db_password):
     """Adds a new database configuration."""
-    conn = get_db_connection()
-    try:
+    with connection_manager.connection("add_config") as conn:
         conn.execute(
             """
             INSERT INTO configurations (name, db_host, db_port, db_name, db_user, encrypted_password)
@@ -88,107 +521,673 @@ def add_config(name, db_host, db_port, db_name, db_user, db_password):
             """,
             (name, db_host, db_port, db_name, db_user, _encrypt(db_password))
         )
+        _bump_config_generation(conn)
         conn.commit()
-    finally:
-        conn.close()
 
 # --- Chat History Management ---
 
+# Characters of a session's first message shown in the sidebar preview, and the
+# (larger) prefix kept in the chat_sessions summary table.
+PREVIEW_CHARS = 50
+PREVIEW_STORED_CHARS = 200
+
+# Default page sizes for paginated history and session lists
+CHAT_PAGE_SIZE = 20
+SESSION_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE = 10
+
+# Words of context around the match in search result snippets
+SEARCH_SNIPPET_TOKENS = 12
+
+# Only the most recent matches are ranked, which bounds the cost of queries
+# made of very common words
+SEARCH_MAX_CANDIDATES = 5000
+
+# Write-behind persistence: when enabled, add_chat_message only enqueues the row
+# and a background thread commits queued rows in batches.
+CHAT_WRITE_BEHIND = os.environ.get("CHAT_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+WRITE_BEHIND_BATCH_SIZE = 256
+WRITE_BEHIND_FLUSH_INTERVAL = 0.25  # seconds a queued row may wait for more rows
+WRITE_BEHIND_MAX_RETRIES = 5
+# Seconds between retries of rows whose batch could not be written; they stay queued meanwhile
+WRITE_BEHIND_RETRY_INTERVAL = 5.0
+# Seconds a read waits for queued rows to be committed before reading without them
+WRITE_BEHIND_READ_TIMEOUT = 5.0
+
 from datetime import datetime
 
+
+class ChatWriteBehind:
+    """
+    Background writer that batches chat_history inserts.
+
+    Rows are committed by a single thread in the order they were enqueued, so
+    messages of a session are always stored in the order they were added. A
+    batch is written with one executemany in one transaction when it reaches
+    `batch_size` rows or `flush_interval` seconds after its first row. Rows of
+    a batch that keeps failing are kept, ahead of newer rows, and retried.
+    """
+
+    _STOP = object()
+
+    def __init__(self, batch_size=WRITE_BEHIND_BATCH_SIZE, flush_interval=WRITE_BEHIND_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._condition = threading.Condition()
+        self._enqueued = 0
+        self._written = 0
+        self._thread = None
+        self._failed = []
+        self.last_error = None
+        self.failed_writes = 0
+        self.batches_written = 0
+
+    def start(self):
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+                self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self):
+        """Number of enqueued rows not committed yet."""
+        with self._condition:
+            return self._enqueued - self._written
+
+    def enqueue(self, row):
+        """Queues a (session_id, role, content, timestamp) row for insertion."""
+        with self._condition:
+            self._enqueued += 1
+            self._queue.put(row)
+
+    def flush(self, timeout=None):
+        """
+        Blocks until every row enqueued before this call is committed. Returns False
+        on timeout, or as soon as a write fails while these rows are still waiting.
+        """
+        if not self.running and self.pending:
+            logger.warning("Chat write-behind thread is not running; restarting it")
+            self.start()
+        with self._condition:
+            target, failures = self._enqueued, self.failed_writes
+            self._condition.wait_for(lambda: self._written >= target or self.failed_writes > failures, timeout)
+            return self._written >= target
+
+    def stop(self, timeout=None):
+        """Drains the queue and stops the writer thread."""
+        if not self.running:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=WRITE_BEHIND_RETRY_INTERVAL if self._failed else None)
+            except queue.Empty:
+                self._write([])
+                continue
+            if first is self._STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    row = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is self._STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            self._write(batch)
+        # Anything queued after the stop marker is still written
+        leftover = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not self._STOP:
+                leftover.append(row)
+        for start in range(0, len(leftover), self.batch_size):
+            self._write(leftover[start:start + self.batch_size])
+        if self._failed:
+            self._write([])
+        if self._failed:
+            logger.error("Stopping with %d chat messages that could not be written", len(self._failed))
+
+    def _write(self, batch):
+        """Writes the rows kept from failed batches, then `batch`, in one transaction."""
+        with self._condition:
+            rows, self._failed = self._failed + batch, []
+        error = None
+        for attempt in range(1, WRITE_BEHIND_MAX_RETRIES + 1):
+            try:
+                with connection_manager.connection("write_behind_batch") as conn:
+                    _insert_chat_messages(conn, rows)
+                    conn.commit()
+                self.batches_written += 1
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if attempt == WRITE_BEHIND_MAX_RETRIES:
+                    logger.exception(
+                        "Keeping %d chat messages queued after %d failed write attempts", len(rows), attempt
+                    )
+                else:
+                    logger.warning("Chat write-behind batch failed (attempt %d), retrying", attempt)
+                    time.sleep(0.05 * 2 ** attempt)
+        with self._condition:
+            if error is None:
+                self._written += len(rows)
+            else:
+                self._failed = rows
+                self.failed_writes += 1
+            self.last_error = error
+            self._condition.notify_all()
+
+
+chat_writer = ChatWriteBehind()
+
+
+def enable_write_behind():
+    """Makes add_chat_message enqueue messages for the background writer instead of committing them."""
+    global CHAT_WRITE_BEHIND
+    CHAT_WRITE_BEHIND = True
+    chat_writer.start()
+
+def disable_write_behind():
+    """Commits every queued message and goes back to synchronous inserts."""
+    global CHAT_WRITE_BEHIND
+    CHAT_WRITE_BEHIND = False
+    chat_writer.stop()
+
+def flush_chat_writes(timeout=WRITE_BEHIND_READ_TIMEOUT):
+    """
+    Waits until every queued chat message is committed. Returns False if they are
+    not (on timeout, or while writes fail), in which case reads miss those messages.
+    """
+    if chat_writer.pending == 0:
+        return True
+    if chat_writer.flush(timeout):
+        return True
+    logger.warning("Reading chat history without %d queued messages: %s", chat_writer.pending, chat_writer.last_error)
+    return False
+
+atexit.register(chat_writer.stop)
+
 def add_chat_message(session_id: str, role: str, content: str):
-    """Adds a chat message to the history, using the current time for the timestamp."""
-    conn = get_db_connection()
-    try:
-        # datetime.now() will be patched by freezegun during tests
-        current_time = datetime.now()
+    """
+    Adds a chat message to the history, using the current time for the timestamp.
+    Returns the stored message, including its id and timestamp. With write-behind
+    enabled the message is only queued and its id is None.
+    """
+    # datetime.now() will be patched by freezegun during tests
+    current_time = datetime.now()
+    # Same text representation sqlite3 stores for datetime values
+    message = {"id": None, "role": role, "content": content, "timestamp": current_time.isoformat(" ")}
+    if CHAT_WRITE_BEHIND:
+        chat_writer.start()
+        chat_writer.enqueue((session_id, role, content, current_time))
+        return message
+
+    with connection_manager.connection("add_chat_message") as conn:
+        message["id"] = _insert_chat_messages(conn, [(session_id, role, content, current_time)])
+        conn.commit()
+        return message
+
+def insert_chat_message(conn, session_id: str, role: str, content: str):
+    """
+    Adds a chat message within the caller's transaction, without write-behind,
+    so it is committed together with the caller's other changes. Returns its id.
+    """
+    return _insert_chat_messages(conn, [(session_id, role, content, datetime.now())])
+
+def _insert_chat_messages(conn, rows):
+    """
+    Inserts (session_id, role, content, timestamp) rows without committing, packing
+    large assistant messages and adding them to the search index. Returns the id
+    of the last inserted row.
+    """
+    indexed = []
+    message_id = None
+    for session_id, role, content, timestamp in rows:
+        params = (session_id, role, content, timestamp, None, None, None)
+        if chat_storage.should_pack(role, content):
+            packed = chat_storage.pack_message(content, PREVIEW_STORED_CHARS)
+            _store_blobs(conn, packed.blobs)
+            params = (
+                session_id, role, packed.preview, timestamp,
+                "zlib", packed.data, " ".join(sorted(packed.blobs)) or None
+            )
+        message_id = conn.execute(
+            """
+            INSERT INTO chat_history (
+                session_id, role, content, timestamp, content_encoding, packed_content, blob_refs
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            params
+        ).lastrowid
+        indexed.append((message_id, chat_storage.search_text(content)))
+    if _has_search_index(conn):
+        conn.executemany("INSERT INTO chat_history_fts (rowid, search_text) VALUES (?, ?)", indexed)
+    return message_id
+
+def _store_blobs(conn, blobs):
+    """Adds one reference to each blob, compressing and storing the ones not seen before."""
+    for key, text in blobs.items():
+        if conn.execute("UPDATE chat_blobs SET refcount = refcount + 1 WHERE hash = ?", (key,)).rowcount:
+            continue
         conn.execute(
-            "INSERT INTO chat_history (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
-            (session_id, role, content, current_time)
+            "INSERT INTO chat_blobs (hash, data, size, refcount) VALUES (?, ?, ?, 1)",
+            (key, chat_storage.compress(text), len(text))
         )
-        conn.commit()
-    finally:
-        conn.close()
+
+def _fetch_blobs(conn, keys):
+    """Returns the compressed data of the given blobs."""
+    placeholders = ", ".join("?" * len(keys))
+    rows = conn.execute(f"SELECT hash, data FROM chat_blobs WHERE hash IN ({placeholders})", list(keys))
+    return {row["hash"]: row["data"] for row in rows}
+
+def _message_content(conn, row):
+    """Returns the full content of a chat_history row, unpacking it if needed."""
+    if row["content_encoding"] is None:
+        return row["content"]
+    return chat_storage.unpack_message(row["packed_content"], lambda keys: _fetch_blobs(conn, keys))
 
 def get_chat_history(session_id: str):
     """Retrieves chat history for a given session_id, ordered by timestamp."""
-    conn = get_db_connection()
-    try:
+    flush_chat_writes()
+    with connection_manager.connection("get_chat_history") as conn:
         messages = conn.execute(
-            "SELECT role, content, timestamp FROM chat_history WHERE session_id = ? ORDER BY timestamp ASC",
+            """
+            SELECT role, content, timestamp, content_encoding, packed_content FROM chat_history
+            WHERE session_id = ? ORDER BY timestamp ASC
+            """,
             (session_id,)
         ).fetchall()
         # Convert Row objects to dictionaries for easier use in Streamlit
-        return [{"role": msg["role"], "content": msg["content"], "timestamp": msg["timestamp"]} for msg in messages]
-    finally:
-        conn.close()
+        return [
+            {"role": msg["role"], "content": _message_content(conn, msg), "timestamp": msg["timestamp"]}
+            for msg in messages
+        ]
 
-def get_chat_sessions_preview():
+def message_cursor(message):
+    """Returns the keyset cursor (timestamp, id) of a message returned by this module."""
+    return (message["timestamp"], message["id"])
+
+def get_chat_history_page(session_id: str, limit: int = CHAT_PAGE_SIZE, before=None):
+    """
+    Retrieves one page of a session's history using keyset pagination on (timestamp, id).
+
+    Args:
+        session_id: The chat session.
+        limit: Maximum number of messages in the page.
+        before: Cursor of the oldest message already loaded; only older messages are returned.
+            None returns the most recent messages.
+
+    Returns:
+        A tuple (messages, next_cursor). Messages are in chronological order and
+        next_cursor is the cursor to pass as `before` for the previous page, or
+        None if there are no older messages.
     """
-    Retrieves a list of all unique chat sessions, with a preview (first user message content and timestamp).
+    flush_chat_writes()
+    with connection_manager.connection("get_chat_history_page") as conn:
+        if before is None:
+            rows = conn.execute(
+                """
+                SELECT id, role, content, timestamp, content_encoding, packed_content FROM chat_history
+                WHERE session_id = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+                """,
+                (session_id, limit + 1)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                """
+                SELECT id, role, content, timestamp, content_encoding, packed_content FROM chat_history
+                WHERE session_id = ? AND (timestamp, id) < (?, ?)
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+                """,
+                # A queued message has no id yet: id 0 pages back from strictly older timestamps
+                (session_id, before[0], 0 if before[1] is None else before[1], limit + 1)
+            ).fetchall()
+
+        has_older = len(rows) > limit
+        messages = [
+            {
+                "id": row["id"], "role": row["role"],
+                "content": _message_content(conn, row), "timestamp": row["timestamp"],
+            }
+            for row in reversed(rows[:limit])
+        ]
+        next_cursor = message_cursor(messages[0]) if has_older else None
+        return messages, next_cursor
+
+def get_chat_sessions_preview(limit=None, offset=0):
+    """
+    Retrieves chat sessions with a preview (first message content and timestamp),
+    read from the chat_sessions summary table.
     Sessions are ordered by the timestamp of their first message, descending (newest first).
+
+    Args:
+        limit: Maximum number of sessions to return. None returns every session.
+        offset: Number of sessions to skip, for paginated retrieval.
     """
-    conn = get_db_connection()
-    try:
-        # Get the first message (user or assistant) for each session_id
-        # and order sessions by the timestamp of that first message.
-        sessions = conn.execute("""
-            SELECT
-                ch.session_id,
-                ch.content AS first_message_content,
-                ch.timestamp AS first_message_timestamp,
-                ch.role AS first_message_role
-            FROM chat_history ch
-            INNER JOIN (
-                SELECT session_id, MIN(timestamp) AS min_ts
-                FROM chat_history
-                GROUP BY session_id
-            ) AS first_msgs ON ch.session_id = first_msgs.session_id AND ch.timestamp = first_msgs.min_ts
-            ORDER BY ch.timestamp DESC
-        """).fetchall()
+    flush_chat_writes()
+    with connection_manager.connection("get_chat_sessions_preview") as conn:
+        sessions = conn.execute(
+            """
+            SELECT session_id, preview, created_at, last_activity, message_count
+            FROM chat_sessions
+            ORDER BY created_at DESC, session_id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (-1 if limit is None else limit, offset)
+        ).fetchall()
+
+        return [_session_preview(s) for s in sessions]
+
+def get_chat_sessions_page(limit: int = SESSION_PAGE_SIZE, before=None):
+    """
+    Retrieves one page of session previews using keyset pagination on (created_at, session_id).
+
+    Args:
+        limit: Maximum number of sessions in the page.
+        before: Cursor returned by the previous call; only older sessions are returned.
+            None returns the most recent sessions.
+
+    Returns:
+        A tuple (sessions, next_cursor), newest first. next_cursor is None when
+        there are no older sessions.
+    """
+    flush_chat_writes()
+    with connection_manager.connection("get_chat_sessions_page") as conn:
+        if before is None:
+            rows = conn.execute(
+                """
+                SELECT session_id, preview, created_at, last_activity, message_count
+                FROM chat_sessions
+                ORDER BY created_at DESC, session_id DESC
+                LIMIT ?
+                """,
+                (limit + 1,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                """
+                SELECT session_id, preview, created_at, last_activity, message_count
+                FROM chat_sessions
+                WHERE (created_at, session_id) < (?, ?)
+                ORDER BY created_at DESC, session_id DESC
+                LIMIT ?
+                """,
+                (before[0], before[1], limit + 1)
+            ).fetchall()
+
+        sessions = [_session_preview(row) for row in rows[:limit]]
+        next_cursor = (sessions[-1]["timestamp"], sessions[-1]["session_id"]) if len(rows) > limit else None
+        return sessions, next_cursor
+
+def _session_preview(row):
+    return {
+        "session_id": row["session_id"],
+        "preview_content": _preview(row["preview"]),
+        "timestamp": row["created_at"],
+        "last_activity": row["last_activity"],
+        "message_count": row["message_count"],
+    }
 
-        # For preview, we prefer the first *user* message. If the absolute first message is assistant,
-        # we might need a more complex query or post-processing if a user prompt is essential for context.
-        # For now, let's keep it simple and use the absolute first message.
-        # A more sophisticated approach might be to fetch the first 'user' role message.
+def _preview(content):
+    """Truncates content to the preview length shown in the sidebar."""
+    return content[:PREVIEW_CHARS] + "..." if len(content) > PREVIEW_CHARS else content
 
+def search_chat_history(query: str, limit: int = SEARCH_PAGE_SIZE, offset: int = 0):
+    """
+    Full-text search over the chat history (prompts and report text, not chart JSON).
+
+    Every word of the query must match, ignoring accents; the last one may be
+    a prefix. Results are ranked by relevance (bm25) among the
+    SEARCH_MAX_CANDIDATES most recent matches.
+
+    Args:
+        query: Free text typed by the user. FTS5 syntax is not interpreted.
+        limit: Maximum number of results.
+        offset: Number of results to skip, for paginated retrieval.
+
+    Returns:
+        A list of dicts with the message id, session_id, role, timestamp and a
+        snippet with the matched words in bold.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return []
+    flush_chat_writes()
+    with connection_manager.connection("search_chat_history") as conn:
+        if not _has_search_index(conn):
+            # No FTS5 in this SQLite build
+            return _search_chat_history_like(conn, terms, limit, offset)
+        try:
+            rows = conn.execute(
+                f"""
+                SELECT h.id, h.session_id, h.role, h.timestamp, h.content, h.content_encoding, h.packed_content
+                FROM (
+                    SELECT rowid, rank
+                    FROM chat_history_fts
+                    WHERE chat_history_fts MATCH ?1 AND rowid >= (
+                        SELECT min(rowid) FROM (
+                            SELECT rowid FROM chat_history_fts WHERE chat_history_fts MATCH ?1
+                            ORDER BY rowid DESC LIMIT {SEARCH_MAX_CANDIDATES}
+                        )
+                    )
+                    ORDER BY rank
+                    LIMIT ?2 OFFSET ?3
+                ) AS matches
+                JOIN chat_history AS h ON h.id = matches.rowid
+                ORDER BY matches.rank
+                """,
+                (_fts_query(terms), limit, offset)
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            # Other errors (a locked database, a corrupt index) are real failures, not slow searches
+            if "fts5: syntax error" not in str(e):
+                raise
+            return _search_chat_history_like(conn, terms, limit, offset)
+        # The index does not keep the text, so snippets are cut from the (few) matched messages
         return [
-            {
-                "session_id": s["session_id"],
-                "preview_content": s["first_message_content"][:50] + "..." if len(s["first_message_content"]) > 50 else s["first_message_content"], # Preview first 50 chars
-                "timestamp": s["first_message_timestamp"]
-            }
-            for s in sessions
+            _search_result(row, _snippet(chat_storage.search_text(_message_content(conn, row)), terms))
+            for row in rows
         ]
-    finally:
-        conn.close()
+
+def _fts_query(terms):
+    """
+    Quotes each term so FTS5 syntax in user input is matched literally. Only the
+    last term is a prefix (it may still be being typed): a short prefix of a
+    common word matches most of the index and makes ranking slow.
+    """
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def _search_chat_history_like(conn, terms, limit, offset):
+    """
+    Unindexed search fallback: every term must appear, newest messages first. Only
+    the preview of packed messages is searched.
+    """
+    conditions = " AND ".join("content LIKE ? ESCAPE '\\'" for _ in terms)
+    # Terms are word characters, so "_" is the only LIKE wildcard they can contain
+    patterns = ["%" + term.replace("_", "\\_") + "%" for term in terms]
+    rows = conn.execute(
+        f"""
+        SELECT id, session_id, role, timestamp, content FROM chat_history
+        WHERE {conditions}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ? OFFSET ?
+        """,
+        (*patterns, limit, offset)
+    ).fetchall()
+    return [_search_result(row, _snippet(chat_storage.search_text(row["content"]), terms)) for row in rows]
+
+def _fold(text):
+    """Lowercases and strips accents character by character, keeping positions."""
+    return "".join(unicodedata.normalize("NFD", char)[0].lower()[0] for char in text)
+
+def _snippet(text, terms, tokens=SEARCH_SNIPPET_TOKENS):
+    """The words around the first word starting with a search term, with that word in bold."""
+    words = text.split()
+    prefixes = tuple(_fold(term) for term in terms)
+    position = next(
+        (i for i, word in enumerate(words) if re.sub(r"^\W+", "", _fold(word)).startswith(prefixes)), 0
+    )
+    start = max(position - tokens // 2, 0)
+    end = min(start + tokens, len(words))
+    shown = words[start:end]
+    if shown:
+        shown[position - start] = f"**{shown[position - start]}**"
+    return ("..." if start else "") + " ".join(shown) + ("..." if end < len(words) else "")
+
+def _search_result(row, snippet):
+    return {
+        "id": row["id"],
+        "session_id": row["session_id"],
+        "role": row["role"],
+        "timestamp": row["timestamp"],
+        "snippet": " ".join(snippet.split()),
+    }
+
+def delete_chat_session(session_id: str):
+    """Deletes a session's messages and summary, releasing the blobs only it referenced."""
+    flush_chat_writes()
+    with connection_manager.connection("delete_chat_session") as conn:
+        rows = conn.execute(
+            """
+            SELECT id, content, content_encoding, packed_content, blob_refs FROM chat_history
+            WHERE session_id = ?
+            """,
+            (session_id,)
+        ).fetchall()
+        if _has_search_index(conn):
+            # A contentless index is told the text it indexed to remove a message
+            conn.executemany(
+                "INSERT INTO chat_history_fts (chat_history_fts, rowid, search_text) VALUES ('delete', ?, ?)",
+                [(row["id"], chat_storage.search_text(_message_content(conn, row))) for row in rows]
+            )
+        refs = {}
+        for row in rows:
+            for key in (row["blob_refs"] or "").split():
+                refs[key] = refs.get(key, 0) + 1
+        conn.execute("DELETE FROM chat_history WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+        _release_blobs(conn, refs)
+        conn.commit()
+
+def _release_blobs(conn, refs):
+    """Removes `count` references from each blob and deletes the unreferenced ones."""
+    for key, count in refs.items():
+        conn.execute("UPDATE chat_blobs SET refcount = refcount - ? WHERE hash = ?", (count, key))
+    conn.execute("DELETE FROM chat_blobs WHERE refcount <= 0")
+
+def pack_chat_history(batch_size: int = 200):
+    """
+    Packs large assistant messages stored before packing was introduced.
+    Each batch is committed separately. Run VACUUM afterwards to return the
+    freed pages to the file system.
+
+    Returns:
+        The number of messages packed.
+    """
+    flush_chat_writes()
+    packed_count = 0
+    last_id = 0
+    while True:
+        with connection_manager.connection("pack_chat_history") as conn:
+            rows = conn.execute(
+                """
+                SELECT id, role, content FROM chat_history
+                WHERE id > ? AND role = 'assistant' AND content_encoding IS NULL AND length(content) >= ?
+                ORDER BY id LIMIT ?
+                """,
+                (last_id, chat_storage.PACK_MIN_CHARS, batch_size)
+            ).fetchall()
+            if not rows:
+                return packed_count
+            for row in rows:
+                last_id = row["id"]
+                if not chat_storage.should_pack(row["role"], row["content"]):
+                    continue
+                packed = chat_storage.pack_message(row["content"], PREVIEW_STORED_CHARS)
+                _store_blobs(conn, packed.blobs)
+                conn.execute(
+                    """
+                    UPDATE chat_history
+                    SET content = ?, content_encoding = 'zlib', packed_content = ?, blob_refs = ?
+                    WHERE id = ?
+                    """,
+                    (packed.preview, packed.data, " ".join(sorted(packed.blobs)) or None, row["id"])
+                )
+                packed_count += 1
+            conn.commit()
 
 def get_all_config_names():
     """Returns a list of all configuration names."""
-    conn = get_db_connection()
-    try:
+    generation = _config_generation()
+    names = config_cache.get_names(DB_FILE)
+    if names is not None:
+        return names
+    with connection_manager.connection("get_all_config_names") as conn:
         configs = conn.execute("SELECT name FROM configurations ORDER BY name").fetchall()
-        return [config['name'] for config in configs]
-    finally:
-        conn.close()
+        names = [config['name'] for config in configs]
+    config_cache.put_names(DB_FILE, names, generation)
+    return names
 
 def get_config_by_name(name):
-    """Retrieves a single configuration by its name, decrypting the password."""
-    conn = get_db_connection()
-    try:
+    """
+    Retrieves a single configuration by its name, decrypting the password.
+    Served from the configuration cache when no process changed the
+    configurations since it was filled; the result is a copy.
+    """
+    generation = _config_generation()
+    found, config = config_cache.get_config(DB_FILE, name)
+    if found:
+        return config
+    with connection_manager.connection("get_config_by_name") as conn:
         config_row = conn.execute("SELECT * FROM configurations WHERE name = ?", (name,)).fetchone()
+        config_dict = None
         if config_row:
             config_dict = dict(config_row)
             config_dict['db_password'] = _decrypt(config_dict['encrypted_password'])
-            return config_dict
+    config_cache.put_config(DB_FILE, name, config_dict, generation)
+    return dict(config_dict) if config_dict else None
+
+def get_config_by_id(config_id):
+    """
+    Retrieves a single configuration by its id, decrypting the password;
+    None if it was deleted. Unlike the name, the id stays the same when the
+    configuration is renamed.
+    """
+    with connection_manager.connection("get_config_by_id") as conn:
+        config_row = conn.execute("SELECT * FROM configurations WHERE id = ?", (config_id,)).fetchone()
+    if not config_row:
         return None
-    finally:
-        conn.close()
+    config_dict = dict(config_row)
+    config_dict['db_password'] = _decrypt(config_dict['encrypted_password'])
+    return config_dict
 
 def update_config(original_name, name, db_host, db_port, db_name, db_user, db_password=None, data_context=None):
     """Updates an existing configuration. If password is not provided, it remains unchanged."""
-    conn = get_db_connection()
-    try:
+    with connection_manager.connection("update_config") as conn:
         if db_password:
             encrypted_password = _encrypt(db_password)
             conn.execute(
@@ -208,27 +1207,22 @@ def update_config(original_name, name, db_host, db_port, db_name, db_user, db_pa
                 """,
                 (name, db_host, db_port, db_name, db_user, data_context, original_name)
             )
+        _bump_config_generation(conn)
         conn.commit()
-    finally:
-        conn.close()
 
 def update_schema_and_context(name, db_schema, data_context):
     """Updates the schema and data context for a specific configuration."""
-    conn = get_db_connection()
-    try:
+    with connection_manager.connection("update_schema_and_context") as conn:
         conn.execute(
             "UPDATE configurations SET db_schema = ?, data_context = ? WHERE name = ?",
             (db_schema, data_context, name)
         )
+        _bump_config_generation(conn)
         conn.commit()
-    finally:
-        conn.close()
 
 def delete_config(name):
     """Deletes a configuration by its name."""
-    conn = get_db_connection()
-    try:
+    with connection_manager.connection("delete_config") as conn:
         conn.execute("DELETE FROM configurations WHERE name = ?", (name,))
+        _bump_config_generation(conn)
         conn.commit()
-    finally:
-        conn.close()
@@ -0,0 +1,148 @@
+import asyncio
+import contextvars
+import json
+import queue
+import re
+import threading
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
+from google.adk.runners import Runner
+from google.genai import types
+
+from . import artifacts
+
+# User-facing labels for the specialist agents called by the orchestrator
+STEP_LABELS = {
+    "planner_agent": "Planning the analysis",
+    "data_engineer_agent_tool": "Querying the database",
+    "descriptive_analyzer_agent_tool": "Analyzing the data",
+    "visualization_agent_tool": "Building the chart",
+    "narrative_agent_tool": "Writing the report",
+}
+
+DATA_STEP = "data_engineer_agent_tool"
+VISUALIZATION_STEP = "visualization_agent_tool"
+NARRATIVE_STEP = "narrative_agent_tool"
+
+_FENCED_JSON_PATTERN = re.compile(r'```(?:json)?\s*\n(.*?)\n\s*```', re.DOTALL)
+
+
+@dataclass
+class StreamUpdate:
+    """
+    One thing to show the user while a run is in progress.
+
+    kind is one of:
+        "step_started": the orchestrator called the agent `step`.
+        "step_finished": `step` returned; `text` holds its output.
+        "partial_text": `text` is the next chunk of the final answer.
+        "final_text": `text` is the complete final answer.
+    """
+    kind: str
+    step: Optional[str] = None
+    text: str = ""
+
+
+def user_message(question: str, data_context: str = "") -> types.Content:
+    """The message the orchestrator expects: the question and the context of the data, as JSON."""
+    text = json.dumps({"user_request": question, "data_context": data_context})
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def step_label(step: str) -> str:
+    return STEP_LABELS.get(step, step)
+
+
+def interpret_event(event: Event) -> list[StreamUpdate]:
+    """Translates a runner event into the updates it carries."""
+    updates = []
+    if event.partial:
+        # Chunks of a streamed response; the complete response follows as a regular event
+        text = _text_of(event)
+        return [StreamUpdate("partial_text", text=text)] if text else []
+
+    for call in event.get_function_calls():
+        updates.append(StreamUpdate("step_started", step=call.name))
+    for response in event.get_function_responses():
+        result = response.response or {}
+        text = result.get("result", result) if isinstance(result, dict) else result
+        handle = result.get(artifacts.HANDLE_FIELD) if isinstance(result, dict) else None
+        if handle and event.actions:
+            # The orchestrator only sees a preview of large outputs; the output itself is in the event's state delta
+            text = artifacts.lookup(handle, event.actions.state_delta) or text
+        updates.append(StreamUpdate(
+            "step_finished",
+            step=response.name,
+            text=text if isinstance(text, str) else json.dumps(text, ensure_ascii=False),
+        ))
+    if updates:
+        return updates
+
+    text = _text_of(event)
+    if text and event.is_final_response():
+        updates.append(StreamUpdate("final_text", text=text))
+    return updates
+
+
+def _text_of(event: Event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text for part in event.content.parts if part.text and not part.thought)
+
+
+def parse_json_output(text: str) -> Optional[Any]:
+    """Parses an agent's JSON output, which may be wrapped in a markdown code block."""
+    match = _FENCED_JSON_PATTERN.search(text)
+    try:
+        return json.loads(match.group(1) if match else text)
+    except (TypeError, ValueError):
+        return None
+
+
+def stream_events(
+        runner: Runner,
+        user_id: str,
+        session_id: str,
+        new_message: types.Content,
+        run_config: Optional[RunConfig] = None,
+) -> Iterator[Event]:
+    """
+    Runs the agent in a background thread and yields its events as they arrive.
+
+    Unlike `Runner.run`, the caller's context variables are visible to the run,
+    an exception raised by the run is re-raised here, and responses are
+    streamed (SSE) unless another run config is given.
+    """
+    run_config = run_config or RunConfig(streaming_mode=StreamingMode.SSE)
+    events: queue.Queue[Any] = queue.Queue()
+    done = object()
+
+    async def _run():
+        async for event in runner.run_async(
+            user_id=user_id, session_id=session_id, new_message=new_message, run_config=run_config
+        ):
+            events.put(event)
+
+    def _thread_main():
+        try:
+            asyncio.run(_run())
+        except BaseException as e:  # Re-raised in the consuming thread
+            events.put(e)
+        finally:
+            events.put(done)
+
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(_thread_main,), name="agent-run", daemon=True)
+    thread.start()
+    while True:
+        item = events.get()
+        if item is done:
+            break
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+    thread.join()
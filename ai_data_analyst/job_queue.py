@@ -0,0 +1,313 @@
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+from . import config_manager
+from .chat_storage import compress, decompress
+
+# Attempts a job gets before it is marked as failed
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# A running job whose worker has not sent a heartbeat for this long is given to another worker
+JOB_HEARTBEAT_TIMEOUT = float(os.environ.get("JOB_HEARTBEAT_TIMEOUT", "60"))
+# Seconds before the first retry of a failed job; doubled on each further attempt
+JOB_RETRY_DELAY = 10.0
+JOB_RETRY_MAX_DELAY = 300.0
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    id: str
+    question: str
+    data_context: str
+    session_id: str
+    user_id: str
+    # Whether the answer is also added to the chat history of session_id
+    save_to_chat: bool
+    status: str  # "queued", "running", "done" or "failed"
+    attempts: int
+    max_attempts: int
+    created_at: float
+    worker_id: Optional[str] = None
+    answer: Optional[str] = None
+    error: Optional[str] = None
+    trace_id: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # The saved connection the question is answered on; None uses the worker's POSTGRES_* settings
+    config_id: Optional[int] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+
+def _job_from_row(row) -> Job:
+    return Job(
+        id=row["id"],
+        question=row["question"],
+        data_context=row["data_context"],
+        session_id=row["session_id"],
+        user_id=row["user_id"],
+        save_to_chat=bool(row["save_to_chat"]),
+        status=row["status"],
+        attempts=row["attempts"],
+        max_attempts=row["max_attempts"],
+        created_at=row["created_at"],
+        worker_id=row["worker_id"],
+        answer=decompress(row["answer"]) if row["answer"] is not None else None,
+        error=row["error"],
+        trace_id=row["trace_id"],
+        started_at=row["started_at"],
+        finished_at=row["finished_at"],
+        config_id=row["config_id"],
+    )
+
+
+class JobQueue:
+    """
+    A durable queue of questions for the agent workers, stored in the local
+    SQLite database next to the configurations and chats.
+
+    Workers in any number of processes claim jobs atomically and keep them with
+    heartbeats. A job whose worker stops sending them (it crashed, or its
+    machine restarted) goes back to the queue; a job that fails is retried with
+    a growing delay, up to its maximum attempts. Jobs of one session run one at
+    a time, in the order they were submitted.
+    """
+
+    def __init__(self, db_file: Optional[str] = None, heartbeat_timeout: float = JOB_HEARTBEAT_TIMEOUT):
+        """
+        Args:
+            db_file: SQLite file, also holding the chats answers are added to. Defaults to
+                config_manager.DB_FILE at call time.
+            heartbeat_timeout: Seconds without a heartbeat after which a running job is requeued.
+        """
+        self.db_file = db_file
+        self.heartbeat_timeout = heartbeat_timeout
+
+    def _connection(self, operation: str):
+        return config_manager.connection_manager.connection(f"job_queue.{operation}", db_file=self.db_file)
+
+    def initialize(self) -> None:
+        """Creates the jobs table if it doesn't exist."""
+        with self._connection("initialize") as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS agent_jobs (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    question TEXT NOT NULL,
+                    data_context TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    save_to_chat INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    worker_id TEXT,
+                    heartbeat_at REAL,
+                    answer BLOB,
+                    error TEXT,
+                    trace_id TEXT,
+                    started_at REAL,
+                    finished_at REAL,
+                    config_id INTEGER
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(agent_jobs)").fetchall()}
+            if "config_id" not in columns:
+                conn.execute("ALTER TABLE agent_jobs ADD COLUMN config_id INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_jobs_status ON agent_jobs (status, available_at, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_jobs_session ON agent_jobs (session_id, status)")
+            conn.commit()
+
+    def submit(
+            self,
+            question: str,
+            data_context: str = "",
+            session_id: Optional[str] = None,
+            user_id: str = "local_user",
+            save_to_chat: bool = False,
+            max_attempts: int = JOB_MAX_ATTEMPTS,
+            config_id: Optional[int] = None,
+    ) -> str:
+        """
+        Queues a question; returns the job id.
+
+        `config_id` is the saved connection to answer it on, fixed when it is
+        queued: changing the active connection later does not move the job to
+        another database.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection("submit") as conn:
+            conn.execute(
+                """
+                INSERT INTO agent_jobs (id, question, data_context, session_id, user_id, save_to_chat, status,
+                                        max_attempts, available_at, created_at, config_id)
+                VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?)
+                """,
+                (job_id, question, data_context, session_id or str(uuid.uuid4()), user_id, int(save_to_chat),
+                 max_attempts, now, now, config_id)
+            )
+            conn.commit()
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """
+        Takes the oldest job that is ready to run and whose session has no other
+        job running, and marks it as running by `worker_id`. Returns None when
+        there is nothing to do.
+        """
+        now = time.time()
+        with self._connection("claim") as conn:
+            # Taking the write lock up front keeps two workers from claiming the same job
+            conn.execute("BEGIN IMMEDIATE")
+            self._requeue_stale(conn, now)
+            row = conn.execute(
+                """
+                SELECT id FROM agent_jobs AS job
+                WHERE status = 'queued' AND available_at <= ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM agent_jobs AS earlier
+                      WHERE earlier.session_id = job.session_id AND earlier.seq < job.seq
+                        AND earlier.status IN ('queued', 'running')
+                  )
+                ORDER BY seq
+                LIMIT 1
+                """,
+                (now,)
+            ).fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            conn.execute(
+                """
+                UPDATE agent_jobs
+                SET status = 'running', worker_id = ?, heartbeat_at = ?, started_at = ?, attempts = attempts + 1
+                WHERE id = ?
+                """,
+                (worker_id, now, now, row["id"])
+            )
+            conn.commit()
+        return self.get(row["id"])
+
+    def _requeue_stale(self, conn, now: float) -> None:
+        """Gives back the running jobs whose worker stopped sending heartbeats."""
+        stale = conn.execute(
+            """
+            SELECT id, worker_id, attempts, max_attempts FROM agent_jobs
+            WHERE status = 'running' AND heartbeat_at < ?
+            """,
+            (now - self.heartbeat_timeout,)
+        ).fetchall()
+        for job in stale:
+            logger.warning("Job %s was abandoned by worker %s", job["id"], job["worker_id"])
+            self._retry_or_fail(conn, job, "The worker stopped responding.", now)
+
+    def _retry_or_fail(self, conn, job, error: str, now: float) -> None:
+        if job["attempts"] < job["max_attempts"]:
+            delay = min(JOB_RETRY_MAX_DELAY, JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1))
+            conn.execute(
+                "UPDATE agent_jobs SET status = 'queued', worker_id = NULL, error = ?, available_at = ? WHERE id = ?",
+                (error, now + delay, job["id"])
+            )
+        else:
+            conn.execute(
+                "UPDATE agent_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, now, job["id"])
+            )
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Records that the worker is still running the job; False if the job was given to another worker."""
+        with self._connection("heartbeat") as conn:
+            cursor = conn.execute(
+                "UPDATE agent_jobs SET heartbeat_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time(), job_id, worker_id)
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+
+    def complete(
+            self,
+            job_id: str,
+            worker_id: str,
+            answer: str,
+            trace_id: Optional[str] = None,
+            chat_session_id: Optional[str] = None,
+    ) -> bool:
+        """
+        Stores the answer of a job; False if the job was given to another worker meanwhile.
+
+        Args:
+            job_id: The job.
+            worker_id: The worker that ran it.
+            answer: The agents' answer.
+            trace_id: The trace of the run.
+            chat_session_id: Chat the answer is also added to, in the same transaction,
+                so the chat has the answer as soon as the job is seen as done.
+        """
+        with self._connection("complete") as conn:
+            cursor = conn.execute(
+                """
+                UPDATE agent_jobs SET status = 'done', answer = ?, error = NULL, trace_id = ?, finished_at = ?
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+                """,
+                (compress(answer), trace_id, time.time(), job_id, worker_id)
+            )
+            completed = cursor.rowcount == 1
+            if completed and chat_session_id:
+                config_manager.insert_chat_message(conn, chat_session_id, "assistant", answer)
+            conn.commit()
+            return completed
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> None:
+        """Records a failed attempt: the job is retried later, or marked as failed after its last attempt."""
+        with self._connection("fail") as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            job = conn.execute(
+                """
+                SELECT id, attempts, max_attempts FROM agent_jobs
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+                """,
+                (job_id, worker_id)
+            ).fetchone()
+            if job is not None:
+                self._retry_or_fail(conn, job, error, time.time())
+            conn.commit()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connection("get") as conn:
+            row = conn.execute("SELECT * FROM agent_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_from_row(row) if row else None
+
+    def list_jobs(self, session_id: Optional[str] = None, status: Optional[str] = None, limit: int = 50) -> list[Job]:
+        """The most recent jobs, optionally of one session or with one status."""
+        conditions, params = [], []
+        if session_id:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connection("list_jobs") as conn:
+            rows = conn.execute(
+                f"SELECT * FROM agent_jobs {where} ORDER BY seq DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [_job_from_row(row) for row in rows]
+
+    def counts(self) -> dict[str, int]:
+        """The number of jobs per status."""
+        with self._connection("counts") as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS jobs FROM agent_jobs GROUP BY status").fetchall()
+        return {row["status"]: row["jobs"] for row in rows}
+
+
+job_queue = JobQueue()
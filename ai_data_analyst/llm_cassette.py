@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from collections.abc import AsyncGenerator
+from typing import Optional
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+LIVE = "live"
+RECORD = "record"
+REPLAY = "replay"
+
+# LLM_BACKEND selects how model calls are made: "live" (default) calls the model,
+# "record" calls it and saves each request/response pair to the agent's cassette,
+# "replay" answers from the cassettes without any network access.
+LLM_BACKEND = os.environ.get("LLM_BACKEND", LIVE).lower()
+CASSETTE_DIR = os.environ.get("LLM_CASSETTE_DIR", "cassettes")
+# Simulated latency of replayed calls: "recorded" waits as long as the recorded call
+# took, a number waits that many seconds.
+REPLAY_LATENCY = os.environ.get("LLM_REPLAY_LATENCY", "0")
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMiss(LookupError):
+    """A replayed request has no recording."""
+
+
+def _content_key(content: types.Content) -> dict:
+    parts = []
+    for part in content.parts or []:
+        if part.thought:
+            continue
+        if part.text:
+            parts.append({"text": part.text})
+        if part.function_call:
+            # Call ids are random per run
+            parts.append({"call": part.function_call.name, "args": part.function_call.args})
+        if part.function_response:
+            parts.append({"response": part.function_response.name, "result": part.function_response.response})
+    return {"role": content.role, "parts": parts}
+
+
+def request_key(llm_request: LlmRequest, stream: bool) -> str:
+    """
+    A digest of what determines a model response: the system instruction, the tools
+    and the conversation. The model name is left out, so recordings are replayed
+    whichever tier the request is routed to.
+    """
+    config = llm_request.config
+    system_instruction = config.system_instruction if config else None
+    if isinstance(system_instruction, types.Content):
+        system_instruction = _content_key(system_instruction)
+    payload = {
+        "system": system_instruction,
+        "tools": sorted(llm_request.tools_dict),
+        "contents": [_content_key(content) for content in llm_request.contents],
+        "stream": stream,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    The recorded calls of one agent, as a JSON Lines file.
+
+    A request made several times with the same key is answered with its
+    recordings in order, and with the last one after that.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Optional[dict[str, list[dict]]] = None
+        self._served: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, list[dict]]:
+        if self._entries is None:
+            self._entries = defaultdict(list)
+            if os.path.exists(self.path):
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._entries[entry["key"]].append(entry)
+        return self._entries
+
+    def next_entry(self, key: str) -> dict:
+        with self._lock:
+            entries = self._load().get(key)
+            if not entries:
+                raise CassetteMiss(f"No recording for request {key[:12]} in {self.path}")
+            index = min(self._served[key], len(entries) - 1)
+            self._served[key] += 1
+            return entries[index]
+
+    def append(self, entry: dict) -> None:
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._load()[entry["key"]].append(entry)
+
+
+_cassettes: dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(agent: str, directory: Optional[str] = None) -> Cassette:
+    """The process-wide cassette of an agent."""
+    path = os.path.join(directory or CASSETTE_DIR, f"{agent}.jsonl")
+    with _cassettes_lock:
+        cassette = _cassettes.get(path)
+        if cassette is None:
+            cassette = _cassettes[path] = Cassette(path)
+        return cassette
+
+
+def _replay_delay(recorded_latency: float) -> float:
+    if REPLAY_LATENCY == "recorded":
+        return recorded_latency
+    return float(REPLAY_LATENCY)
+
+
+class CassetteLlm(BaseLlm):
+    """
+    Records the calls of `inner` to a cassette, or replays them from it.
+
+    Args:
+        mode: RECORD or REPLAY.
+        cassette: The agent's cassette.
+        inner: The model called in RECORD mode.
+    """
+
+    mode: str
+    cassette: Cassette
+    inner: Optional[BaseLlm] = None
+
+    async def generate_content_async(
+            self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        key = request_key(llm_request, stream)
+        if self.mode == REPLAY:
+            entry = self.cassette.next_entry(key)
+            delay = _replay_delay(entry["latency"])
+            responses = entry["responses"]
+            for response in responses:
+                # The recorded latency is spread over the streamed chunks
+                await asyncio.sleep(delay / len(responses))
+                yield LlmResponse.model_validate(response)
+            return
+
+        started_at = time.perf_counter()
+        responses = []
+        async for response in self.inner.generate_content_async(llm_request, stream=stream):
+            responses.append(response.model_dump(mode="json", exclude_none=True))
+            yield response
+        self.cassette.append({
+            "key": key,
+            "model": llm_request.model,
+            "latency": round(time.perf_counter() - started_at, 3),
+            "responses": responses,
+        })
+        logger.debug("Recorded %s call to %s", llm_request.model, self.cassette.path)
@@ -0,0 +1,432 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from collections.abc import AsyncGenerator, Iterator
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass, field
+from typing import Optional
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.models.registry import LLMRegistry
+from pydantic import PrivateAttr
+
+from . import llm_cassette, tracing
+
+# Lower values are served first
+INTERACTIVE = 0
+BATCH = 10
+
+# Default quotas per model (requests and tokens per minute, concurrent calls).
+# Override them with LLM_RATE_LIMITS, e.g. '{"gemini-2.5-pro": {"rpm": 5, "max_concurrency": 2}}'.
+DEFAULT_LIMITS = {
+    "gemini-2.5-pro": {"rpm": 150, "tpm": 2_000_000, "max_concurrency": 8},
+    "gemini-2.5-flash": {"rpm": 1000, "tpm": 1_000_000, "max_concurrency": 16},
+}
+FALLBACK_LIMITS = {"rpm": 60, "tpm": None, "max_concurrency": 4}
+
+# Buckets hold this many seconds of quota, which bounds bursts
+BURST_SECONDS = 10
+
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+# Quota exhaustion and transient server errors
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 503, 504})
+
+# Wait times kept per model for percentiles
+WAIT_SAMPLES = 1000
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call could not be made, or retried, before the caller's deadline."""
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Runs the model calls made in this context with the given priority (INTERACTIVE or BATCH)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """Fails the model calls made in this context that cannot complete within `seconds`."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class TokenBucket:
+    """Refills at `rate` per second up to `capacity`. Not thread-safe; guarded by the scheduler lock."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self, amount: float, now: float) -> bool:
+        # A single request larger than the bucket would never fit; it takes the whole bucket
+        amount = min(amount, self.capacity)
+        self._refill(now)
+        if self.level >= amount:
+            self.level -= amount
+            return True
+        return False
+
+    def wait_time(self, amount: float, now: float) -> float:
+        amount = min(amount, self.capacity)
+        self._refill(now)
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    tokens: int = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    loop: asyncio.AbstractEventLoop = field(compare=False)
+    wakeup: asyncio.Future = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class _ModelState:
+    def __init__(self, rpm: float, tpm: Optional[float], max_concurrency: int):
+        self.requests = TokenBucket(rpm / 60, max(1.0, rpm / 60 * BURST_SECONDS))
+        self.tokens = TokenBucket(tpm / 60, tpm / 60 * BURST_SECONDS) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.queue: list[_Waiter] = []
+        # Metrics
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.max_queue_depth = 0
+        self.waits: deque[float] = deque(maxlen=WAIT_SAMPLES)
+
+
+class LlmScheduler:
+    """
+    Coordinates the model calls of every session of the process.
+
+    Each model has a request and a token bucket (its per-minute quotas) and a cap
+    on concurrent calls. Calls wait in a priority queue per model, interactive
+    before batch and first come first served within a priority, and are let
+    through when the buckets and the cap allow. Sessions run their agents on
+    their own threads and event loops, so the state is guarded by a lock and
+    waiters are woken on their own loop.
+    """
+
+    def __init__(self, limits: Optional[dict[str, dict]] = None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._models: dict[str, _ModelState] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def configure(self, model: str, rpm: float, tpm: Optional[float] = None, max_concurrency: int = 4) -> None:
+        """Sets the quotas of a model; meant to be called before the model is first used."""
+        with self._lock:
+            self.limits[model] = {"rpm": rpm, "tpm": tpm, "max_concurrency": max_concurrency}
+            self._models.pop(model, None)
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            limits = {**FALLBACK_LIMITS, **self.limits.get(model, {})}
+            state = self._models[model] = _ModelState(limits["rpm"], limits["tpm"], limits["max_concurrency"])
+        return state
+
+    def _grant(self, state: _ModelState) -> Optional[float]:
+        """
+        Lets waiters through in queue order while the quotas allow. Returns how long
+        until the first waiter fits in the buckets, or None if nothing is waiting or
+        the concurrency cap is the limit (a finished call grants the next one).
+        """
+        now = time.monotonic()
+        while state.queue:
+            head = state.queue[0]
+            if head.cancelled:
+                heapq.heappop(state.queue)
+                continue
+            if state.in_flight >= state.max_concurrency:
+                return None
+            if state.tokens and state.tokens.wait_time(head.tokens, now) > 0:
+                return state.tokens.wait_time(head.tokens, now)
+            if not state.requests.try_take(1, now):
+                return state.requests.wait_time(1, now)
+            if state.tokens:
+                state.tokens.try_take(head.tokens, now)
+            heapq.heappop(state.queue)
+            state.in_flight += 1
+            state.calls += 1
+            state.waits.append(now - head.enqueued_at)
+            head.granted = True
+            head.loop.call_soon_threadsafe(_wake, head.wakeup)
+        return None
+
+    async def acquire(self, model: str, tokens: int = 0) -> None:
+        """
+        Waits for a slot to call `model`, in the priority of the current context.
+
+        Raises:
+            DeadlineExceeded: if the context's deadline passes while waiting.
+        """
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(
+            priority=_priority.get(), sequence=next(self._sequence), tokens=tokens,
+            enqueued_at=time.monotonic(), loop=loop, wakeup=loop.create_future(),
+        )
+        with self._lock:
+            state = self._state(model)
+            heapq.heappush(state.queue, waiter)
+            state.max_queue_depth = max(state.max_queue_depth, len(state.queue))
+        try:
+            while True:
+                with self._lock:
+                    delay = self._grant(state)
+                    if waiter.granted:
+                        return
+                    if waiter.wakeup.done():
+                        waiter.wakeup = loop.create_future()
+                timeout = delay
+                call_deadline = _deadline.get()
+                if call_deadline is not None:
+                    remaining = call_deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DeadlineExceeded(f"Deadline passed while waiting to call {model}")
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(asyncio.shield(waiter.wakeup), timeout)
+        except BaseException:
+            with self._lock:
+                waiter.cancelled = True
+                if waiter.granted:
+                    # Granted while being cancelled
+                    waiter.granted = False
+                    state.in_flight -= 1
+                    self._grant(state)
+            raise
+
+    def release(self, model: str) -> None:
+        """Ends a call started with `acquire`, letting the next waiter through."""
+        with self._lock:
+            state = self._state(model)
+            state.in_flight -= 1
+            self._grant(state)
+
+    def record_retry(self, model: str) -> None:
+        with self._lock:
+            self._state(model).retries += 1
+
+    def record_failure(self, model: str) -> None:
+        with self._lock:
+            self._state(model).failures += 1
+
+    def stats(self) -> dict[str, dict]:
+        """Queue depth, concurrency, wait time and retry metrics per model."""
+        with self._lock:
+            stats = {}
+            for model, state in self._models.items():
+                waits = sorted(state.waits)
+                stats[model] = {
+                    "queue_depth": sum(1 for waiter in state.queue if not waiter.cancelled),
+                    "max_queue_depth": state.max_queue_depth,
+                    "in_flight": state.in_flight,
+                    "calls": state.calls,
+                    "retries": state.retries,
+                    "failures": state.failures,
+                    "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                    "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                    "wait_max": waits[-1] if waits else 0.0,
+                }
+            return stats
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _limits_from_env() -> dict[str, dict]:
+    raw = os.environ.get("LLM_RATE_LIMITS")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logger.warning("Ignoring LLM_RATE_LIMITS: not valid JSON")
+        return {}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Quota and transient server errors are retried; anything else is returned to the agent."""
+    code = getattr(error, "code", None)
+    return code in RETRYABLE_STATUS_CODES or isinstance(error, (ConnectionError, asyncio.TimeoutError))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, so retries of concurrent sessions spread out."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def estimate_tokens(llm_request: LlmRequest) -> int:
+    """A rough input token count (4 characters per token) for the token bucket."""
+    chars = 0
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            chars += len(part.text or "")
+            if part.function_call:
+                chars += len(json.dumps(part.function_call.args or {}, default=str))
+            if part.function_response:
+                chars += len(json.dumps(part.function_response.response or {}, default=str))
+    if llm_request.config and isinstance(llm_request.config.system_instruction, str):
+        chars += len(llm_request.config.system_instruction)
+    return chars // 4
+
+
+class ScheduledLlm(BaseLlm):
+    """
+    A model whose calls go through the process-wide scheduler.
+
+    The call is made by `inner`, or by the registered model class of the
+    request's model name, which may differ from `model` when the request was
+    routed to another tier. Under LLM_BACKEND=record or replay, calls are
+    recorded to, or answered from, the cassette of `agent` (see llm_cassette).
+    Retryable errors are retried with backoff while no response has been
+    yielded yet and the context's deadline allows it. The scheduler's slot only
+    covers the provider call: apart from streamed text, responses are yielded
+    once it is released, so the tools they call can make calls of their own.
+    """
+
+    inner: Optional[BaseLlm] = None
+    agent: Optional[str] = None
+    _inner_by_model: dict[str, BaseLlm] = PrivateAttr(default_factory=dict)
+    _inner_by_loop: weakref.WeakKeyDictionary = PrivateAttr(default_factory=weakref.WeakKeyDictionary)
+
+    def _inner_for(self, model: str) -> BaseLlm:
+        """The model that makes calls for `model` on the running event loop."""
+        try:
+            # Model clients hold HTTP connections bound to the loop that opened them
+            by_model = self._inner_by_loop.setdefault(asyncio.get_running_loop(), {})
+        except RuntimeError:
+            by_model = self._inner_by_model
+        llm = by_model.get(model)
+        if llm is None:
+            backend = llm_cassette.LLM_BACKEND
+            # Replaying never needs the real model
+            live = None if backend == llm_cassette.REPLAY else (self.inner or LLMRegistry.new_llm(model))
+            if backend in (llm_cassette.RECORD, llm_cassette.REPLAY):
+                llm = llm_cassette.CassetteLlm(
+                    model=model, mode=backend, cassette=llm_cassette.get_cassette(self.agent or self.model), inner=live
+                )
+            else:
+                llm = live
+            by_model[model] = llm
+        return llm
+
+    async def generate_content_async(
+            self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        model = llm_request.model or self.model
+        tokens = estimate_tokens(llm_request)
+        attempt = 0
+        waited = 0.0
+        # Not made current: ADK runs the tools the response calls while this generator is suspended
+        span = tracing.tracer.start_span(f"llm {model}", attributes={
+            "llm.model": model, "llm.agent": self.agent or "", "llm.estimated_prompt_tokens": tokens,
+        })
+        try:
+            while True:
+                queued_at = time.monotonic()
+                await scheduler.acquire(model, tokens)
+                waited += time.monotonic() - queued_at
+                yielded = False
+                held = []
+                try:
+                    async for response in self._inner_for(model).generate_content_async(llm_request, stream=stream):
+                        tracing.record_llm_response(span, response)
+                        if response.partial and not held and not _calls_tools(response):
+                            # Streamed text is passed on as it arrives; nothing runs on it
+                            yielded = True
+                            yield response
+                        else:
+                            held.append(response)
+                    break
+                except Exception as e:
+                    if yielded or not is_retryable(e) or attempt >= MAX_RETRIES:
+                        scheduler.record_failure(model)
+                        raise
+                    delay = backoff_delay(attempt)
+                    call_deadline = _deadline.get()
+                    if call_deadline is not None and time.monotonic() + delay >= call_deadline:
+                        scheduler.record_failure(model)
+                        raise DeadlineExceeded(f"No time left to retry {model} before the deadline") from e
+                    logger.warning("Retrying %s in %.1fs after error: %s", model, delay, e)
+                    scheduler.record_retry(model)
+                finally:
+                    scheduler.release(model)
+                attempt += 1
+                await asyncio.sleep(delay)
+            # Yielded once the slot is released: ADK runs the tools a response calls while
+            # this generator is suspended, and sub-agents called as tools need a slot too
+            for response in held:
+                yield response
+        except Exception as e:
+            tracing.record_error(span, e)
+            raise
+        finally:
+            span.set_attribute("llm.queue_wait_ms", round(waited * 1000, 1))
+            span.set_attribute("llm.attempts", attempt + 1)
+            span.end()
+
+    def connect(self, llm_request: LlmRequest):
+        return self._inner_for(llm_request.model or self.model).connect(llm_request)
+
+
+def _calls_tools(response: LlmResponse) -> bool:
+    parts = response.content.parts if response.content else None
+    return any(part.function_call for part in parts or [])
+
+
+def scheduled_model(model: str, agent: Optional[str] = None) -> ScheduledLlm:
+    """
+    The model of an agent, with its calls going through the scheduler.
+
+    Args:
+        model: The model name.
+        agent: The agent's name, which names its cassette when calls are recorded or replayed.
+    """
+    return ScheduledLlm(model=model, agent=agent)
+
+
+def get_scheduler_stats() -> dict[str, dict]:
+    return scheduler.stats()
+
+
+# Shared by every session of the process
+scheduler = LlmScheduler(_limits_from_env())
@@ -0,0 +1,151 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+from opentelemetry import trace
+
+# Configure with LOG_LEVEL, LOG_FORMAT ("text" or "json" lines) and, to also write a file, LOG_FILE
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_FILE = os.environ.get("LOG_FILE")
+# Logged payloads (query results, prompts) are cut to this many characters
+LOG_MAX_PAYLOAD_CHARS = int(os.environ.get("LOG_MAX_PAYLOAD_CHARS", "500"))
+# Share of the records marked as sampled (see `sampled`) that are kept; warnings and errors always are
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+# Records waiting to be written; when the writer falls behind, new records are dropped instead of blocking
+LOG_QUEUE_SIZE = 10_000
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed in `extra` and goes into JSON records
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_configured = False
+_lock = threading.Lock()
+
+
+class Payload:
+    """
+    A large value to log, such as a query result. It is converted to text and
+    cut to `max_chars` only when a handler writes the record, so a record
+    filtered out by its level costs nothing.
+    """
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: Optional[int] = None):
+        self.value = value
+        self.max_chars = LOG_MAX_PAYLOAD_CHARS if max_chars is None else max_chars
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.max_chars:
+            return text
+        return f"{text[:self.max_chars]}... ({len(text)} chars)"
+
+
+def payload(value: Any, max_chars: Optional[int] = None) -> Payload:
+    return Payload(value, max_chars)
+
+
+def sampled(rate: Optional[float] = None) -> dict:
+    """`extra` for frequent records: only a `rate` share of them is kept, e.g. `logger.debug(..., extra=sampled())`."""
+    return {"sample_rate": LOG_SAMPLE_RATE if rate is None else rate}
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a sampled record with its `sample_rate` probability; other records pass."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None or rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the trace and span it was logged in and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sample_rate":
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Hands records to the logging thread without formatting them, and drops them
+    rather than block when the queue is full. The message is built by the
+    listener, so arguments should not be mutated after they are logged.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.addFilter(SamplingFilter())
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Read here, in the caller's context: the listener thread has no current span
+        context = trace.get_current_span().get_span_context()
+        if context.is_valid:
+            record.trace_id = trace.format_trace_id(context.trace_id)
+            record.span_id = trace.format_span_id(context.span_id)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _handlers(fmt: str, log_file: Optional[str]) -> list[logging.Handler]:
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers: list[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None, log_file: Optional[str] = None) -> None:
+    """
+    Sets up logging for the whole process, once: records are queued by the
+    logging call and written to stderr (and LOG_FILE) by a background thread.
+
+    Like `logging.basicConfig`, nothing is changed when the host (a test runner,
+    `adk web`) has already configured the root logger.
+    """
+    global _listener, _configured
+    with _lock:
+        if _configured:
+            return
+        _configured = True
+        root = logging.getLogger()
+        if root.handlers:
+            return
+        root.setLevel(level or LOG_LEVEL)
+        log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+        _listener = QueueListener(log_queue, *_handlers(fmt or LOG_FORMAT, log_file or LOG_FILE))
+        _listener.start()
+        root.addHandler(DeferredQueueHandler(log_queue))
+        # Writes the records still queued at exit
+        atexit.register(_listener.stop)
@@ -0,0 +1,347 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterable, Sequence
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+from . import tracing
+from .llm_scheduler import get_scheduler_stats
+from .tools import postgres_mcp
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "ai_data_analyst"
+
+# Serves the Prometheus text exposition at http://<host>:METRICS_PORT/metrics when set
+METRICS_PORT = os.environ.get("METRICS_PORT")
+# Or writes it to this file every METRICS_SNAPSHOT_INTERVAL seconds
+METRICS_SNAPSHOT_FILE = os.environ.get("METRICS_SNAPSHOT_FILE")
+METRICS_SNAPSHOT_INTERVAL = float(os.environ.get("METRICS_SNAPSHOT_INTERVAL", "60"))
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+TOKENS_BUCKETS = (100, 500, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000)
+ROWS_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+# ADK wraps parallel tool calls, each with its own span, in a span of this name
+MERGED_TOOLS_SPAN = "execute_tool (merged)"
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_labels(labels), 0)
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class Histogram:
+    """Counts of observations per bucket, with their sum, per label set."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: the count of each bucket (the last is +Inf), then the sum
+        self._values: dict[Labels, tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts, _ = self._values.get(_labels(labels), ([0], [0.0]))
+            return sum(counts)
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        samples = []
+        with self._lock:
+            for labels, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", labels + (("le", _format_value(bound)),), cumulative))
+                samples.append((f"{self.name}_sum", labels, total[0]))
+                samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Gauge:
+    """Values read when the metrics are collected, e.g. pool or cache state."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, collect: Callable[[], dict[Labels, float]]):
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        try:
+            values = self.collect()
+        except Exception as e:
+            logger.warning("Could not collect %s: %s", self.name, e)
+            return []
+        return [(self.name, labels, value) for labels, value in values.items()]
+
+
+class MetricsRegistry:
+    """The process' metrics, exposed in the Prometheus text format."""
+
+    def __init__(self, prefix: str = PREFIX):
+        self.prefix = prefix
+        self._metrics: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(f"{self.prefix}_{name}", help))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = SECONDS_BUCKETS) -> Histogram:
+        return self._register(Histogram(f"{self.prefix}_{name}", help, buckets))
+
+    def gauge(self, name: str, help: str, collect: Callable[[], dict[Labels, float]]) -> Gauge:
+        return self._register(Gauge(f"{self.prefix}_{name}", help, collect))
+
+    def exposition(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+requests_total = registry.counter("requests_total", "User requests, by status.")
+request_seconds = registry.histogram("request_seconds", "Time to answer a user request.")
+agent_runs_total = registry.counter("agent_runs_total", "Agent runs, by agent and status.")
+agent_seconds = registry.histogram("agent_seconds", "Duration of agent runs, by agent.")
+tool_calls_total = registry.counter("tool_calls_total", "Tool calls, including sub-agents, by tool and status.")
+tool_seconds = registry.histogram("tool_seconds", "Duration of tool calls, by tool.")
+tool_result_bytes = registry.histogram("tool_result_bytes", "Size of tool results, by tool.", BYTES_BUCKETS)
+llm_calls_total = registry.counter("llm_calls_total", "Model calls, by model, agent and status.")
+llm_seconds = registry.histogram("llm_seconds", "Duration of model calls, queueing included, by model.")
+llm_queue_seconds = registry.histogram("llm_queue_seconds", "Time model calls waited for quota, by model.")
+llm_prompt_tokens = registry.histogram("llm_prompt_tokens", "Prompt tokens per model call.", TOKENS_BUCKETS)
+llm_completion_tokens = registry.histogram(
+    "llm_completion_tokens", "Completion tokens per model call.", TOKENS_BUCKETS
+)
+sql_queries_total = registry.counter("sql_queries_total", "Database queries run (cache misses), by status.")
+sql_seconds = registry.histogram("sql_seconds", "Duration of database queries.")
+sql_rows = registry.histogram("sql_rows", "Rows returned per database query.", ROWS_BUCKETS)
+sql_result_bytes = registry.histogram("sql_result_bytes", "Size of query results as JSON.", BYTES_BUCKETS)
+
+
+def _cache_values(key: str) -> dict[Labels, float]:
+    return {
+        _labels({"cache": cache}): stats[key]
+        for cache, stats in postgres_mcp.get_cache_stats().items()
+    }
+
+
+def _cache_hit_ratios() -> dict[Labels, float]:
+    return {
+        _labels({"cache": cache}): stats["hits"] / (stats["hits"] + stats["misses"])
+        for cache, stats in postgres_mcp.get_cache_stats().items()
+        if stats["hits"] + stats["misses"]
+    }
+
+
+def _pool_values(key: str) -> dict[Labels, float]:
+    return {_labels({"database": url}): stats[key] for url, stats in postgres_mcp.get_pool_stats().items()}
+
+
+def _scheduler_values(key: str) -> dict[Labels, float]:
+    return {_labels({"model": model}): stats[key] for model, stats in get_scheduler_stats().items()}
+
+
+registry.gauge("cache_hits", "Hits of the schema and query caches.", lambda: _cache_values("hits"))
+registry.gauge("cache_misses", "Misses of the schema and query caches.", lambda: _cache_values("misses"))
+registry.gauge("cache_entries", "Entries in the schema and query caches.", lambda: _cache_values("size"))
+registry.gauge("cache_hit_ratio", "Share of cache lookups that were hits.", _cache_hit_ratios)
+registry.gauge("db_pool_size", "Connections kept in the pool.", lambda: _pool_values("size"))
+registry.gauge("db_pool_checked_out", "Pooled connections in use.", lambda: _pool_values("checked_out"))
+registry.gauge("db_pool_overflow", "Connections open beyond the pool size.", lambda: _pool_values("overflow"))
+registry.gauge("llm_queue_depth", "Model calls waiting for quota.", lambda: _scheduler_values("queue_depth"))
+registry.gauge("llm_in_flight", "Model calls in progress.", lambda: _scheduler_values("in_flight"))
+
+
+class MetricsSpanProcessor(SpanProcessor):
+    """
+    Derives the metrics from finished spans, so every agent, tool, model call and
+    query is measured without instrumenting each of them (see tracing).
+    """
+
+    def on_end(self, span: ReadableSpan) -> None:
+        seconds = (span.end_time - span.start_time) / 1e9
+        status = "error" if span.status.status_code == StatusCode.ERROR else "ok"
+        attributes = span.attributes or {}
+        name = span.name
+        if name == "request":
+            requests_total.inc(status=status)
+            request_seconds.observe(seconds)
+        elif name.startswith("agent_run ["):
+            agent = name[len("agent_run ["):-1]
+            agent_runs_total.inc(agent=agent, status=status)
+            agent_seconds.observe(seconds, agent=agent)
+        elif name.startswith("execute_tool ") and name != MERGED_TOOLS_SPAN:
+            tool = attributes.get("gen_ai.tool.name") or name[len("execute_tool "):]
+            tool_calls_total.inc(tool=tool, status=status)
+            tool_seconds.observe(seconds, tool=tool)
+            if "tool.result_bytes" in attributes:
+                tool_result_bytes.observe(attributes["tool.result_bytes"], tool=tool)
+        elif name.startswith("llm "):
+            model = attributes.get("llm.model", name[len("llm "):])
+            llm_calls_total.inc(model=model, agent=attributes.get("llm.agent", ""), status=status)
+            llm_seconds.observe(seconds, model=model)
+            if "llm.queue_wait_ms" in attributes:
+                llm_queue_seconds.observe(attributes["llm.queue_wait_ms"] / 1000, model=model)
+            if "llm.prompt_tokens" in attributes:
+                llm_prompt_tokens.observe(attributes["llm.prompt_tokens"], model=model)
+            if "llm.completion_tokens" in attributes:
+                llm_completion_tokens.observe(attributes["llm.completion_tokens"], model=model)
+        elif name == "sql":
+            sql_queries_total.inc(status=status)
+            sql_seconds.observe(seconds)
+            if "db.rows" in attributes:
+                sql_rows.observe(attributes["db.rows"])
+                sql_result_bytes.observe(attributes["db.result_bytes"])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are too frequent to log
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serves the metrics at /metrics from a background thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics on port %d", server.server_address[1])
+    return server
+
+
+def write_snapshot(path: str) -> None:
+    """Writes the current metrics to `path`, replacing it atomically."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(registry.exposition())
+    os.replace(temporary, path)
+
+
+def _write_snapshots(path: str, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot(path)
+        except OSError as e:
+            logger.warning("Could not write the metrics snapshot to %s: %s", path, e)
+
+
+_span_processor = MetricsSpanProcessor()
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure_metrics(port: Optional[str] = None, snapshot_file: Optional[str] = None) -> None:
+    """
+    Starts measuring, and exposes the metrics on METRICS_PORT and/or in
+    METRICS_SNAPSHOT_FILE. Only the first call has an effect.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+    tracing.get_provider().add_span_processor(_span_processor)
+    port = port or METRICS_PORT
+    snapshot_file = snapshot_file or METRICS_SNAPSHOT_FILE
+    if port:
+        try:
+            start_metrics_server(int(port))
+        except (OSError, ValueError) as e:
+            # e.g. another Streamlit session process already serves them
+            logger.warning("Could not serve metrics on port %s: %s", port, e)
+    if snapshot_file:
+        threading.Thread(
+            target=_write_snapshots, args=(snapshot_file, METRICS_SNAPSHOT_INTERVAL),
+            name="metrics-snapshot", daemon=True,
+        ).start()
+
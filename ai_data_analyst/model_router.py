@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest
+from google.genai import types
+
+FAST_MODEL = "gemini-2.5-flash"
+STRONG_MODEL = "gemini-2.5-pro"
+
+ORCHESTRATOR = "ai_data_analyst_orchestrator"
+PLANNER = "planner_agent"
+ANALYSIS = "descriptive_analyzer_agent_tool"
+
+# Per complexity: the model override per agent (agents not listed keep their
+# configured model) and the agents that are skipped entirely.
+ROUTES = {
+    "simple": {"models": {ORCHESTRATOR: FAST_MODEL, PLANNER: FAST_MODEL}, "skip_agents": [ANALYSIS]},
+    "standard": {"models": {PLANNER: FAST_MODEL}, "skip_agents": []},
+    "complex": {"models": {}, "skip_agents": []},
+}
+
+# Session state key holding the decision for the current request. Sub-agents
+# called as tools receive a copy of the orchestrator's state, so they see it too.
+ROUTING_STATE_KEY = "model_routing"
+
+# Set MODEL_ROUTING=off to always use the configured models
+ROUTING_ENABLED = os.environ.get("MODEL_ROUTING", "on").lower() not in ("0", "off", "false", "no")
+
+# Word stems (Portuguese and English) of requests that need multi-step analysis
+_COMPLEX_STEMS = (
+    "correla", "relação", "relacao", "associa", "tendênc", "tendenc", "evoluç", "evoluc", "ao longo",
+    "impact", "influên", "influen", "fator", "regress", "distribui", "compar", "diferen", "desigual",
+    "por que", "porque", "explique", "explain", "why", "anális", "analis", "trend", "over time", "versus",
+)
+# Stems of direct lookups
+_LOOKUP_STEMS = ("quantos", "quantas", "how many", "total de", "número de", "numero de", "count", "qual o", "qual a")
+_YEAR_PATTERN = re.compile(r"\b(?:19|20)\d{2}\b")
+
+SIMPLE_MAX_SCORE = 0
+COMPLEX_MIN_SCORE = 4
+
+logger = logging.getLogger(__name__)
+
+# perf_counter at the start of each routed invocation, to log its latency
+_started_at: dict[str, float] = {}
+_started_lock = threading.Lock()
+
+
+@dataclass
+class RoutingDecision:
+    complexity: str
+    score: int
+    reasons: list[str] = field(default_factory=list)
+    models: dict[str, str] = field(default_factory=dict)
+    skip_agents: list[str] = field(default_factory=list)
+
+
+def classify_request(text: str) -> RoutingDecision:
+    """
+    Classifies a request as simple, standard or complex with keyword and length heuristics.
+
+    Args:
+        text: The user's request.
+
+    Returns:
+        The decision with the model overrides and skipped agents of its complexity.
+    """
+    lowered = text.lower()
+    score = 0
+    reasons = []
+
+    complex_hits = sorted({stem for stem in _COMPLEX_STEMS if stem in lowered})
+    if complex_hits:
+        score += 2 * len(complex_hits)
+        reasons.append(f"analysis terms: {', '.join(complex_hits)}")
+    years = set(_YEAR_PATTERN.findall(lowered))
+    if len(years) >= 2:
+        score += 2
+        reasons.append(f"{len(years)} years")
+    words = len(lowered.split())
+    if words > 25:
+        score += 1 if words <= 50 else 2
+        reasons.append(f"{words} words")
+    if lowered.count(" por ") + lowered.count(" by ") >= 2:
+        score += 1
+        reasons.append("several breakdowns")
+    if any(stem in lowered for stem in _LOOKUP_STEMS):
+        score -= 1
+        reasons.append("lookup question")
+
+    if score <= SIMPLE_MAX_SCORE:
+        complexity = "simple"
+    elif score >= COMPLEX_MIN_SCORE:
+        complexity = "complex"
+    else:
+        complexity = "standard"
+    route = ROUTES[complexity]
+    return RoutingDecision(
+        complexity=complexity,
+        score=score,
+        reasons=reasons,
+        models=dict(route["models"]),
+        skip_agents=list(route["skip_agents"]),
+    )
+
+
+def request_text(content: Optional[types.Content]) -> str:
+    """The user's request; the app sends it as JSON with a `user_request` key."""
+    if not content or not content.parts:
+        return ""
+    text = "".join(part.text or "" for part in content.parts)
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(payload, dict) and isinstance(payload.get("user_request"), str):
+        return payload["user_request"]
+    return text
+
+
+def route_request(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Orchestrator before_agent_callback: classifies the request and stores the decision in state."""
+    if not ROUTING_ENABLED:
+        return None
+    decision = classify_request(request_text(callback_context.user_content))
+    callback_context.state[ROUTING_STATE_KEY] = asdict(decision)
+    with _started_lock:
+        _started_at[callback_context.invocation_id] = time.perf_counter()
+    logger.info(
+        "Model routing: %s request (score %d; %s); models %s; skipping %s",
+        decision.complexity, decision.score, "; ".join(decision.reasons) or "no signals",
+        decision.models or "as configured", decision.skip_agents or "nothing",
+    )
+    return None
+
+
+def log_routed_latency(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Orchestrator after_agent_callback: logs the latency of the request per complexity."""
+    with _started_lock:
+        started_at = _started_at.pop(callback_context.invocation_id, None)
+    decision = callback_context.state.get(ROUTING_STATE_KEY)
+    if started_at is not None and decision:
+        logger.info(
+            "Model routing: %s request finished in %.1fs",
+            decision["complexity"], time.perf_counter() - started_at,
+        )
+    return None
+
+
+def apply_model_route(callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+    """before_model_callback: switches the request to the model routed for this agent."""
+    decision = callback_context.state.get(ROUTING_STATE_KEY)
+    if not decision:
+        return None
+    model = decision["models"].get(callback_context.agent_name)
+    if model and model != llm_request.model:
+        logger.debug("Model routing: %s uses %s instead of %s", callback_context.agent_name, model, llm_request.model)
+        llm_request.model = model
+    return None
+
+
+def skip_if_routed(callback_context: CallbackContext) -> Optional[types.Content]:
+    """before_agent_callback for optional agents: answers with an empty result when the route skips them."""
+    decision = callback_context.state.get(ROUTING_STATE_KEY)
+    if not decision or callback_context.agent_name not in decision["skip_agents"]:
+        return None
+    logger.info("Model routing: skipping %s for a %s request", callback_context.agent_name, decision["complexity"])
+    skipped = {
+        "results": [{"analysis_type": "skipped", "reason": "Not needed for a simple lookup request."}],
+        "suggestions": [],
+    }
+    return types.Content(role="model", parts=[types.Part(text=json.dumps(skipped))])
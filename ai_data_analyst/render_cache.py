@@ -0,0 +1,215 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional, Union
+
+import pandas as pd
+
+from .tools import datasets
+from .tools.chart_filters import ChartFilterIndex
+
+# Regex to find vega-lite or JSON code blocks and the text around them
+CHART_BLOCK_PATTERN = re.compile(r'(.*?)(```(?:json|vega-lite)\n(.*?)\n```)', re.DOTALL)
+
+# Bounds for the process-wide cache. Streamlit sessions share the same process,
+# so the cache is shared by every open browser tab.
+MAX_CACHED_MESSAGES = 512
+MAX_CACHED_BYTES = 128 * 1024 * 1024
+
+
+@dataclass
+class TextSegment:
+    """A markdown fragment of a message."""
+    text: str
+
+
+@dataclass
+class ChartSegment:
+    """A chart block of a message, parsed and ready to be rendered."""
+    index: int
+    raw_json: str
+    chart_json: Optional[dict[str, Any]] = None
+    chart_spec: dict[str, Any] = field(default_factory=dict)
+    filterable_columns: list[str] = field(default_factory=list)
+    # Only built for charts with filterable columns and embedded data
+    data: Optional[pd.DataFrame] = None
+    spec_without_data: Optional[dict[str, Any]] = None
+    filter_index: Optional[ChartFilterIndex] = None
+    # The stored query result the chart's data was read from, if any
+    dataset: Optional[str] = None
+    parse_error: Optional[str] = None
+    prepare_error: Optional[str] = None
+
+    @property
+    def is_filterable(self) -> bool:
+        return self.filter_index is not None and bool(self.filterable_columns)
+
+
+Segment = Union[TextSegment, ChartSegment]
+
+
+@dataclass
+class PreparedMessage:
+    """The parsed form of a message: its segments in display order."""
+    segments: tuple[Segment, ...]
+    nbytes: int
+
+
+def content_key(message_text: str) -> str:
+    """Returns the cache key for a message: a hash of its content."""
+    return hashlib.blake2b(message_text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def _prepare_chart(index: int, chart_json_str: str) -> ChartSegment:
+    """Parses a chart block and builds its DataFrame when it can be filtered."""
+    segment = ChartSegment(index=index, raw_json=chart_json_str)
+    try:
+        chart_json = json.loads(chart_json_str.strip())
+    except json.JSONDecodeError as e:
+        segment.parse_error = str(e)
+        return segment
+
+    segment.chart_json = chart_json
+    try:
+        # Determine if the JSON is a raw Vega-Lite spec or our custom wrapper
+        if "chart_spec" in chart_json:
+            # It's the wrapper format
+            segment.chart_spec = chart_json.get("chart_spec", {})
+            segment.filterable_columns = chart_json.get("filterable_columns", [])
+        else:
+            # Assume it's a raw Vega-Lite spec. No filtering for raw specs.
+            segment.chart_spec = chart_json
+
+        data = segment.chart_spec.get("data")
+        if isinstance(data, dict) and "dataset" in data:
+            # Charts of large results refer to the stored result instead of embedding it
+            segment.dataset = data["dataset"]
+            segment.chart_spec = datasets.inline_dataset(segment.chart_spec)
+
+        if segment.chart_spec and segment.filterable_columns:
+            segment.data = pd.DataFrame(segment.chart_spec.get("data", {}).get("values", []))
+            # To avoid ambiguity when providing a filtered dataframe,
+            # keep a spec without the original data.
+            segment.spec_without_data = {k: v for k, v in segment.chart_spec.items() if k != "data"}
+            if not segment.data.empty:
+                segment.filter_index = ChartFilterIndex(segment.data, segment.filterable_columns)
+    except Exception as e:
+        segment.prepare_error = str(e)
+    return segment
+
+
+def _estimate_nbytes(message_text: str, segments: tuple[Segment, ...]) -> int:
+    """Approximates the memory held by a prepared message."""
+    nbytes = len(message_text)
+    for segment in segments:
+        if isinstance(segment, ChartSegment):
+            nbytes += len(segment.raw_json)
+            if segment.dataset is not None:
+                nbytes += len(json.dumps(segment.chart_spec.get("data")))
+            if segment.data is not None:
+                nbytes += int(segment.data.memory_usage(deep=True).sum())
+            if segment.filter_index is not None:
+                nbytes += segment.filter_index.nbytes
+    return nbytes
+
+
+def parse_message_content(message_text: str) -> PreparedMessage:
+    """
+    Splits a message into text and chart segments, in display order.
+
+    Args:
+        message_text: The raw message content (markdown with optional chart code blocks).
+
+    Returns:
+        A PreparedMessage with the segments to render.
+    """
+    segments: list[Segment] = []
+    last_end = 0
+    for i, match in enumerate(CHART_BLOCK_PATTERN.finditer(message_text)):
+        pre_text, _, chart_json_str = match.groups()
+        if pre_text.strip():
+            segments.append(TextSegment(pre_text))
+        segments.append(_prepare_chart(i, chart_json_str))
+        last_end = match.end()
+
+    if not segments:
+        # If no charts are found, the whole message is a single text segment
+        segments.append(TextSegment(message_text))
+    else:
+        remaining_text = message_text[last_end:].strip()
+        if remaining_text:
+            segments.append(TextSegment(remaining_text))
+
+    segments_tuple = tuple(segments)
+    return PreparedMessage(segments=segments_tuple, nbytes=_estimate_nbytes(message_text, segments_tuple))
+
+
+class RenderCache:
+    """A thread-safe LRU cache of prepared messages, bounded by entries and bytes."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_MESSAGES, max_bytes: int = MAX_CACHED_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, PreparedMessage] = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_prepare(self, message_text: str) -> PreparedMessage:
+        """Returns the prepared message, parsing it only if it is not cached."""
+        key = content_key(message_text)
+        with self._lock:
+            prepared = self._entries.get(key)
+            if prepared is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return prepared
+            self.misses += 1
+
+        # Parse outside the lock so other sessions are not blocked by a large message
+        prepared = parse_message_content(message_text)
+        if prepared.nbytes > self.max_bytes:
+            return prepared
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = prepared
+                self._nbytes += prepared.nbytes
+                self._evict()
+        return prepared
+
+    def _evict(self) -> None:
+        """Drops least recently used entries until the cache is within its bounds."""
+        while self._entries and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self) -> dict[str, int]:
+        """Returns hit/miss/eviction counters and current usage."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+render_cache = RenderCache()
+
+
+def prepare_message(message_text: str) -> PreparedMessage:
+    """Returns the prepared form of a message from the shared render cache."""
+    return render_cache.get_or_prepare(message_text)
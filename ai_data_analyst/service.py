@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from google.adk.agents import BaseAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.runners import Runner
+from pydantic import BaseModel
+
+from . import event_stream, tracing
+from .event_stream import StreamUpdate
+from .session_service import session_service
+
+logger = logging.getLogger(__name__)
+
+# The chat's app name, so the service and the Streamlit app share agent sessions
+APP_NAME = "ai_data_analyst_app"
+# Runs executed at once by this process; each holds a thread while the agents work
+SERVICE_WORKERS = int(os.environ.get("AGENT_SERVICE_WORKERS", "4"))
+# Runs waiting for a worker; beyond this, new questions are refused with 503 until the queue drains
+SERVICE_MAX_QUEUED = int(os.environ.get("AGENT_SERVICE_MAX_QUEUED", "100"))
+# Finished runs kept for their result and events
+MAX_FINISHED_RUNS = 1000
+# A comment is sent on idle event streams so proxies do not close them
+KEEPALIVE_SECONDS = 15
+# Identifies this process in responses; clients keep a session on the node that holds it
+NODE_ID = os.environ.get("AGENT_SERVICE_NODE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class RunRequest(BaseModel):
+    question: str
+    data_context: str = ""
+    session_id: Optional[str] = None
+    user_id: str = "local_user"
+
+
+class Run:
+    """A question being answered: its status, the updates streamed so far and, once done, the answer."""
+
+    def __init__(self, request: RunRequest):
+        self.id = uuid.uuid4().hex
+        self.session_id = request.session_id or str(uuid.uuid4())
+        self.user_id = request.user_id
+        self.question = request.question
+        self.data_context = request.data_context
+        self.status = "queued"  # then "running", and "done" or "failed"
+        self.answer = ""
+        self.error: Optional[str] = None
+        self.trace_id: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.updates: list[StreamUpdate] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, update: StreamUpdate) -> None:
+        self.updates.append(update)
+        if update.kind == "final_text":
+            self.answer += update.text
+        self._notify()
+
+    def finish(self, error: Optional[str] = None) -> None:
+        self.status = "failed" if error else "done"
+        self.error = error
+        self.finished_at = time.time()
+        self._notify()
+
+    async def follow(self, start: int = 0) -> AsyncIterator[tuple[int, Optional[StreamUpdate]]]:
+        """
+        Yields the updates from number `start` on as they are published, until
+        the run finishes. Yields (index, None) when nothing happened for a while.
+        """
+        index = start
+        while True:
+            changed = self._changed
+            while index < len(self.updates):
+                yield index, self.updates[index]
+                index += 1
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield index, None
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "answer": self.answer,
+            "error": self.error,
+            "trace_id": self.trace_id,
+            "node": NODE_ID,
+            "queued_seconds": round((self.started_at or time.time()) - self.submitted_at, 3),
+            "seconds": round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+        }
+
+
+class RunManager:
+    """
+    Queues submitted runs and executes them with a fixed number of async
+    workers. The agents of a run execute on a worker thread with their own event
+    loop, so blocking tools (database queries) never stall the server, and the
+    runs of one session are executed one at a time, in order: a run only reaches
+    the workers once the previous run of its session has finished, so a busy
+    session never holds a worker that could serve another one.
+    """
+
+    def __init__(self, runner: Runner, workers: int = SERVICE_WORKERS, max_queued: int = SERVICE_MAX_QUEUED):
+        self.runner = runner
+        self.workers = workers
+        self.max_queued = max_queued
+        self.queued = 0
+        self.runs: OrderedDict[str, Run] = OrderedDict()
+        # Runs ready to execute: the oldest queued run of each session that has none running
+        self._queue: asyncio.Queue[Run] = asyncio.Queue()
+        # Per session: its queued and running runs, in order
+        self._session_runs: dict[str, deque[Run]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-run")
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, request: RunRequest) -> Run:
+        """Queues a run; raises asyncio.QueueFull when the service is saturated."""
+        if self.queued >= self.max_queued:
+            raise asyncio.QueueFull
+        run = Run(request)
+        self.runs[run.id] = run
+        self.queued += 1
+        session_runs = self._session_runs.setdefault(run.session_id, deque())
+        session_runs.append(run)
+        if len(session_runs) == 1:
+            self._queue.put_nowait(run)
+        self._forget_finished()
+        return run
+
+    def _forget_finished(self) -> None:
+        finished = [run_id for run_id, run in self.runs.items() if run.finished]
+        for run_id in finished[:max(0, len(finished) - MAX_FINISHED_RUNS)]:
+            del self.runs[run_id]
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            run = await self._queue.get()
+            self.queued -= 1
+            try:
+                run.status, run.started_at = "running", time.time()
+                error = await loop.run_in_executor(self._executor, self._execute, run, loop)
+                run.finish(error)
+            except Exception as e:
+                logger.exception("Run %s could not be executed", run.id)
+                run.finish(str(e))
+            finally:
+                session_runs = self._session_runs[run.session_id]
+                session_runs.popleft()
+                if session_runs:
+                    # The session's next run is ready now
+                    self._queue.put_nowait(session_runs[0])
+                else:
+                    del self._session_runs[run.session_id]
+                self._queue.task_done()
+
+    def _execute(self, run: Run, loop: asyncio.AbstractEventLoop) -> Optional[str]:
+        """Runs the agents on a worker thread; returns the error, if the run failed."""
+
+        def publish(update: StreamUpdate) -> None:
+            loop.call_soon_threadsafe(run.publish, update)
+
+        with tracing.request_span(run.question, session_id=run.session_id) as span:
+            run.trace_id = tracing.trace_id_of(span)
+            try:
+                asyncio.run(self._stream(run, publish))
+            except Exception as e:
+                logger.warning("Run %s failed: %s", run.id, e)
+                tracing.record_error(span, e)
+                return str(e) or type(e).__name__
+        return None
+
+    async def _stream(self, run: Run, publish) -> None:
+        session_service = self.runner.session_service
+        if not await session_service.get_session(app_name=APP_NAME, user_id=run.user_id, session_id=run.session_id):
+            await session_service.create_session(app_name=APP_NAME, user_id=run.user_id, session_id=run.session_id)
+        async for event in self.runner.run_async(
+            user_id=run.user_id,
+            session_id=run.session_id,
+            new_message=event_stream.user_message(run.question, run.data_context),
+            run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+        ):
+            for update in event_stream.interpret_event(event):
+                publish(update)
+
+
+def _sse(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def create_app(agent: Optional[BaseAgent] = None, session_store=None, workers: int = SERVICE_WORKERS) -> FastAPI:
+    """
+    The agent service: questions are submitted with POST /runs, followed with
+    GET /runs/{id}/events (server-sent events) and fetched with GET /runs/{id}.
+    """
+    if agent is None:
+        from .agent import root_agent as agent
+    if session_store is None:
+        session_service.initialize()
+        session_store = session_service
+    manager = RunManager(Runner(agent=agent, app_name=APP_NAME, session_service=session_store), workers=workers)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        manager.start()
+        yield
+        await manager.stop()
+
+    app = FastAPI(title="AI Data Analyst agents", lifespan=lifespan)
+    app.state.manager = manager
+
+    def _get_run(run_id: str) -> Run:
+        run = manager.runs.get(run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail=f"Unknown run: {run_id}")
+        return run
+
+    @app.post("/runs", status_code=202)
+    async def submit_run(request: RunRequest):
+        try:
+            run = manager.submit(request)
+        except asyncio.QueueFull as e:
+            raise HTTPException(
+                status_code=503, detail="Too many questions queued.", headers={"Retry-After": "5"}
+            ) from e
+        return run.to_dict()
+
+    @app.get("/runs/{run_id}")
+    async def get_run(run_id: str):
+        return _get_run(run_id).to_dict()
+
+    @app.get("/runs/{run_id}/events")
+    async def run_events(run_id: str, last_event_id: Optional[str] = Header(None)):
+        run = _get_run(run_id)
+        # A reconnecting client resumes after the last update it received
+        start = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+
+        async def events():
+            async for index, update in run.follow(start):
+                if update is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield _sse(update.kind, asdict(update), index)
+            yield _sse("end", {"status": run.status, "error": run.error, "trace_id": run.trace_id})
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    @app.get("/runs/{run_id}/trace")
+    async def run_trace(run_id: str):
+        run = _get_run(run_id)
+        return {"trace_id": run.trace_id, "spans": tracing.get_trace(run.trace_id) if run.trace_id else []}
+
+    @app.get("/healthz")
+    async def health():
+        return {"node": NODE_ID, "workers": manager.workers, "queued": manager.queued}
+
+    @app.middleware("http")
+    async def add_node_header(request, call_next):
+        response = await call_next(request)
+        response.headers["X-Agent-Node"] = NODE_ID
+        return response
+
+    return app
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(
+        prog="python -m ai_data_analyst.service", description="Serves the agents over HTTP."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Runs executed at once")
+    args = parser.parse_args(argv)
+    # Runs live in this process' memory, so it is served by a single uvicorn process;
+    # scale out by starting more services and listing them all in AGENT_SERVICE_URL
+    uvicorn.run(create_app(workers=args.workers), host=args.host, port=args.port, log_config=None)
+
+
+if __name__ == "__main__":
+    main()
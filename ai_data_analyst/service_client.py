@@ -0,0 +1,82 @@
+import hashlib
+import os
+from collections.abc import Iterator
+from typing import Any, Optional
+
+import httpx
+from httpx_sse import connect_sse
+
+from .event_stream import StreamUpdate
+
+# The agent services the app sends questions to, comma separated; unset to run the agents in the app
+AGENT_SERVICE_URL = os.environ.get("AGENT_SERVICE_URL", "")
+# Seconds to wait for the service to accept a question or send the next event
+SERVICE_TIMEOUT_SECONDS = 300
+
+
+class AgentServiceError(RuntimeError):
+    """The service refused the question, or the run failed."""
+
+
+class AgentServiceClient:
+    """
+    Sends questions to the agent services and follows their runs. With several
+    services, a chat is always sent to the same one (chosen by hashing its
+    session id), since a service keeps the sessions and runs it executed.
+    """
+
+    def __init__(self, base_urls: list[str], http_client: Optional[httpx.Client] = None):
+        if not base_urls:
+            raise ValueError("No agent service URL given.")
+        self.base_urls = [url.rstrip("/") for url in base_urls]
+        self._http = http_client or httpx.Client(timeout=SERVICE_TIMEOUT_SECONDS)
+        self._run_urls: dict[str, str] = {}
+
+    @classmethod
+    def from_env(cls) -> Optional["AgentServiceClient"]:
+        urls = [url.strip() for url in AGENT_SERVICE_URL.split(",") if url.strip()]
+        return cls(urls) if urls else None
+
+    def url_for(self, session_id: str) -> str:
+        """The service that owns a session (rendezvous hashing: adding a service moves few sessions)."""
+        return max(
+            self.base_urls,
+            key=lambda url: hashlib.blake2b(f"{url}|{session_id}".encode(), digest_size=8).digest(),
+        )
+
+    def submit(self, question: str, data_context: str, session_id: str, user_id: str) -> str:
+        """Queues a question in the chat's session; returns the run id."""
+        base_url = self.url_for(session_id)
+        response = self._http.post(f"{base_url}/runs", json={
+            "question": question, "data_context": data_context, "session_id": session_id, "user_id": user_id,
+        })
+        if response.status_code == 503:
+            raise AgentServiceError("The agent service is busy; please try again in a moment.")
+        response.raise_for_status()
+        run_id = response.json()["run_id"]
+        self._run_urls[run_id] = base_url
+        return run_id
+
+    def updates(self, run_id: str) -> Iterator[StreamUpdate]:
+        """Yields the run's updates as the service streams them; raises AgentServiceError if the run fails."""
+        with connect_sse(self._http, "GET", f"{self._run_urls[run_id]}/runs/{run_id}/events") as source:
+            for sse in source.iter_sse():
+                data = sse.json()
+                if sse.event == "end":
+                    if data["status"] == "failed":
+                        raise AgentServiceError(data["error"])
+                    return
+                yield StreamUpdate(kind=sse.event, step=data.get("step"), text=data.get("text", ""))
+        raise AgentServiceError("The agent service closed the stream before the run finished.")
+
+    def result(self, run_id: str) -> dict[str, Any]:
+        response = self._http.get(f"{self._run_urls[run_id]}/runs/{run_id}")
+        response.raise_for_status()
+        return response.json()
+
+    def trace(self, run_id: str) -> tuple[Optional[str], list[dict[str, Any]]]:
+        """The run's trace id and spans, as recorded by the service."""
+        response = self._http.get(f"{self._run_urls[run_id]}/runs/{run_id}/trace")
+        response.raise_for_status()
+        body = response.json()
+        return body["trace_id"], body["spans"]
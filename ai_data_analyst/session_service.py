@@ -0,0 +1,341 @@
+import json
+import logging
+import time
+import uuid
+from typing import Any, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+from . import config_manager
+from .chat_storage import compress, decompress
+
+# Events of the most recent invocations loaded by get_session when no config is
+# given. Older events stay in the database; cutting at an invocation boundary
+# never separates a function call from its response.
+DEFAULT_LOADED_INVOCATIONS = 20
+
+logger = logging.getLogger(__name__)
+
+
+def _dump(value: Any) -> bytes:
+    # State values written by the agents are strings; anything else that JSON
+    # cannot represent is stored as its string form rather than failing the turn.
+    return compress(json.dumps(value, ensure_ascii=False, default=str))
+
+
+def _load_state(data: Optional[bytes]) -> dict[str, Any]:
+    return json.loads(decompress(data)) if data else {}
+
+
+class SqliteSessionService(BaseSessionService):
+    """
+    An ADK session service persisted in the local SQLite database.
+
+    Session, user and app state are stored as compressed JSON, with the same
+    `app:`/`user:`/`temp:` prefix semantics as InMemorySessionService. Session
+    state is kept one row per key, so an event only writes the keys its delta
+    changes instead of the whole state, which holds the large outputs stored by
+    `artifacts`; a key set to None keeps a None value, as in ADK's own services.
+    get_session loads the whole session state. Events are stored one row each
+    as compressed JSON and only the most recent invocations are loaded, so
+    resuming a long chat stays cheap.
+
+    The service keeps no per-session state in memory, so a single instance can
+    be shared by every Streamlit session of the process.
+    """
+
+    def __init__(self, db_file: Optional[str] = None, loaded_invocations: Optional[int] = DEFAULT_LOADED_INVOCATIONS):
+        """
+        Args:
+            db_file: SQLite file. Defaults to config_manager.DB_FILE at call time.
+            loaded_invocations: Number of recent invocations whose events get_session
+                loads by default. None loads every event.
+        """
+        self.db_file = db_file
+        self.loaded_invocations = loaded_invocations
+
+    def _connection(self, operation: str):
+        return config_manager.connection_manager.connection(f"session_service.{operation}", db_file=self.db_file)
+
+    def initialize(self) -> None:
+        """Creates the session tables if they don't exist."""
+        with self._connection("initialize") as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS adk_sessions (
+                    app_name TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    state BLOB,
+                    create_time REAL NOT NULL,
+                    update_time REAL NOT NULL,
+                    PRIMARY KEY (app_name, user_id, session_id)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS adk_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    app_name TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    invocation_id TEXT,
+                    timestamp REAL NOT NULL,
+                    event BLOB NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_adk_events_session ON adk_events (app_name, user_id, session_id, id)"
+            )
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS adk_session_state (
+                    app_name TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    PRIMARY KEY (app_name, user_id, session_id, key)
+                )
+            """)
+            # Sessions stored before, with their whole state in adk_sessions.state
+            for row in conn.execute(
+                "SELECT app_name, user_id, session_id, state FROM adk_sessions WHERE state IS NOT NULL"
+            ).fetchall():
+                key = (row["app_name"], row["user_id"], row["session_id"])
+                self._write_state(conn, key, _load_state(row["state"]))
+                conn.execute(
+                    "UPDATE adk_sessions SET state = NULL WHERE app_name = ? AND user_id = ? AND session_id = ?", key
+                )
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS adk_app_state (
+                    app_name TEXT PRIMARY KEY,
+                    state BLOB
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS adk_user_state (
+                    app_name TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    state BLOB,
+                    PRIMARY KEY (app_name, user_id)
+                )
+            """)
+            conn.commit()
+
+    async def create_session(
+            self,
+            *,
+            app_name: str,
+            user_id: str,
+            state: Optional[dict[str, Any]] = None,
+            session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        now = time.time()
+        with self._connection("create_session") as conn:
+            conn.execute(
+                """
+                INSERT INTO adk_sessions (app_name, user_id, session_id, create_time, update_time)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (app_name, user_id, session_id, now, now)
+            )
+            self._write_state(conn, (app_name, user_id, session_id), state or {})
+            conn.commit()
+            session = Session(
+                app_name=app_name, user_id=user_id, id=session_id, state=state or {}, last_update_time=now
+            )
+            return self._merge_state(conn, session)
+
+    async def get_session(
+            self,
+            *,
+            app_name: str,
+            user_id: str,
+            session_id: str,
+            config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        with self._connection("get_session") as conn:
+            key = (app_name, user_id, session_id)
+            row = conn.execute(
+                "SELECT update_time FROM adk_sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            state_rows = conn.execute(
+                "SELECT key, value FROM adk_session_state WHERE app_name = ? AND user_id = ? AND session_id = ?", key
+            ).fetchall()
+            session = Session(
+                app_name=app_name,
+                user_id=user_id,
+                id=session_id,
+                state={state_row["key"]: json.loads(decompress(state_row["value"])) for state_row in state_rows},
+                events=self._load_events(conn, app_name, user_id, session_id, config),
+                last_update_time=row["update_time"],
+            )
+            return self._merge_state(conn, session)
+
+    def _load_events(self, conn, app_name, user_id, session_id, config):
+        key = (app_name, user_id, session_id)
+        if config and config.num_recent_events:
+            rows = conn.execute(
+                """
+                SELECT event FROM (
+                    SELECT id, event FROM adk_events
+                    WHERE app_name = ? AND user_id = ? AND session_id = ?
+                    ORDER BY id DESC LIMIT ?
+                ) ORDER BY id
+                """,
+                (*key, config.num_recent_events)
+            ).fetchall()
+        elif config and config.after_timestamp:
+            rows = conn.execute(
+                """
+                SELECT event FROM adk_events
+                WHERE app_name = ? AND user_id = ? AND session_id = ? AND timestamp >= ?
+                ORDER BY id
+                """,
+                (*key, config.after_timestamp)
+            ).fetchall()
+        elif self.loaded_invocations is not None:
+            rows = conn.execute(
+                """
+                SELECT event FROM adk_events
+                WHERE app_name = ?1 AND user_id = ?2 AND session_id = ?3 AND id >= (
+                    SELECT COALESCE(MIN(first_id), 0) FROM (
+                        SELECT MIN(id) AS first_id FROM adk_events
+                        WHERE app_name = ?1 AND user_id = ?2 AND session_id = ?3
+                        GROUP BY invocation_id
+                        ORDER BY first_id DESC LIMIT ?4
+                    )
+                )
+                ORDER BY id
+                """,
+                (*key, self.loaded_invocations)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT event FROM adk_events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY id",
+                key
+            ).fetchall()
+        return [Event.model_validate_json(decompress(row["event"])) for row in rows]
+
+    def _merge_state(self, conn, session: Session) -> Session:
+        """Adds the app and user state to the session state, with their prefixes."""
+        row = conn.execute("SELECT state FROM adk_app_state WHERE app_name = ?", (session.app_name,)).fetchone()
+        for key, value in _load_state(row["state"] if row else None).items():
+            session.state[State.APP_PREFIX + key] = value
+        row = conn.execute(
+            "SELECT state FROM adk_user_state WHERE app_name = ? AND user_id = ?", (session.app_name, session.user_id)
+        ).fetchone()
+        for key, value in _load_state(row["state"] if row else None).items():
+            session.state[State.USER_PREFIX + key] = value
+        return session
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        with self._connection("list_sessions") as conn:
+            rows = conn.execute(
+                """
+                SELECT session_id, update_time FROM adk_sessions
+                WHERE app_name = ? AND user_id = ? ORDER BY update_time DESC
+                """,
+                (app_name, user_id)
+            ).fetchall()
+        return ListSessionsResponse(sessions=[
+            Session(app_name=app_name, user_id=user_id, id=row["session_id"], last_update_time=row["update_time"])
+            for row in rows
+        ])
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        with self._connection("delete_session") as conn:
+            key = (app_name, user_id, session_id)
+            conn.execute("DELETE FROM adk_events WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+            conn.execute("DELETE FROM adk_session_state WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+            conn.execute("DELETE FROM adk_sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+            conn.commit()
+
+    def has_session(self, *, app_name: str, user_id: str, session_id: str) -> bool:
+        """Checks whether a session exists without loading its state or events."""
+        with self._connection("has_session") as conn:
+            return conn.execute(
+                "SELECT 1 FROM adk_sessions WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (app_name, user_id, session_id)
+            ).fetchone() is not None
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        # Partial (streamed) events are not persisted, like in the base class
+        await super().append_event(session=session, event=event)
+        if event.partial:
+            return event
+        session.last_update_time = event.timestamp
+
+        session_delta, app_delta, user_delta = {}, {}, {}
+        if event.actions and event.actions.state_delta:
+            for key, value in event.actions.state_delta.items():
+                if key.startswith(State.APP_PREFIX):
+                    app_delta[key.removeprefix(State.APP_PREFIX)] = value
+                elif key.startswith(State.USER_PREFIX):
+                    user_delta[key.removeprefix(State.USER_PREFIX)] = value
+                elif not key.startswith(State.TEMP_PREFIX):
+                    session_delta[key] = value
+
+        key = (session.app_name, session.user_id, session.id)
+        with self._connection("append_event") as conn:
+            # Take the write lock first so concurrent app and user deltas are merged, not lost
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT 1 FROM adk_sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key
+            ).fetchone()
+            if row is None:
+                conn.rollback()
+                logger.warning("Failed to append event to session %s: session not found", session.id)
+                return event
+            self._write_state(conn, key, session_delta)
+            if app_delta:
+                self._merge_shared_state(conn, "adk_app_state", {"app_name": session.app_name}, app_delta)
+            if user_delta:
+                self._merge_shared_state(
+                    conn, "adk_user_state", {"app_name": session.app_name, "user_id": session.user_id}, user_delta
+                )
+            conn.execute(
+                """
+                INSERT INTO adk_events (app_name, user_id, session_id, invocation_id, timestamp, event)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (*key, event.invocation_id, event.timestamp, compress(event.model_dump_json(exclude_none=True)))
+            )
+            conn.execute(
+                "UPDATE adk_sessions SET update_time = ? WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (event.timestamp, *key)
+            )
+            conn.commit()
+        return event
+
+    @staticmethod
+    def _write_state(conn, key, delta: dict[str, Any]) -> None:
+        """Writes the changed keys of a session's state; None is stored as a JSON null."""
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO adk_session_state (app_name, user_id, session_id, key, value)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(*key, name, _dump(value)) for name, value in delta.items()]
+        )
+
+    @staticmethod
+    def _merge_shared_state(conn, table: str, key: dict[str, str], delta: dict[str, Any]) -> None:
+        where = " AND ".join(f"{column} = ?" for column in key)
+        row = conn.execute(f"SELECT state FROM {table} WHERE {where}", tuple(key.values())).fetchone()
+        state = _load_state(row["state"] if row else None)
+        state.update(delta)
+        columns = ", ".join([*key, "state"])
+        placeholders = ", ".join("?" * (len(key) + 1))
+        conn.execute(
+            f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})",
+            (*key.values(), _dump(state))
+        )
+
+
+# Shared by every Streamlit session of the process
+session_service = SqliteSessionService()
@@ -0,0 +1,87 @@
+import contextvars
+import logging
+import os
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+
+from .model_router import request_text
+from .tools import postgres_mcp
+
+# Set SPECULATIVE_PREFETCH=off to disable the prefetch
+SPECULATION_ENABLED = os.environ.get("SPECULATIVE_PREFETCH", "on").lower() not in ("0", "off", "false", "no")
+
+# Candidate queries are cancelled after this long; they must never delay the real ones
+SPECULATIVE_QUERY_TIMEOUT_MS = 3000
+MAX_CANDIDATE_QUERIES = 2
+
+_TABLE_PATTERN = re.compile(r"\*\*Table: `([^`]+)`\*\*")
+_YEAR_PATTERN = re.compile(r"\b(?:19|20)\d{2}\b")
+_COUNT_PATTERN = re.compile(r"\b(?:quant[oa]s|how many|n[úu]mero de|total de)\b", re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculation")
+
+
+def candidate_queries(request: str, schema: str) -> list[str]:
+    """
+    Predicts cheap queries the data agent is likely to run for a request.
+
+    Only counts are predicted: "how many ... in 2023" becomes a row count of the
+    tables whose name contains the year (or of the only table). The data agent is
+    instructed to write counts in the same form, so its query hits the cache.
+
+    Args:
+        request: The user's request.
+        schema: The output of `list_tables_and_schemas`.
+    """
+    if not _COUNT_PATTERN.search(request):
+        return []
+    tables = _TABLE_PATTERN.findall(schema)
+    years = set(_YEAR_PATTERN.findall(request))
+    if years:
+        tables = [table for table in tables if any(year in table for year in years)]
+    elif len(tables) != 1:
+        return []
+    return [f"SELECT COUNT(*) AS total FROM {table}" for table in tables[:MAX_CANDIDATE_QUERIES]]
+
+
+def _speculate(request: str) -> None:
+    started_at = time.perf_counter()
+    try:
+        postgres_mcp.warm_up_connection_pool()
+        schema = postgres_mcp.list_tables_and_schemas()
+        queries = candidate_queries(request, schema)
+        for query in queries:
+            postgres_mcp.prefetch_query(query, timeout_ms=SPECULATIVE_QUERY_TIMEOUT_MS)
+    except Exception as e:
+        # The agents run the same steps themselves, and report the errors
+        logger.info("Speculative prefetch failed: %s", e)
+        return
+    logger.info(
+        "Speculative prefetch done in %.2fs: pool warmed, schema loaded, %d candidate queries",
+        time.perf_counter() - started_at, len(queries),
+    )
+
+
+def start(request: str) -> Optional[Future]:
+    """
+    Starts warming the connection pool, loading the schema and running candidate
+    queries in the background. Everything is cached by postgres_mcp, where the
+    data agent's tool calls pick it up.
+    """
+    if not SPECULATION_ENABLED:
+        return None
+    # In the caller's context, so the prefetch queries are traced under the request
+    return _executor.submit(contextvars.copy_context().run, _speculate, request)
+
+
+def start_speculation(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Orchestrator before_agent_callback: starts the prefetch while the orchestrator plans."""
+    start(request_text(callback_context.user_content))
+    return None
@@ -1,11 +1,11 @@
 from google.adk.agents import LlmAgent
 from google.genai import types
-from ..tools.postgres_mcp import execute_sql, list_tables_and_schemas
+from ..llm_scheduler import scheduled_model
+from ..tracing import record_tool_result
+from ..tools.postgres_mcp import execute_sql, find_correlations_in_db, list_tables_and_schemas
 
 import logging
 
-# Configure logging for the data agent
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 logger.info("Data Agent module loaded.")
 
@@ -28,6 +28,8 @@ You will receive a single JSON object from the Orchestrator Agent containing the
 
 # OUTPUT FORMAT
 - Your final, successful output **MUST** be a single JSON string representing a list of records (an array of objects), where each object is a row from the query result.
+- If `execute_sql` returns the summary of a stored result (an object with a `"dataset"` handle) because the result
+  has too many rows, output that summary object unchanged instead.
 - **DO NOT** output the SQL query itself in the final response.
 - **DO NOT** output any natural language, explanations, apologies, or conversational text. Your only output is the structured JSON data or a structured JSON error.
 - If the request cannot be fulfilled, your output must be a JSON object with a single key: `"error"`, providing a brief explanation. Example: `{{"error": "The requested column 'social_media_usage' does not exist in the provided schema."}}`
@@ -38,17 +40,24 @@ You will receive a single JSON object from the Orchestrator Agent containing the
 3.  **NO INTERPRETATION:** You do not analyze or interpret the data's meaning. Your job is to fetch, clean, and format it. You provide the "what," not the "why."
 4.  **SECURITY FIRST:** Do not execute any part of the user's prompt directly in a query. Your purpose is to translate the *intent* of the request into a safe query written by you.
 5.  **AGGREGATION IS KEY:** You must prioritize in-database aggregation. If the request asks for a comparison, average, count, or any other aggregation, you MUST perform it in the SQL query using `GROUP BY`, `AVG()`, `COUNT()`, etc. Do NOT fetch raw data for aggregation. This is inefficient and will cause the system to fail.
+6.  **CORRELATIONS IN THE DATABASE:** If the request asks for correlations between numeric columns (e.g. scores
+    and questionnaire answers), use the `find_correlations_in_db` tool instead of fetching raw rows. It returns only
+    the strongly correlated pairs. Use `method="spearman"` for ordinal or skewed columns.
+7.  **SIMPLE COUNTS:** To count the rows of a whole table, write exactly
+    `SELECT COUNT(*) AS total FROM <table>`. Results of this form are often prefetched and return immediately.
 
 """
 
 # Create the agent instance
 data_agent = LlmAgent(
     name="data_engineer_agent_tool",
-    model="gemini-2.5-flash",
+    model=scheduled_model("gemini-2.5-flash", agent="data_engineer_agent_tool"),
     instruction=DATA_AGENT_INSTRUCTION,
     description="Generates and executes SQL queries against the database.",
     # Provide the agent with the tool it can use
-    tools=[execute_sql, list_tables_and_schemas],
+    tools=[execute_sql, list_tables_and_schemas, find_correlations_in_db],
+    # Records the size of each query result on its tool span
+    after_tool_callback=record_tool_result,
     output_key="data_engineer_agent_output_key",
     generate_content_config=types.GenerateContentConfig(
         temperature=0.1,
@@ -1,6 +1,8 @@
 from google.adk.agents import LlmAgent
 from google.genai import types
 
+from ..llm_scheduler import scheduled_model
+
 NARRATIVE_AGENT_INSTRUCTION = """
 # ROLE AND GOAL
 You are a specialized "Narrative and Synthesis Agent," an expert data storyteller and science communicator. Your primary goal is to transform complex, structured analytical outputs into a single, coherent, and insightful narrative that directly answers a user's original question. You are the final communication bridge to the user, and your report must be clear, objective, and professionally formatted using advanced Markdown.
@@ -108,7 +110,7 @@ If inputs contain errors or missing data:
 # Create the agent instance
 narrative_agent = LlmAgent(
     name="narrative_agent_tool",
-    model="gemini-2.5-flash",
+    model=scheduled_model("gemini-2.5-flash", agent="narrative_agent_tool"),
     instruction=NARRATIVE_AGENT_INSTRUCTION,
     output_key="narrative_agent_output_key",
     generate_content_config=types.GenerateContentConfig(
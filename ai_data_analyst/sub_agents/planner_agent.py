@@ -1,13 +1,14 @@
 import logging
-from typing import Any, Iterator
 
 from dotenv import load_dotenv
 from google.adk.agents import LlmAgent
 from google.genai import types
 
+from ..llm_scheduler import scheduled_model
+from ..model_router import apply_model_route
+
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 PLANNER_INSTRUCTION = """
@@ -60,24 +61,13 @@ Your most important job is to prevent the system from running out of memory or e
 - **JSON Format:** Ensure that the final output is a valid JSON object in the specified format.
 """
 
-class CountingLlmAgent(LlmAgent):
-    """An LlmAgent that counts its executions."""
-
-    execution_count: int = 0
-
-    def __call__(self, request: str, **kwargs: Any) -> str | Iterator[str]:
-        """Overrides the agent call to add execution counting."""
-        self.execution_count += 1
-        logger.info(
-            f"'{self.name}' has been executed {self.execution_count} times."
-        )
-        return super().__call__(request, **kwargs)
-
-planner_agent = CountingLlmAgent(
+# Runs are counted, with every other agent's, by the metrics registry (agent_runs_total)
+planner_agent = LlmAgent(
     name="planner_agent",
-    model="gemini-2.5-pro",
+    model=scheduled_model("gemini-2.5-pro", agent="planner_agent"),
     instruction=PLANNER_INSTRUCTION,
     description="Breaks down complex data analysis requests into a step-by-step plan.",
+    before_model_callback=apply_model_route,
     generate_content_config=types.GenerateContentConfig(
         temperature=0.0,
         response_mime_type="application/json",
@@ -4,10 +4,10 @@ import logging
 from google.adk.agents import LlmAgent
 from google.genai import types
 
+from ai_data_analyst.llm_scheduler import scheduled_model
+from ai_data_analyst.tools import datasets
 from ai_data_analyst.tools.chart_validation import validate_chart_spec
 
-# Configure logging for the visualization agent
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 logger.info("Visualization Agent module loaded.")
 
@@ -49,6 +49,22 @@ def generate_chart(
             logger.error(f"Chart validation failed: {error_message}")
             return f"Error: Invalid chart specification: {error_message}"
 
+        data = chart_data.get("data", {})
+        if "dataset" in data:
+            # The fields must be columns of the stored result, unless the spec's transforms create them
+            transforms = chart_data.get("transform", [])
+            created = {transform.get("as") for transform in transforms if isinstance(transform, dict)}
+            missing = set(datasets.spec_fields(chart_data)) - set(datasets.dataset_columns(data["dataset"])) - created
+            if missing:
+                columns = ", ".join(sorted(missing))
+                return f"Error: Invalid chart specification: {data['dataset']} has no column {columns}"
+            rows = datasets.dataset_rows(data["dataset"])
+            if rows > datasets.CHART_MAX_ROWS:
+                return (
+                    f"Error: Invalid chart specification: {data['dataset']} has {rows:,} rows, more than the "
+                    f"{datasets.CHART_MAX_ROWS:,} a chart can show. Ask for the data aggregated for this chart."
+                )
+
         logger.info("Chart specification validated successfully.")
         return json.dumps(chart_data)
 
@@ -72,6 +88,11 @@ You are a specialized "Consultative Visualization Agent." Your core function is
 # INPUT FORMAT
 You will receive a single JSON object from the Orchestrator Agent with the following keys:
 - `"dataset"`: (Required) A JSON object representing the dataset to be visualized (typically an array of records). This data is assumed to be pre-aggregated if necessary for the chart type (e.g., for a bar chart of averages).
+  If the dataset is the summary of a stored query result (an object with a `"dataset"` handle such as
+  `dataset://.../result-...`), do not copy its sample into the chart: use `"data": {"dataset": "<handle>"}` in the
+  chart specification and the column names of its `"schema"`. The full data is read when the chart is shown.
+  A stored result with too many rows to chart makes `generate_chart` return an error: tell the Orchestrator Agent
+  that the data must first be aggregated into the values the chart plots.
 - `"visualization_goal"`: (Required) A clear, natural-language description of what the visualization should accomplish.
   - Example: "Compare the distribution of scores across different regions."
 - `"suggested_chart_type"`: (Optional) A specific chart type requested by the user or another agent (e.g., "bar", "scatter"). You may override this if you determine a different chart type is more effective, but you must justify your decision.
@@ -126,7 +147,7 @@ This JSON object must contain two keys:
 # Create the agent instance
 visualization_agent = LlmAgent(
     name="visualization_agent_tool",
-    model="gemini-2.5-flash",
+    model=scheduled_model("gemini-2.5-flash", agent="visualization_agent_tool"),
     instruction=VISUALIZATION_AGENT_INSTRUCTION,
     description="Generates specifications for data visualizations by calling the `generate_chart` tool based on provided datasets and user requests.",
     tools=[generate_chart], # Provide the agent with the tool it can use
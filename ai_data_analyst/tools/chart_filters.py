@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+# How many filtered frames are memoized per chart
+MAX_MEMOIZED_SELECTIONS = 32
+
+
+class _ColumnIndex:
+    """The categorical codes of one filterable column."""
+
+    def __init__(self, values: pd.Series):
+        # NaN is kept as a regular value so it can be selected like any other option
+        if values.dtype == object:
+            # Mixed values are factorized by type and value, so True, 1 and 1.0 stay apart
+            keys = pd.Series([None if _is_nan(value) else _key(value) for value in values], dtype=object)
+            codes, _ = pd.factorize(keys, use_na_sentinel=False)
+            # Codes follow the order of appearance, so the first row of each code gives its option
+            _, first_rows = np.unique(codes, return_index=True)
+            self.options: list[Any] = [values.iloc[row] for row in first_rows]
+        else:
+            codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            self.options = list(uniques)
+        # codes[i] is the code of row i's value; one array per column, not a bitmap per value
+        self.codes = codes.astype(np.min_scalar_type(max(len(self.options) - 1, 0)))
+        self._code_by_value = {}
+        self._nan_code = None
+        for code, value in enumerate(self.options):
+            if _is_nan(value):
+                self._nan_code = code
+            else:
+                self._code_by_value[_key(value)] = code
+
+    def codes_for(self, selected_values: Iterable[Any]) -> frozenset:
+        """Maps selected option values to their codes, ignoring unknown values."""
+        codes = set()
+        for value in selected_values:
+            if _is_nan(value):
+                if self._nan_code is not None:
+                    codes.add(self._nan_code)
+                continue
+            code = self._code_by_value.get(_key(value))
+            if code is not None:
+                codes.add(code)
+        return frozenset(codes)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes)
+
+
+def _key(value: Any) -> tuple[str, Any]:
+    """The index key of a value: its type and the value, or the value's repr when it is unhashable."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    try:
+        hash(value)
+    except TypeError:
+        return type(value).__name__, repr(value)
+    return type(value).__name__, value
+
+
+def _is_nan(value: Any) -> bool:
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+class ChartFilterIndex:
+    """
+    A prepared filter index over a chart's data.
+
+    Each filterable column is factorized once into categorical codes. Combining
+    filter selections is then a membership test of each column's codes in its
+    selected codes, ANDed across columns, and the filtered frames are memoized
+    per selection.
+    """
+
+    def __init__(self, data: pd.DataFrame, filterable_columns: Iterable[str]):
+        self.data = data
+        self.columns: list[str] = [col for col in filterable_columns if col in data.columns]
+        self._indexes: dict[str, _ColumnIndex] = {col: _ColumnIndex(data[col]) for col in self.columns}
+        self._memo: OrderedDict[tuple[tuple[str, frozenset], ...], pd.DataFrame] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def options(self, column: str) -> list[Any]:
+        """Returns the distinct values of a column, in order of appearance."""
+        return self._indexes[column].options
+
+    def mask(self, selections: Mapping[str, Iterable[Any]]) -> np.ndarray:
+        """Returns the row mask for the given selections (column -> selected values)."""
+        return self._mask_for(self._selection_key(selections))
+
+    def filter(self, selections: Mapping[str, Iterable[Any]]) -> pd.DataFrame:
+        """
+        Returns the rows matching every column selection.
+
+        Args:
+            selections: Selected values per filterable column. Columns that are
+                not present keep all their values.
+
+        Returns:
+            The filtered DataFrame. When nothing is filtered out, the original
+            frame is returned without copying.
+        """
+        key = self._selection_key(selections)
+        if not key:
+            return self.data
+
+        with self._lock:
+            filtered = self._memo.get(key)
+            if filtered is not None:
+                self._memo.move_to_end(key)
+                return filtered
+
+        filtered = self.data[self._mask_for(key)]
+        with self._lock:
+            self._memo[key] = filtered
+            while len(self._memo) > MAX_MEMOIZED_SELECTIONS:
+                self._memo.popitem(last=False)
+        return filtered
+
+    def _selection_key(self, selections: Mapping[str, Iterable[Any]]) -> tuple[tuple[str, frozenset], ...]:
+        """Normalizes selections to codes, dropping columns where every value is selected."""
+        key = []
+        for col in self.columns:
+            if col not in selections:
+                continue
+            index = self._indexes[col]
+            codes = index.codes_for(selections[col])
+            if len(codes) < len(index.options):
+                key.append((col, codes))
+        return tuple(key)
+
+    def _mask_for(self, key: tuple[tuple[str, frozenset], ...]) -> np.ndarray:
+        mask = np.ones(len(self.data), dtype=bool)
+        for col, codes in key:
+            if codes:
+                mask &= np.isin(self._indexes[col].codes, sorted(codes))
+            else:
+                mask[:] = False
+        return mask
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the codes."""
+        return sum(index.nbytes for index in self._indexes.values())
@@ -3,6 +3,8 @@ import json
 import logging
 from typing import Dict, List, Any, Optional, Tuple
 
+from .correlation import STRONG_CORRELATION_THRESHOLD, associated_categorical_pairs, correlated_pairs
+
 logger = logging.getLogger(__name__)
 
 def prepare_data_for_chart(data: str) -> Tuple[pd.DataFrame, List[str], Dict[str, Any]]:
@@ -103,6 +105,7 @@ def analyze_chart_data(df: pd.DataFrame) -> Dict[str, Any]:
         "column_count": len(df.columns),
         "columns": {},
         "correlations": {},
+        "associations": {},
         "insights": []
     }
 
@@ -149,22 +152,23 @@ def analyze_chart_data(df: pd.DataFrame) -> Dict[str, Any]:
 
         analysis["columns"][col] = col_data
 
-    # Calculate correlations between numeric columns
-    numeric_cols = df.select_dtypes(include=['number']).columns
-    if len(numeric_cols) >= 2:
-        corr_matrix = df[numeric_cols].corr()
-        for i, col1 in enumerate(numeric_cols):
-            for col2 in numeric_cols[i+1:]:
-                corr_value = corr_matrix.loc[col1, col2]
-                if not pd.isna(corr_value):
-                    # Only include strong correlations
-                    if abs(corr_value) > 0.7:
-                        analysis["correlations"][f"{col1}-{col2}"] = float(corr_value)
-                        strength = "strong positive" if corr_value > 0 else "strong negative"
-                        analysis["insights"].append(
-                            f"There is a {strength} correlation ({corr_value:.2f}) "
-                            f"between '{col1}' and '{col2}'"
-                        )
+    # Calculate correlations between numeric columns. Only strong correlations
+    # are extracted, block by block, so wide datasets are never scanned pair by pair.
+    for col1, col2, corr_value in correlated_pairs(df, threshold=STRONG_CORRELATION_THRESHOLD):
+        analysis["correlations"][f"{col1}-{col2}"] = corr_value
+        strength = "strong positive" if corr_value > 0 else "strong negative"
+        analysis["insights"].append(
+            f"There is a {strength} correlation ({corr_value:.2f}) "
+            f"between '{col1}' and '{col2}'"
+        )
+
+    # Coded categorical columns (e.g. questionnaire answers) are compared with Cramér's V
+    for col1, col2, association in associated_categorical_pairs(df):
+        analysis["associations"][f"{col1}-{col2}"] = association
+        analysis["insights"].append(
+            f"There is a strong association (Cramér's V {association:.2f}) "
+            f"between '{col1}' and '{col2}'"
+        )
 
     return analysis
 
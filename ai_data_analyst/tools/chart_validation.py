@@ -47,6 +47,10 @@ def validate_chart_spec(chart_spec: Dict[str, Any]) -> Tuple[bool, Optional[str]
     if not isinstance(data, dict):
         return False, "'data' must be a dictionary"
 
+    # Large query results are referenced by their handle and read when the chart is rendered
+    if 'dataset' in data:
+        return True, None
+
     # Check if data has values
     if 'values' not in data:
         return False, "Chart data must include 'values' field"
@@ -0,0 +1,286 @@
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Number of columns correlated against each other at a time. A block pair needs
+# a few (rows x block) float matrices, which keeps memory flat for wide inputs.
+CORRELATION_BLOCK_SIZE = 64
+
+# Default thresholds for reporting a relationship as "strong"
+STRONG_CORRELATION_THRESHOLD = 0.7
+STRONG_ASSOCIATION_THRESHOLD = 0.3
+
+# Coded categoricals with more levels than this are skipped by Cramér's V
+MAX_CATEGORIES = 50
+
+CorrelatedPair = tuple[str, str, float]
+
+
+def _column_blocks(n_columns: int, block_size: int) -> list[slice]:
+    return [slice(start, min(start + block_size, n_columns)) for start in range(0, n_columns, block_size)]
+
+
+def _pearson_block(xa: np.ndarray, ma: np.ndarray, xb: np.ndarray, mb: np.ndarray, min_periods: int) -> np.ndarray:
+    """
+    Pairwise-complete Pearson coefficients between two column blocks.
+
+    `xa`/`xb` hold the centered values with missing entries set to zero and
+    `ma`/`mb` are the matching 0/1 masks of observed values, so every sum only
+    counts the rows where both columns are observed.
+    """
+    n = ma.T @ mb
+    sx = xa.T @ mb
+    sy = ma.T @ xb
+    sxx = (xa * xa).T @ mb
+    syy = ma.T @ (xb * xb)
+    sxy = xa.T @ xb
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        r = cov / np.sqrt(var_x * var_y)
+    r[(n < max(min_periods, 2)) | (var_x <= 0) | (var_y <= 0)] = np.nan
+    return np.clip(r, -1.0, 1.0)
+
+
+def _standardized_block(z: np.ndarray, a: slice, b: slice) -> np.ndarray:
+    """Pearson coefficients between two blocks of fully observed, standardized columns."""
+    return np.clip(z[:, a].T @ z[:, b] / (z.shape[0] - 1), -1.0, 1.0)
+
+
+def iter_correlation_blocks(
+        df: pd.DataFrame,
+        method: str = "pearson",
+        block_size: int = CORRELATION_BLOCK_SIZE,
+        min_periods: int = 1,
+) -> Iterator[tuple[slice, slice, np.ndarray]]:
+    """
+    Yields the upper triangle of the correlation matrix one block pair at a time.
+
+    Args:
+        df: DataFrame with the numeric columns to correlate.
+        method: "pearson" or "spearman". Spearman ranks each column over its
+            observed values and correlates the ranks.
+        block_size: Number of columns per block.
+        min_periods: Minimum number of paired observations for a coefficient.
+
+    Yields:
+        Tuples of (row_block, column_block, coefficients) with row_block <= column_block.
+    """
+    if method not in ("pearson", "spearman"):
+        raise ValueError(f"Unsupported correlation method '{method}'. Use 'pearson' or 'spearman'.")
+
+    values = df.rank(method="average") if method == "spearman" else df
+    x = values.to_numpy(dtype=float, na_value=np.nan)
+    observed = ~np.isnan(x)
+    blocks = _column_blocks(x.shape[1], block_size)
+
+    if observed.all():
+        # Fast path: standardize once and correlate with plain matrix products
+        std = x.std(axis=0, ddof=1) if x.shape[0] > 1 else np.zeros(x.shape[1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = (x - x.mean(axis=0)) / std
+        constant = ~(std > 0)
+        for i, a in enumerate(blocks):
+            for b in blocks[i:]:
+                r = _standardized_block(z, a, b) if x.shape[0] >= max(min_periods, 2) else \
+                    np.full((a.stop - a.start, b.stop - b.start), np.nan)
+                r[constant[a], :] = np.nan
+                r[:, constant[b]] = np.nan
+                yield a, b, r
+        return
+
+    # Centering does not change the coefficients but keeps the sums well conditioned
+    centered = np.where(observed, x - np.nanmean(np.where(observed, x, np.nan), axis=0), 0.0)
+    mask = observed.astype(float)
+    for i, a in enumerate(blocks):
+        for b in blocks[i:]:
+            yield a, b, _pearson_block(centered[:, a], mask[:, a], centered[:, b], mask[:, b], min_periods)
+
+
+def correlated_pairs(
+        df: pd.DataFrame,
+        method: str = "pearson",
+        threshold: float = STRONG_CORRELATION_THRESHOLD,
+        block_size: int = CORRELATION_BLOCK_SIZE,
+        min_periods: int = 1,
+) -> list[CorrelatedPair]:
+    """
+    Finds the pairs of numeric columns whose absolute correlation exceeds a threshold.
+
+    The upper triangle of each block is extracted and thresholded with vectorized
+    operations, so the full matrix is never scanned pair by pair in Python.
+
+    Args:
+        df: DataFrame to analyze. Non-numeric columns are ignored.
+        method: "pearson" or "spearman".
+        threshold: Only pairs with |r| strictly greater than this are returned.
+        block_size: Number of columns per block for wide inputs.
+        min_periods: Minimum number of paired observations for a coefficient.
+
+    Returns:
+        A list of (column_a, column_b, coefficient) in column order.
+    """
+    numeric = df.select_dtypes(include=["number"])
+    columns = numeric.columns
+    rows: list[np.ndarray] = []
+    cols: list[np.ndarray] = []
+    coefficients: list[np.ndarray] = []
+    for a, b, r in iter_correlation_blocks(numeric, method=method, block_size=block_size, min_periods=min_periods):
+        keep = np.abs(r) > threshold
+        if a == b:
+            keep &= np.triu(np.ones_like(keep, dtype=bool), k=1)
+        i, j = np.nonzero(keep)
+        rows.append(i + a.start)
+        cols.append(j + b.start)
+        coefficients.append(r[i, j])
+
+    if not rows:
+        return []
+    i = np.concatenate(rows)
+    j = np.concatenate(cols)
+    r = np.concatenate(coefficients)
+    order = np.lexsort((j, i))
+    return [(columns[i[k]], columns[j[k]], float(r[k])) for k in order]
+
+
+def cramers_v(x: pd.Series, y: pd.Series) -> float:
+    """Cramér's V association between two categorical series, ignoring missing values."""
+    codes_x, uniques_x = pd.factorize(x)
+    codes_y, uniques_y = pd.factorize(y)
+    return _cramers_v_from_codes(codes_x, len(uniques_x), codes_y, len(uniques_y))
+
+
+def _cramers_v_from_codes(codes_x: np.ndarray, kx: int, codes_y: np.ndarray, ky: int) -> float:
+    valid = (codes_x >= 0) & (codes_y >= 0)
+    if not valid.any():
+        return float("nan")
+    table = np.bincount(codes_x[valid] * ky + codes_y[valid], minlength=kx * ky).reshape(kx, ky)
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    rows, cols = table.shape
+    if min(rows, cols) < 2:
+        return float("nan")
+    # chi2 / n == sum(O^2 / (row_total * col_total)) - 1
+    marginals = np.outer(table.sum(axis=1), table.sum(axis=0)).astype(float)
+    phi2 = (table.astype(float) ** 2 / marginals).sum() - 1.0
+    return float(np.sqrt(max(phi2, 0.0) / (min(rows, cols) - 1)))
+
+
+def associated_categorical_pairs(
+        df: pd.DataFrame,
+        columns: Optional[Sequence[str]] = None,
+        threshold: float = STRONG_ASSOCIATION_THRESHOLD,
+        max_categories: int = MAX_CATEGORIES,
+) -> list[CorrelatedPair]:
+    """
+    Finds pairs of coded categorical columns (e.g. the Q001–Q025 questionnaire answers)
+    whose Cramér's V exceeds a threshold.
+
+    Each column is factorized once and every contingency table is built with a
+    single `bincount` over the combined codes.
+
+    Args:
+        df: DataFrame to analyze.
+        columns: Columns to treat as categorical. Defaults to object, string and category columns.
+        threshold: Only pairs with V strictly greater than this are returned.
+        max_categories: Columns with more distinct values are skipped.
+
+    Returns:
+        A list of (column_a, column_b, cramers_v) in column order.
+    """
+    if columns is None:
+        columns = df.select_dtypes(include=["object", "string", "category"]).columns.tolist()
+
+    factorized = []
+    for col in columns:
+        codes, uniques = pd.factorize(df[col])
+        if 2 <= len(uniques) <= max_categories:
+            factorized.append((col, codes, len(uniques)))
+
+    pairs = []
+    for i, (col_a, codes_a, ka) in enumerate(factorized):
+        for col_b, codes_b, kb in factorized[i + 1:]:
+            v = _cramers_v_from_codes(codes_a, ka, codes_b, kb)
+            if not np.isnan(v) and v > threshold:
+                pairs.append((col_a, col_b, v))
+    return pairs
+
+
+# --- In-database correlation ---
+
+def quote_identifier(name: str) -> str:
+    """Quotes a (possibly schema-qualified) PostgreSQL identifier."""
+    return ".".join('"' + part.replace('"', '""') + '"' for part in name.split("."))
+
+
+def _ranked_source(table_name: str, columns: Sequence[str]) -> str:
+    """A subquery replacing each column by its average rank, for Spearman in SQL."""
+    ranked = []
+    for col in columns:
+        quoted = quote_identifier(col)
+        ranked.append(
+            f"CASE WHEN {quoted} IS NULL THEN NULL ELSE "
+            f"rank() OVER (ORDER BY {quoted} NULLS LAST) "
+            f"+ (count(*) OVER (PARTITION BY {quoted}) - 1) / 2.0 END AS {quoted}"
+        )
+    return f"(SELECT {', '.join(ranked)} FROM {quote_identifier(table_name)}) AS ranked"
+
+
+def correlation_sql_statements(
+        table_name: str,
+        columns: Sequence[str],
+        method: str = "pearson",
+        block_size: int = CORRELATION_BLOCK_SIZE,
+) -> list[tuple[str, list[tuple[str, str]]]]:
+    """
+    Builds PostgreSQL statements computing the upper-triangle correlations with `corr()` aggregates.
+
+    Pairs are split by column blocks so wide tables stay below PostgreSQL's
+    target list limit, and each statement scans the table once.
+
+    Args:
+        table_name: Table (optionally schema-qualified) holding the data.
+        columns: Numeric columns to correlate.
+        method: "pearson", or "spearman" to correlate average ranks.
+        block_size: Number of columns per block.
+
+    Returns:
+        A list of (sql, pairs) where the n-th output column of `sql` is the coefficient of `pairs[n]`.
+    """
+    if method not in ("pearson", "spearman"):
+        raise ValueError(f"Unsupported correlation method '{method}'. Use 'pearson' or 'spearman'.")
+    columns = list(columns)
+    blocks = _column_blocks(len(columns), block_size)
+
+    statements = []
+    for i, a in enumerate(blocks):
+        for b in blocks[i:]:
+            pairs = [
+                (columns[x], columns[y])
+                for x in range(a.start, a.stop)
+                for y in range(max(b.start, x + 1), b.stop)
+            ]
+            if not pairs:
+                continue
+            block_columns = list(dict.fromkeys([col for pair in pairs for col in pair]))
+            source = _ranked_source(table_name, block_columns) if method == "spearman" else quote_identifier(table_name)
+            aggregates = ", ".join(
+                f"corr({quote_identifier(x)}, {quote_identifier(y)}) AS c{n}" for n, (x, y) in enumerate(pairs)
+            )
+            statements.append((f"SELECT {aggregates} FROM {source}", pairs))
+    return statements
+
+
+def threshold_pairs(
+        pairs: Iterable[tuple[str, str]],
+        coefficients: Iterable[Optional[float]],
+        threshold: float = STRONG_CORRELATION_THRESHOLD,
+) -> list[CorrelatedPair]:
+    """Keeps the pairs whose coefficient is known and exceeds the threshold in absolute value."""
+    return [
+        (x, y, float(r))
+        for (x, y), r in zip(pairs, coefficients)
+        if r is not None and not np.isnan(r) and abs(r) > threshold
+    ]
@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Optional
+
+import pandas as pd
+from google.adk.tools import ToolContext
+
+from ..chat_storage import CHART_BODY_PATTERN
+from .correlation import STRONG_CORRELATION_THRESHOLD, associated_categorical_pairs, correlated_pairs
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Large query results are then returned in full, as before
+    pa = pq = None
+
+# Query results longer than this (as JSON) are written to Parquet and summarized instead of returned
+QUERY_SPILL_CHARS = int(os.environ.get("QUERY_SPILL_CHARS", "100000"))
+# Spilled results are kept here, in a directory per agent session
+WORKSPACE_DIR = os.environ.get("WORKSPACE_DIR", "workspace")
+# Files older than this are removed (checked at most once per WORKSPACE_CLEANUP_INTERVAL seconds);
+# saved reports embed the rows their charts plot (see inline_message_datasets)
+WORKSPACE_MAX_AGE = float(os.environ.get("WORKSPACE_MAX_AGE_HOURS", "24")) * 3600
+WORKSPACE_CLEANUP_INTERVAL = 3600
+
+# Rows of a spilled result returned as its sample
+SAMPLE_ROWS = 10
+# Most frequent values listed in the profile of a non-numeric column
+TOP_VALUES = 5
+# Groups returned by describe_dataset
+MAX_GROUPS = 200
+# Rows a chart can embed; a larger stored result must be aggregated before it is charted
+CHART_MAX_ROWS = 5000
+
+# Session state key of the session's workspace directory name
+WORKSPACE_KEY = "workspace_id"
+
+HANDLE_PATTERN = re.compile(r"dataset://([\w-]+)/([\w-]+)")
+
+logger = logging.getLogger(__name__)
+
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+
+def spill_enabled() -> bool:
+    return pq is not None and QUERY_SPILL_CHARS > 0
+
+
+def _round(value: Any) -> Any:
+    if value is None or pd.isna(value):
+        return None
+    return round(float(value), 4)
+
+
+def profile(df: pd.DataFrame) -> dict[str, dict[str, Any]]:
+    """Summary statistics per column: distribution of numeric columns, most frequent values of the others."""
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        stats: dict[str, Any] = {"nulls": int(series.isna().sum())}
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            quartiles = series.quantile([0.25, 0.5, 0.75])
+            stats.update({
+                "mean": _round(series.mean()),
+                "std": _round(series.std()),
+                "min": _round(series.min()),
+                "q1": _round(quartiles[0.25]),
+                "median": _round(quartiles[0.5]),
+                "q3": _round(quartiles[0.75]),
+                "max": _round(series.max()),
+            })
+        else:
+            counts = series.astype(str).where(series.notna()).value_counts()
+            stats["distinct"] = int(counts.size)
+            stats["top"] = {str(value): int(count) for value, count in counts.head(TOP_VALUES).items()}
+        columns[str(column)] = stats
+    return columns
+
+
+def _workspace(tool_context: ToolContext) -> str:
+    """The directory of the session's spilled results; its name is kept in session state."""
+    workspace_id = tool_context.state.get(WORKSPACE_KEY)
+    if not workspace_id:
+        workspace_id = tool_context.state[WORKSPACE_KEY] = uuid.uuid4().hex[:16]
+    return workspace_id
+
+
+def spill(df: pd.DataFrame, tool_context: ToolContext) -> str:
+    """
+    Writes a query result to a Parquet file in the session's workspace and
+    returns, as JSON, its handle, schema, row count, profile and a sample.
+    """
+    workspace_id = _workspace(tool_context)
+    name = f"result-{uuid.uuid4().hex[:12]}"
+    directory = os.path.join(WORKSPACE_DIR, workspace_id)
+    os.makedirs(directory, exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, os.path.join(directory, f"{name}.parquet"))
+    handle = f"dataset://{workspace_id}/{name}"
+    logger.info("Spilled %d rows (%d columns) to %s", len(df), len(df.columns), handle)
+    _remove_expired_files()
+    return json.dumps({
+        "dataset": handle,
+        "rows": len(df),
+        "schema": {field.name: str(field.type) for field in table.schema},
+        "profile": profile(df),
+        "sample": json.loads(df.head(SAMPLE_ROWS).to_json(orient="records")),
+        "note": (
+            f"The result has too many rows to return, so it was stored as {handle}. Pass this handle to "
+            "the analysis and visualization agents; they read the full data from it."
+        ),
+    }, ensure_ascii=False)
+
+
+def _path(handle: str) -> str:
+    match = HANDLE_PATTERN.fullmatch(handle.strip())
+    if not match:
+        raise ValueError(f"Not a dataset handle: {handle}")
+    path = os.path.join(WORKSPACE_DIR, match.group(1), f"{match.group(2)}.parquet")
+    if not os.path.exists(path):
+        raise ValueError(f"Dataset {handle} no longer exists; query the data again.")
+    return path
+
+
+def dataset_columns(handle: str) -> list[str]:
+    """The columns of a spilled result, read from the file's footer."""
+    if pq is None:
+        raise ValueError("Reading datasets requires pyarrow.")
+    return pq.read_schema(_path(handle)).names
+
+
+def dataset_rows(handle: str) -> int:
+    """The row count of a spilled result, read from the file's footer."""
+    if pq is None:
+        raise ValueError("Reading datasets requires pyarrow.")
+    return pq.read_metadata(_path(handle)).num_rows
+
+
+def load_dataset(handle: str, columns: Optional[list[str]] = None, max_rows: Optional[int] = None) -> pd.DataFrame:
+    """
+    Reads a spilled result. The file is memory-mapped and only `columns` are
+    read, so loading a few columns of a wide result stays cheap.
+    """
+    if pq is None:
+        raise ValueError("Reading datasets requires pyarrow.")
+    table = pq.read_table(_path(handle), columns=columns or None, memory_map=True)
+    if max_rows is not None:
+        table = table.slice(0, max_rows)
+    return table.to_pandas()
+
+
+def _remove_expired_files() -> None:
+    global _last_cleanup
+    now = time.time()
+    with _cleanup_lock:
+        if now - _last_cleanup < WORKSPACE_CLEANUP_INTERVAL:
+            return
+        _last_cleanup = now
+    for root, _, files in os.walk(WORKSPACE_DIR):
+        for file in files:
+            path = os.path.join(root, file)
+            try:
+                if now - os.path.getmtime(path) > WORKSPACE_MAX_AGE:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def describe_dataset(dataset: str, columns: Optional[list[str]] = None, group_by: Optional[list[str]] = None) -> str:
+    """
+    Computes descriptive statistics over the full data of a stored query result
+    (a `dataset://...` handle), which is too large to be read row by row.
+
+    Args:
+        dataset: The handle of the stored result, e.g. 'dataset://3f2a.../result-9c1d...'.
+        columns: The columns to describe; all columns if omitted.
+        group_by: Columns to group by. Numeric columns are then summarized
+            (count, mean, median, std, min, max) for each group.
+
+    Returns:
+        A JSON string with the row count and the statistics (per column, or per
+        group), plus the strongly correlated numeric column pairs and the strongly
+        associated categorical ones (Cramér's V), or an error message.
+    """
+    group_by = group_by or []
+    try:
+        wanted = list(dict.fromkeys([*columns, *group_by])) if columns else None
+        df = load_dataset(dataset, columns=wanted)
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+    result: dict[str, Any] = {"dataset": dataset, "rows": len(df)}
+    if group_by:
+        numeric = [column for column in df.select_dtypes("number").columns if column not in group_by]
+        if not numeric:
+            return json.dumps({"error": "There are no numeric columns to summarize per group."})
+        stats = df.groupby(group_by, dropna=False)[numeric].agg(["count", "mean", "median", "std", "min", "max"])
+        stats.columns = [f"{column}_{stat}" for column, stat in stats.columns]
+        groups = stats.reset_index()
+        result["groups_total"] = len(groups)
+        result["groups"] = json.loads(groups.head(MAX_GROUPS).round(4).to_json(orient="records"))
+    else:
+        result["columns"] = profile(df)
+        result["correlations"] = [
+            {"column_a": a, "column_b": b, "correlation": round(value, 4)}
+            for a, b, value in correlated_pairs(df, threshold=STRONG_CORRELATION_THRESHOLD)
+        ]
+        result["associations"] = [
+            {"column_a": a, "column_b": b, "cramers_v": round(value, 4)}
+            for a, b, value in associated_categorical_pairs(df)
+        ]
+    return json.dumps(result, ensure_ascii=False)
+
+
+def spec_fields(spec: Any) -> list[str]:
+    """The data fields a Vega-Lite spec refers to."""
+    fields = []
+    if isinstance(spec, dict):
+        for key, value in spec.items():
+            if key == "field" and isinstance(value, str):
+                fields.append(value)
+            elif key in ("groupby", "fields") and isinstance(value, list):
+                fields.extend(item for item in value if isinstance(item, str))
+            else:
+                fields.extend(spec_fields(value))
+    elif isinstance(spec, list):
+        for item in spec:
+            fields.extend(spec_fields(item))
+    return fields
+
+
+def inline_dataset(spec: dict[str, Any]) -> dict[str, Any]:
+    """
+    Replaces `"data": {"dataset": "dataset://..."}` in a Vega-Lite spec with the
+    values of the columns the spec uses, read from the stored result. Other
+    specs are returned unchanged.
+
+    Raises:
+        ValueError: The result has more than CHART_MAX_ROWS rows. It is not cut
+            to its first rows, which would silently change what the chart shows.
+    """
+    data = spec.get("data")
+    if not isinstance(data, dict) or "dataset" not in data:
+        return spec
+    rows = dataset_rows(data["dataset"])
+    if rows > CHART_MAX_ROWS:
+        raise ValueError(
+            f"{data['dataset']} has {rows:,} rows, more than the {CHART_MAX_ROWS:,} a chart can show; "
+            "aggregate the data before charting it."
+        )
+    # Fields created by the spec's transforms are not columns of the file
+    available = set(dataset_columns(data["dataset"]))
+    columns = [column for column in dict.fromkeys(spec_fields(spec)) if column in available]
+    df = load_dataset(data["dataset"], columns=columns or None)
+    return {**spec, "data": {"values": json.loads(df.to_json(orient="records", date_format="iso"))}}
+
+
+def inline_message_datasets(message: str) -> str:
+    """
+    Embeds the values plotted by the charts of a message that refer to a stored
+    result (see inline_dataset), so a saved report keeps its charts after the
+    result's file is removed. Charts whose result cannot be read, or is too large
+    to embed, keep their reference.
+    """
+    def inline(match: re.Match) -> str:
+        try:
+            chart = json.loads(match.group(1))
+            # The wrapper format of charts with filters, or a plain Vega-Lite spec
+            wrapped = isinstance(chart, dict) and "chart_spec" in chart
+            spec = chart["chart_spec"] if wrapped else chart
+            inlined = inline_dataset(spec) if isinstance(spec, dict) else spec
+        except Exception as e:
+            logger.warning("Could not embed the data of a chart: %s", e)
+            return match.group(0)
+        if inlined is spec:
+            return match.group(0)
+        body = json.dumps({**chart, "chart_spec": inlined} if wrapped else inlined, ensure_ascii=False)
+        return match.group(0).replace(match.group(1), body)
+
+    if "dataset://" not in message:
+        return message
+    return CHART_BODY_PATTERN.sub(inline, message)
@@ -1,7 +1,119 @@
 import os
 import json
+import logging
+import re
+import threading
+from typing import Callable, Optional
+
 import pandas as pd
-from sqlalchemy import create_engine, text
+from google.adk.tools import ToolContext
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
+
+from .. import tracing
+from ..logging_config import payload, sampled
+from . import datasets
+from .correlation import correlation_sql_statements, threshold_pairs
+from .query_cache import QueryCache
+
+logger = logging.getLogger(__name__)
+
+# Connections kept open per database; engines are shared by every tool call
+POOL_SIZE = 5
+POOL_MAX_OVERFLOW = 5
+
+# The schema rarely changes; the "Load/Reload Schema" button invalidates it explicitly
+SCHEMA_CACHE_TTL = 600
+QUERY_CACHE_TTL = 300
+QUERY_CACHE_MAX_ENTRIES = 128
+# Larger results are returned but not cached
+QUERY_CACHE_MAX_CHARS = 1_000_000
+
+_engines: dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+schema_cache = QueryCache(ttl=SCHEMA_CACHE_TTL, max_entries=8)
+query_cache = QueryCache(ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES)
+
+
+def _database_url() -> str:
+    # A full SQLAlchemy URL overrides the POSTGRES_* settings, e.g. a local SQLite stand-in for benchmarks
+    if os.environ.get("DATABASE_URL"):
+        return os.environ["DATABASE_URL"]
+    db_user = os.environ.get("POSTGRES_USER", "user")
+    db_password = os.environ.get("POSTGRES_PASSWORD", "password")
+    db_host = os.environ.get("POSTGRES_HOST", "localhost")
+    db_port = os.environ.get("POSTGRES_PORT", "5432")
+    db_name = os.environ.get("POSTGRES_DB", "enem_data")
+    return f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+
+def get_engine() -> Engine:
+    """
+    Returns the pooled, read-only engine of the database configured in the environment.
+
+    Engines are created once per database URL and never disposed, so tool calls
+    reuse open connections instead of connecting each time.
+    """
+    database_url = _database_url()
+    with _engines_lock:
+        engine = _engines.get(database_url)
+        if engine is None:
+            engine = _engines[database_url] = create_engine(
+                database_url,
+                pool_size=POOL_SIZE,
+                max_overflow=POOL_MAX_OVERFLOW,
+                pool_pre_ping=True,
+                # Read-only sessions; this requires psycopg2 version 2.8+
+                execution_options={"postgresql_readonly": True},
+            )
+        return engine
+
+
+def warm_up_connection_pool() -> None:
+    """Opens a pooled connection ahead of the first query."""
+    with get_engine().connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+def normalize_sql(query: str) -> str:
+    """The form of a query used as its cache key: whitespace collapsed, trailing semicolons removed."""
+    return re.sub(r"\s+", " ", query).strip().rstrip(";").strip()
+
+
+def _is_cacheable(result: str) -> bool:
+    # Results are cached in full; each agent call spills a large one to its own session's workspace
+    return _is_successful(result) and len(result) <= QUERY_CACHE_MAX_CHARS
+
+
+def _is_successful(result: str) -> bool:
+    return not result.startswith('{"error"')
+
+
+def invalidate_schema_cache() -> None:
+    schema_cache.invalidate()
+
+
+def get_cache_stats() -> dict:
+    """Hit and miss counts of the schema and query result caches."""
+    return {"schema": schema_cache.stats(), "query": query_cache.stats()}
+
+
+def get_pool_stats() -> dict:
+    """Connections per database: the pool's size, those in use and those opened beyond the size."""
+    with _engines_lock:
+        engines = list(_engines.values())
+    stats = {}
+    for engine in engines:
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        stats[engine.url.render_as_string(hide_password=True)] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+        }
+    return stats
 
 
 def list_tables_and_schemas() -> str:
@@ -12,19 +124,15 @@ def list_tables_and_schemas() -> str:
     Returns:
         A single string containing the formatted schemas for all tables, or an error message.
     """
-    engine = None
-    try:
-        print("DEBUG: Attempting to list tables and schemas...")
-        db_user = os.environ.get("POSTGRES_USER", "user")
-        db_password = os.environ.get("POSTGRES_PASSWORD", "password")
-        db_host = os.environ.get("POSTGRES_HOST", "localhost")
-        db_port = os.environ.get("POSTGRES_PORT", "5432")
-        db_name = os.environ.get("POSTGRES_DB", "enem_data")
+    return schema_cache.get_or_compute(_database_url(), _load_tables_and_schemas, should_cache=_is_cacheable)
 
-        database_url = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-        engine = create_engine(database_url)
 
-        with engine.connect() as connection:
+def _load_tables_and_schemas() -> str:
+    try:
+        logger.debug("Listing tables and schemas")
+        with get_engine().connect() as connection:
+            if connection.dialect.name != "postgresql":
+                return _inspect_tables_and_schemas(connection)
             # Get all table names from the public schema
             query = "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"
             tables_df = pd.read_sql_query(text(query), connection)
@@ -45,12 +153,23 @@ def list_tables_and_schemas() -> str:
             return all_schemas.strip()
 
     except Exception as e:
-        print(f"DEBUG: Failed to list tables and schemas: {str(e)}")
+        logger.warning("Failed to list tables and schemas: %s", e)
         return json.dumps({"error": f"Failed to list tables and schemas: {str(e)}"})
-    finally:
-        if engine:
-            engine.dispose()
-        print("DEBUG: Database engine disposed.")
+
+
+def _inspect_tables_and_schemas(connection) -> str:
+    """The same listing for databases without information_schema, using SQLAlchemy's inspector."""
+    inspector = inspect(connection)
+    table_names = inspector.get_table_names()
+    if not table_names:
+        return json.dumps({"error": "No tables found in the public schema."})
+    schemas = []
+    for table_name in table_names:
+        schema_str = f"**Table: `{table_name}`**\n"
+        for column in inspector.get_columns(table_name):
+            schema_str += f"- `{column['name']}` ({str(column['type']).lower()})\n"
+        schemas.append(schema_str)
+    return "\n".join(schemas).strip()
 
 
 def get_table_schema(table_name: str, connection=None) -> str:
@@ -60,22 +179,11 @@ def get_table_schema(table_name: str, connection=None) -> str:
     if connection:
         return _get_table_schema_with_connection(table_name, connection)
     
-    engine = None
     try:
-        db_user = os.environ.get("POSTGRES_USER", "user")
-        db_password = os.environ.get("POSTGRES_PASSWORD", "password")
-        db_host = os.environ.get("POSTGRES_HOST", "localhost")
-        db_port = os.environ.get("POSTGRES_PORT", "5432")
-        db_name = os.environ.get("POSTGRES_DB", "enem_data")
-        database_url = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-        engine = create_engine(database_url)
-        with engine.connect() as conn:
+        with get_engine().connect() as conn:
             return _get_table_schema_with_connection(table_name, conn)
     except Exception as e:
         return json.dumps({"error": f"Failed to get table schema: {str(e)}"})
-    finally:
-        if engine:
-            engine.dispose()
 
 
 def _get_table_schema_with_connection(table_name: str, connection) -> str:
@@ -99,7 +207,7 @@ def _get_table_schema_with_connection(table_name: str, connection) -> str:
     return schema_str
 
 
-def execute_sql(query: str) -> str:
+def execute_sql(query: str, tool_context: Optional[ToolContext] = None) -> str:
     """
     Connects to a PostgreSQL database, executes a read-only SQL query,
     and returns the result as a JSON string. This function is designed
@@ -111,47 +219,129 @@ def execute_sql(query: str) -> str:
     Returns:
         A string containing the query result in JSON format, or an
         error message if the query fails or is not a SELECT statement.
+        A result too large to return is stored instead, and summarized
+        by its `dataset` handle, schema, row count, profile and a sample.
     """
     # --- SECURITY GUARDRAIL ---
     # Ensure only SELECT statements are executed to prevent data modification.
     if not query.strip().upper().startswith("SELECT"):
         return json.dumps({"error": "Security Error: Only SELECT statements are allowed."})
 
-    engine = None
-    try:
-        print("DEBUG: Attempting to connect to the database using SQLAlchemy...")
-        # Construct the database URL for SQLAlchemy
-        db_user = os.environ.get("POSTGRES_USER", "user")
-        db_password = os.environ.get("POSTGRES_PASSWORD", "password")
-        db_host = os.environ.get("POSTGRES_HOST", "localhost")
-        db_port = os.environ.get("POSTGRES_PORT", "5432")
-        db_name = os.environ.get("POSTGRES_DB", "enem_data")
+    # Results are cached, so a repeated query, or one prefetched while the plan was
+    # being written, is answered without a round trip
+    frames = []
+    result = query_cache.get_or_compute(
+        (_database_url(), normalize_sql(query)),
+        lambda: _run_query(query, on_frame=frames.append),
+        should_cache=_is_cacheable,
+    )
+    # An agent gets a large result as a file in its own session's workspace, summarized. Spilled
+    # here rather than by the query, whose result may be shared with other sessions' calls
+    too_large = datasets.spill_enabled() and len(result) > datasets.QUERY_SPILL_CHARS
+    if tool_context is not None and too_large and _is_successful(result):
+        tracing.set_attributes(**{"db.spilled": True})
+        if not frames:
+            # A result computed by another call is queried again: its JSON has lost the column types
+            # (decimals, dates, timestamps) and the precision of floats the file keeps
+            result = _run_query(query, on_frame=frames.append)
+            if not frames:
+                return result
+        return datasets.spill(frames[0], tool_context)
+    return result
+
+
+def prefetch_query(query: str, timeout_ms: int) -> str:
+    """
+    Runs a SELECT query ahead of time and caches its result for `execute_sql`.
 
-        database_url = f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+    Args:
+        query: The SQL SELECT statement.
+        timeout_ms: The query is cancelled after this many milliseconds, so a
+            speculative query never holds a connection for long.
+    """
+    if not query.strip().upper().startswith("SELECT"):
+        return json.dumps({"error": "Security Error: Only SELECT statements are allowed."})
+    # A query the agent sends meanwhile waits for this one, but runs again without
+    # the timeout if this one failed (e.g. was cancelled)
+    return query_cache.get_or_compute(
+        (_database_url(), normalize_sql(query)),
+        lambda: _run_query(query, timeout_ms=timeout_ms),
+        should_cache=_is_cacheable,
+        should_share=_is_successful,
+    )
 
-        # Add connect_args={'readonly': True} to ensure the session is read-only
-        # This requires psycopg2 version 2.8+
-        engine = create_engine(database_url, execution_options={"postgresql_readonly": True})
 
+def _run_query(
+        query: str, timeout_ms: int | None = None, on_frame: Optional[Callable[[pd.DataFrame], None]] = None
+) -> str:
+    try:
         # Using a context manager for the connection is good practice
-        with engine.connect() as connection:
+        with tracing.tracer.start_as_current_span("sql", attributes={"db.statement": query}) as span, \
+                get_engine().connect() as connection:
+            span.set_attribute("db.system", connection.dialect.name)
+            if timeout_ms is not None and connection.dialect.name == "postgresql":
+                connection.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
 
-            # The connection is now established in read-only mode.
+            # The connection is read-only (see get_engine)
             df = pd.read_sql_query(text(query), connection)
 
             records = df.to_json(orient='records')
-            print(f"DEBUG: Query executed successfully. {records}")
-
+            span.set_attribute("db.rows", len(df))
+            span.set_attribute("db.result_bytes", len(records))
+            # Only formatted, and cut, if debug logging is on
+            logger.debug(
+                "Query returned %d rows (%d bytes): %s", len(df), len(records), payload(records), extra=sampled()
+            )
+            if on_frame is not None:
+                on_frame(df)
             return records
 
     except Exception as e:
-        print(f"DEBUG: Database query failed: {str(e)}")
+        logger.warning("Database query failed: %s; query: %s", e, payload(query))
         # Check if the error is due to trying to write in a read-only transaction
         if "read-only transaction" in str(e).lower():
             return json.dumps(
                 {"error": f"Database Security Error: Attempted to perform a write operation on a read-only connection. Original error: {str(e)}"})
         return json.dumps({"error": f"Database query failed: {str(e)}"})
-    finally:
-        if engine:
-            engine.dispose()  # Dispose of the engine to close all connections in the pool
-        print("DEBUG: Database engine disposed.")
+
+
+def find_correlations_in_db(
+        table_name: str, columns: list[str], method: str = "pearson", threshold: float = 0.7
+) -> str:
+    """
+    Computes the correlations between numeric columns of a table inside PostgreSQL
+    using `corr()` aggregates, and returns only the strongly correlated pairs.
+    This avoids fetching raw rows just to build a correlation matrix.
+
+    Args:
+        table_name: The table holding the data (e.g. 'microdados_enem_2023').
+        columns: The numeric columns to correlate (e.g. ['nu_nota_mt', 'nu_nota_cn']).
+        method: 'pearson', or 'spearman' for rank correlation of ordinal or skewed data.
+        threshold: Only pairs with an absolute coefficient above this value are returned.
+
+    Returns:
+        A JSON string with a list of {"column_a", "column_b", "correlation"} objects,
+        or an error message.
+    """
+    if len(columns) < 2:
+        return json.dumps({"error": "At least two columns are required to compute correlations."})
+
+    try:
+        statements = correlation_sql_statements(table_name, columns, method=method)
+    except ValueError as e:
+        return json.dumps({"error": str(e)})
+
+    try:
+        strong_pairs = []
+        with get_engine().connect() as connection:
+            for sql, pairs in statements:
+                coefficients = connection.execute(text(sql)).fetchone()
+                strong_pairs.extend(threshold_pairs(pairs, coefficients, threshold=threshold))
+
+        return json.dumps([
+            {"column_a": column_a, "column_b": column_b, "correlation": round(value, 4)}
+            for column_a, column_b, value in strong_pairs
+        ])
+    except Exception as e:
+        logger.warning("Correlation query failed: %s", e)
+        return json.dumps({"error": f"Correlation query failed: {str(e)}"})
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+# Result of a pending load that its waiters must not use; they compute the value themselves
+_NOT_SHARED = object()
+
+
+class QueryCache:
+    """
+    A thread-safe cache of database results with a TTL and a bound on the number of entries.
+
+    Concurrent requests for a key that is being computed wait for that computation
+    instead of running it again, so a speculative load started ahead of time is
+    shared with the agent that asks for the same result a moment later. A load
+    can decline to share a result (e.g. a speculative query cancelled by its
+    short timeout), and its waiters then run their own computation.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, str]] = OrderedDict()
+        self._pending: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """Returns the cached value, or None if it is missing or expired. Does not wait for pending loads."""
+        with self._lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key: Hashable) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get_or_compute(
+            self,
+            key: Hashable,
+            compute: Callable[[], str],
+            should_cache: Callable[[str], bool] = lambda value: True,
+            should_share: Optional[Callable[[str], bool]] = None,
+    ) -> str:
+        """
+        Returns the cached value of `key`, computing it if needed.
+
+        Args:
+            key: The cache key.
+            compute: Produces the value.
+            should_cache: Whether a computed value is kept, e.g. False for error results.
+            should_share: Whether a computed value is handed to the callers waiting for
+                it. If given, an exception raised by `compute` is not shared either.
+        """
+        while True:
+            with self._lock:
+                value = self._get_locked(key)
+                if value is not None:
+                    self.hits += 1
+                    return value
+                pending = self._pending.get(key)
+                if pending is None:
+                    self.misses += 1
+                    future = self._pending[key] = Future()
+                    break
+            value = pending.result()
+            if value is not _NOT_SHARED:
+                # Counted as a hit: the caller did not run the query itself
+                with self._lock:
+                    self.hits += 1
+                return value
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            if should_share is None:
+                future.set_exception(e)
+            else:
+                future.set_result(_NOT_SHARED)
+            raise
+        with self._lock:
+            del self._pending[key]
+            if should_cache(value):
+                self._entries[key] = (time.monotonic(), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(value if should_share is None or should_share(value) else _NOT_SHARED)
+        return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
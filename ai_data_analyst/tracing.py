@@ -0,0 +1,269 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator, Sequence
+from typing import Any, Optional
+
+from google.adk.models import LlmResponse
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, SpanLimits, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.trace import Span, Status, StatusCode, format_span_id, format_trace_id
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "ai_data_analyst"
+
+# Set TRACING=0 to neither keep nor export traces
+TRACING_ENABLED = os.environ.get("TRACING", "1") != "0"
+# Finished traces are appended here as OTLP/JSON lines; unset to keep them in memory only
+TRACE_DIR = os.environ.get("TRACE_DIR", "")
+
+# Traces kept in memory for the trace panel
+MAX_TRACES = 50
+# ADK records whole prompts and responses as span attributes; longer values are cut
+MAX_ATTRIBUTE_CHARS = 2000
+
+tracer = trace.get_tracer(SERVICE_NAME)
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def _truncate(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > MAX_ATTRIBUTE_CHARS:
+        return value[:MAX_ATTRIBUTE_CHARS] + f"... ({len(value)} chars)"
+    return value
+
+
+def span_to_dict(span: ReadableSpan) -> dict[str, Any]:
+    """The fields of a finished span the trace panel shows."""
+    return {
+        "trace_id": format_trace_id(span.context.trace_id),
+        "span_id": format_span_id(span.context.span_id),
+        "parent_id": format_span_id(span.parent.span_id) if span.parent else None,
+        "name": span.name,
+        "start": span.start_time,
+        "duration_ms": round((span.end_time - span.start_time) / 1e6, 2),
+        "status": span.status.status_code.name,
+        "attributes": {key: _truncate(value) for key, value in (span.attributes or {}).items()},
+    }
+
+
+class TraceStore(SpanProcessor):
+    """Keeps the spans of the most recent traces in memory, for the trace panel."""
+
+    def __init__(self, max_traces: int = MAX_TRACES):
+        self.max_traces = max_traces
+        self._traces: OrderedDict[str, list[dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_end(self, span: ReadableSpan) -> None:
+        record = span_to_dict(span)
+        with self._lock:
+            spans = self._traces.setdefault(record["trace_id"], [])
+            spans.append(record)
+            self._traces.move_to_end(record["trace_id"])
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get_trace(self, trace_id: str) -> list[dict[str, Any]]:
+        """
+        The finished spans of a trace in tree order, each with its `depth` and its
+        `offset_ms` from the start of the trace.
+        """
+        with self._lock:
+            spans = list(self._traces.get(trace_id, []))
+        if not spans:
+            return []
+        ids = {span["span_id"] for span in spans}
+        children: dict[Optional[str], list[dict[str, Any]]] = {}
+        for span in sorted(spans, key=lambda s: s["start"]):
+            # Spans whose parent is not in the trace (yet) are shown at the top
+            parent = span["parent_id"] if span["parent_id"] in ids else None
+            children.setdefault(parent, []).append(span)
+        trace_start = min(span["start"] for span in spans)
+
+        ordered = []
+
+        def walk(parent_id: Optional[str], depth: int) -> None:
+            for span in children.get(parent_id, []):
+                ordered.append({**span, "depth": depth, "offset_ms": round((span["start"] - trace_start) / 1e6, 2)})
+                walk(span["span_id"], depth + 1)
+
+        walk(None, 0)
+        return ordered
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(_truncate(value))}
+
+
+def _otlp_attributes(attributes) -> list[dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in (attributes or {}).items()]
+
+
+def _otlp_span(span: ReadableSpan) -> dict[str, Any]:
+    record = {
+        "traceId": format_trace_id(span.context.trace_id),
+        "spanId": format_span_id(span.context.span_id),
+        "name": span.name,
+        # The SDK's SpanKind starts at INTERNAL = 0; OTLP's at UNSPECIFIED = 0
+        "kind": span.kind.value + 1,
+        "startTimeUnixNano": str(span.start_time),
+        "endTimeUnixNano": str(span.end_time),
+        "attributes": _otlp_attributes(span.attributes),
+        "status": {"code": span.status.status_code.value, "message": span.status.description or ""},
+    }
+    if span.parent:
+        record["parentSpanId"] = format_span_id(span.parent.span_id)
+    if span.events:
+        record["events"] = [
+            {"timeUnixNano": str(event.timestamp), "name": event.name, "attributes": _otlp_attributes(event.attributes)}
+            for event in span.events
+        ]
+    return record
+
+
+class JsonlSpanExporter(SpanExporter):
+    """
+    Appends spans to a daily JSONL file, one OTLP/JSON export request per line (the
+    format of the OpenTelemetry Collector's file exporter), so the files can be
+    replayed into any OTLP backend.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        by_scope: dict[str, list[dict[str, Any]]] = {}
+        for span in spans:
+            scope = span.instrumentation_scope.name if span.instrumentation_scope else ""
+            by_scope.setdefault(scope, []).append(_otlp_span(span))
+        resource = spans[0].resource.attributes if spans else {}
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes(resource)},
+            "scopeSpans": [{"scope": {"name": scope}, "spans": records} for scope, records in by_scope.items()],
+        }]}, ensure_ascii=False)
+        path = os.path.join(self.directory, f"traces-{time.strftime('%Y-%m-%d')}.jsonl")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning("Could not export %d spans to %s: %s", len(spans), path, e)
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+trace_store = TraceStore()
+
+
+def get_provider() -> TracerProvider:
+    """
+    The process' tracer provider, created on first use. A provider set up by the
+    host (e.g. `adk web`) is reused.
+    """
+    with _configure_lock:
+        provider = trace.get_tracer_provider()
+        if not isinstance(provider, TracerProvider):
+            provider = TracerProvider(
+                resource=Resource.create({"service.name": SERVICE_NAME}),
+                # Cut long values when they are set rather than on every read and export
+                span_limits=SpanLimits(max_span_attribute_length=MAX_ATTRIBUTE_CHARS),
+            )
+            trace.set_tracer_provider(provider)
+        return provider
+
+
+def configure_tracing() -> None:
+    """
+    Sends the spans of ADK (invocations, agent runs, LLM calls, tool calls) and of this
+    package (requests, scheduled LLM calls, SQL queries) to the trace panel and, when
+    TRACE_DIR or OTEL_EXPORTER_OTLP_ENDPOINT is set, to JSONL files or an OTLP collector.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured or not TRACING_ENABLED:
+            return
+        _configured = True
+    provider = get_provider()
+    provider.add_span_processor(trace_store)
+    if TRACE_DIR:
+        # Exported from a background thread, off the request path
+        provider.add_span_processor(BatchSpanProcessor(JsonlSpanExporter(TRACE_DIR)))
+    if os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-exporter-otlp is not installed.")
+        else:
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+
+
+@contextlib.contextmanager
+def request_span(question: str, session_id: Optional[str] = None) -> Iterator[Span]:
+    """The root span of one user request; the agent run started inside it is traced under it."""
+    attributes = {"request.question": _truncate(question)}
+    if session_id:
+        attributes["request.session_id"] = session_id
+    with tracer.start_as_current_span("request", attributes=attributes) as span:
+        yield span
+
+
+def trace_id_of(span: Span) -> str:
+    return format_trace_id(span.get_span_context().trace_id)
+
+
+def get_trace(trace_id: str) -> list[dict[str, Any]]:
+    return trace_store.get_trace(trace_id)
+
+
+def set_attributes(**attributes: Any) -> None:
+    """Adds attributes to the current span, e.g. the running tool's."""
+    span = trace.get_current_span()
+    for key, value in attributes.items():
+        span.set_attribute(key, value)
+
+
+def record_llm_response(span: Span, response: LlmResponse) -> None:
+    usage = response.usage_metadata
+    if usage is None:
+        return
+    for key, value in (
+        ("llm.prompt_tokens", usage.prompt_token_count),
+        ("llm.completion_tokens", usage.candidates_token_count),
+        ("llm.total_tokens", usage.total_token_count),
+    ):
+        if value is not None:
+            span.set_attribute(key, value)
+
+
+def record_error(span: Span, error: BaseException) -> None:
+    span.record_exception(error)
+    span.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+def record_tool_result(tool, args, tool_context, tool_response) -> None:
+    """after_tool callback: records the size of the tool's text result on its span."""
+    result = tool_response.get("result", tool_response) if isinstance(tool_response, dict) else tool_response
+    if isinstance(result, str):
+        # Measured like db.result_bytes; serializing other results only to measure them is not worth it
+        set_attributes(**{"tool.result_bytes": len(result)})
+    return None
@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.runners import Runner
+
+from . import config_manager, event_stream, tracing
+from .job_queue import Job, JobQueue
+from .session_service import session_service
+from .tools import datasets
+
+logger = logging.getLogger(__name__)
+
+# The chat's app name, so jobs of a chat continue its agent session
+APP_NAME = "ai_data_analyst_app"
+# Seconds between heartbeats of a running job; well below JOB_HEARTBEAT_TIMEOUT
+HEARTBEAT_INTERVAL = 10.0
+# Seconds an idle worker waits before looking for jobs again
+POLL_INTERVAL = 1.0
+# Seconds the pool waits before restarting a worker process that died
+RESTART_DELAY = 5.0
+
+
+async def _answer(runner: Runner, job: Job) -> str:
+    if not await runner.session_service.get_session(app_name=APP_NAME, user_id=job.user_id, session_id=job.session_id):
+        await runner.session_service.create_session(app_name=APP_NAME, user_id=job.user_id, session_id=job.session_id)
+    answer = ""
+    async for event in runner.run_async(
+        user_id=job.user_id,
+        session_id=job.session_id,
+        new_message=event_stream.user_message(job.question, job.data_context),
+    ):
+        for update in event_stream.interpret_event(event):
+            if update.kind == "final_text":
+                answer += update.text
+    if not answer:
+        raise RuntimeError("The agents returned no answer.")
+    return answer
+
+
+def _use_connection(job: Job) -> None:
+    """Points the database tools at the connection the job was queued with, as selecting it in the sidebar does."""
+    if job.config_id is None:
+        return
+    config = config_manager.get_config_by_id(job.config_id)
+    if not config:
+        raise RuntimeError("The database connection of this question was deleted.")
+    os.environ["POSTGRES_HOST"] = config["db_host"]
+    os.environ["POSTGRES_PORT"] = str(config["db_port"])
+    os.environ["POSTGRES_DB"] = config["db_name"]
+    os.environ["POSTGRES_USER"] = config["db_user"]
+    os.environ["POSTGRES_PASSWORD"] = config["db_password"]
+
+
+def _keep_alive(queue: JobQueue, job: Job, worker_id: str, done: threading.Event) -> None:
+    while not done.wait(HEARTBEAT_INTERVAL):
+        if not queue.heartbeat(job.id, worker_id):
+            logger.warning("Job %s was taken over by another worker", job.id)
+            return
+
+
+def run_job(queue: JobQueue, runner: Runner, job: Job, worker_id: str) -> None:
+    """Runs one claimed job, sending heartbeats meanwhile, and stores its answer or error."""
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_keep_alive, args=(queue, job, worker_id, done), daemon=True)
+    heartbeat.start()
+    started_at = time.perf_counter()
+    try:
+        with tracing.request_span(job.question, session_id=job.session_id) as span:
+            try:
+                _use_connection(job)
+                answer = asyncio.run(_answer(runner, job))
+            except Exception as e:
+                tracing.record_error(span, e)
+                raise
+    except Exception as e:
+        logger.warning("Job %s failed on attempt %d: %s", job.id, job.attempts, e)
+        queue.fail(job.id, worker_id, str(e) or type(e).__name__)
+        return
+    finally:
+        done.set()
+        heartbeat.join()
+    # Saved with the data of its charts, which outlives the stored query results they were drawn from
+    answer = datasets.inline_message_datasets(answer)
+    queue.complete(
+        job.id, worker_id, answer,
+        trace_id=tracing.trace_id_of(span),
+        chat_session_id=job.session_id if job.save_to_chat else None,
+    )
+    logger.info("Job %s done in %.1fs", job.id, time.perf_counter() - started_at)
+
+
+def work(
+        worker_id: str,
+        stop: threading.Event,
+        queue: Optional[JobQueue] = None,
+        agent: Optional[BaseAgent] = None,
+        session_store=None,
+        max_jobs: Optional[int] = None,
+) -> int:
+    """Claims and runs jobs until `stop` is set (or `max_jobs` were run); returns the number of jobs run."""
+    if agent is None:
+        from .agent import root_agent as agent
+    if session_store is None:
+        session_service.initialize()
+        session_store = session_service
+    queue = queue or JobQueue()
+    queue.initialize()
+    runner = Runner(agent=agent, app_name=APP_NAME, session_service=session_store)
+    jobs_run = 0
+    while not stop.is_set() and (max_jobs is None or jobs_run < max_jobs):
+        job = queue.claim(worker_id)
+        if job is None:
+            stop.wait(POLL_INTERVAL)
+            continue
+        logger.info("Worker %s running job %s (attempt %d)", worker_id, job.id, job.attempts)
+        run_job(queue, runner, job, worker_id)
+        jobs_run += 1
+    return jobs_run
+
+
+def run_pool(processes: int) -> None:
+    """
+    Runs `processes` worker processes until interrupted, restarting any that
+    dies. Their jobs are taken over once their heartbeats stop.
+    """
+    # Workers start from a fresh interpreter: forking would copy the parent's logging and tracing threads' locks
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(number: int):
+        # Ctrl+C and SIGTERM reach the whole process group: the workers are started ignoring them
+        # (even while still importing), and finish their job when the pool sets `stop`
+        handlers = {signum: signal.signal(signum, signal.SIG_IGN) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            process = context.Process(target=work, args=(f"{prefix}/{number}", stop), name=f"worker-{number}")
+            process.start()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        return process
+
+    def request_stop(signum, frame):
+        logger.info("Stopping: the workers finish their current job first")
+        stop.set()
+
+    pool = [start(number) for number in range(processes)]
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    logger.info("Started %d workers", processes)
+    while not stop.is_set():
+        time.sleep(RESTART_DELAY)
+        for number, process in enumerate(pool):
+            if not process.is_alive() and not stop.is_set():
+                logger.warning("Worker %d exited with code %s; restarting it", number, process.exitcode)
+                pool[number] = start(number)
+    for process in pool:
+        process.join()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m ai_data_analyst.worker", description="Runs the agents on queued questions."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Start worker processes")
+    run_parser.add_argument("-n", "--processes", type=int, default=os.cpu_count() or 1)
+    submit_parser = commands.add_parser("submit", help="Queue the questions of a file (as read by the batch runner)")
+    submit_parser.add_argument("questions")
+    submit_parser.add_argument("--data-context", default="")
+    status_parser = commands.add_parser("status", help="Show the queue, or one job with its answer")
+    status_parser.add_argument("job_id", nargs="?")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run_pool(args.processes)
+        return 0
+
+    queue = JobQueue()
+    queue.initialize()
+    if args.command == "submit":
+        from .batch import load_questions
+
+        for question in load_questions(args.questions, data_context=args.data_context):
+            print(queue.submit(question.question, question.data_context), question.question)
+    elif args.job_id:
+        job = queue.get(args.job_id)
+        if job is None:
+            print(f"No job {args.job_id}")
+            return 1
+        print(f"{job.status} after {job.attempts} attempt(s)")
+        print(job.answer or job.error or "")
+    else:
+        print(", ".join(f"{status}: {jobs}" for status, jobs in sorted(queue.counts().items())) or "No jobs")
+        for job in queue.list_jobs(limit=20):
+            print(job.id, job.status, job.question[:80])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Benchmark of the config_manager calls made on every Streamlit rerun.
+
+Seeds a temporary configs database with a large chat history (10k+ messages by
+default), then times the calls a rerun makes: listing configurations, loading
+the active configuration (twice, as the app does), the sidebar session previews
+and the current session's history.
+
+Two modes are compared:
+- "fresh": every call opens a new connection, as before connections were pooled.
+- "pooled": calls reuse the thread's tuned connection.
+
+Usage:
+    python benchmarks/config_manager_rerun.py [--sessions 500] [--messages-per-session 20] [--reruns 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from cryptography.fernet import Fernet
+
+# Use a throwaway key so importing config_manager does not write secret.key
+os.environ.setdefault("CONFIG_ENCRYPTION_KEY", Fernet.generate_key().decode())
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ai_data_analyst import config_manager  # noqa: E402
+
+ASSISTANT_REPORT = (
+    "## Relatório\n\nA média de matemática foi **maior** nas escolas privadas.\n\n"
+    "```json\n{\"chart_spec\": {\"mark\": \"bar\", \"data\": {\"values\": ["
+    + ", ".join(f'{{"uf": "UF{i}", "media": {500 + i}}}' for i in range(60))
+    + "]}}}\n```\n"
+)
+
+
+def seed(sessions, messages_per_session):
+    """Creates a configuration and `sessions` chats of `messages_per_session` messages."""
+    config_manager.initialize_db()
+    config_manager.add_config("bench", "localhost", 5432, "enem_data", "user", "password")
+    for s in range(sessions):
+        session_id = f"session-{s:05d}"
+        for m in range(messages_per_session):
+            if m % 2 == 0:
+                config_manager.add_chat_message(session_id, "user", f"Pergunta {m} da sessão {s}: qual a média por UF?")
+            else:
+                config_manager.add_chat_message(session_id, "assistant", ASSISTANT_REPORT)
+    return f"session-{sessions - 1:05d}"
+
+
+def rerun(current_session_id):
+    """The config_manager calls made by one Streamlit rerun."""
+    names = config_manager.get_all_config_names()
+    config_manager.get_config_by_name(names[0])  # _edit_delete_connection_form
+    config_manager.get_config_by_name(names[0])  # _get_and_set_active_db_config
+    config_manager.get_chat_sessions_preview()
+    config_manager.get_chat_history(current_session_id)
+
+
+def fresh_rerun(current_session_id):
+    """A rerun where each call pays for a new connection, as without pooling."""
+    for call in (
+        config_manager.get_all_config_names,
+        lambda: config_manager.get_config_by_name("bench"),
+        lambda: config_manager.get_config_by_name("bench"),
+        config_manager.get_chat_sessions_preview,
+        lambda: config_manager.get_chat_history(current_session_id),
+    ):
+        config_manager.close_all_connections()
+        call()
+
+
+def measure(fn, current_session_id, reruns):
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        fn(current_session_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "max_ms": timings[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--messages-per-session", type=int, default=20)
+    parser.add_argument("--reruns", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_manager.DB_FILE = os.path.join(tmp_dir, "bench_configs.db")
+
+        start = time.perf_counter()
+        current_session_id = seed(args.sessions, args.messages_per_session)
+        total_messages = args.sessions * args.messages_per_session
+        print(f"Seeded {total_messages} messages in {args.sessions} sessions "
+              f"in {time.perf_counter() - start:.1f}s ({os.path.getsize(config_manager.DB_FILE) / 1e6:.1f} MB)")
+
+        for label, fn in (("fresh", fresh_rerun), ("pooled", rerun)):
+            config_manager.reset_db_metrics()
+            result = measure(fn, current_session_id, args.reruns)
+            print(
+                f"{label:>7}: p50 {result['p50_ms']:.2f} ms  p95 {result['p95_ms']:.2f} ms  "
+                f"max {result['max_ms']:.2f} ms"
+            )
+
+        print("\nPer-operation latency (pooled):")
+        for operation, stats in sorted(config_manager.get_db_metrics().items()):
+            print(f"  {operation:<28} n={stats['count']:<4} avg {stats['avg_ms']:.3f} ms  max {stats['max_ms']:.3f} ms")
+
+        config_manager.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Loads a plain-text pg_dump (like the fixtures in tests/data) into SQLite.
+
+Only what the fixtures use is supported: CREATE TABLE statements and COPY ... FROM
+stdin blocks. Sequences, constraints and other statements are skipped. Column
+types are mapped to SQLite affinities, so numeric aggregates behave like in
+PostgreSQL.
+
+Usage:
+    python benchmarks/pg_dump_sqlite.py tests/data/chinook.sql /tmp/chinook.sqlite
+"""
+import re
+import sqlite3
+import sys
+
+CREATE_TABLE_PATTERN = re.compile(r'CREATE TABLE public\.("?[^"\s(]+"?) \((.*?)\n\);', re.DOTALL)
+COPY_PATTERN = re.compile(r'^COPY public\.("?[^"\s(]+"?) \((.*?)\) FROM stdin;$')
+_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "\\": "\\"}
+
+
+def _affinity(pg_type: str) -> str:
+    pg_type = pg_type.lower()
+    if "int" in pg_type:
+        return "INTEGER"
+    if pg_type.startswith(("numeric", "decimal", "real", "double")):
+        return "REAL"
+    return "TEXT"
+
+
+def _unescape(value: str):
+    if value == r"\N":
+        return None
+    return re.sub(r"\\(.)", lambda match: _ESCAPES.get(match.group(1), match.group(1)), value)
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.strip('"') + '"'
+
+
+def load_pg_dump(dump_path: str, sqlite_path: str) -> dict:
+    """
+    Creates the dump's tables in a SQLite database and copies their rows.
+
+    Returns:
+        The number of rows loaded per table.
+    """
+    with open(dump_path, encoding="utf-8") as f:
+        dump = f.read()
+
+    conn = sqlite3.connect(sqlite_path)
+    try:
+        for table, body in CREATE_TABLE_PATTERN.findall(dump):
+            columns = []
+            for line in body.strip().splitlines():
+                match = re.match(r'\s*("[^"]+"|\w+)\s+(.+?)(?: NOT NULL)?,?$', line)
+                if match:
+                    columns.append(f"{_quote(match.group(1))} {_affinity(match.group(2))}")
+            conn.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+            conn.execute(f"CREATE TABLE {_quote(table)} ({', '.join(columns)})")
+
+        counts = {}
+        lines = iter(dump.splitlines())
+        for line in lines:
+            match = COPY_PATTERN.match(line)
+            if not match:
+                continue
+            table, column_list = match.groups()
+            columns = ", ".join(_quote(column.strip()) for column in column_list.split(","))
+            placeholders = ", ".join("?" * len(column_list.split(",")))
+            rows = []
+            for row in lines:
+                if row == r"\.":
+                    break
+                rows.append([_unescape(value) for value in row.split("\t")])
+            conn.executemany(f"INSERT INTO {_quote(table)} ({columns}) VALUES ({placeholders})", rows)
+            counts[table.strip('"')] = len(rows)
+        conn.commit()
+        return counts
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    print(load_pg_dump(sys.argv[1], sys.argv[2]))
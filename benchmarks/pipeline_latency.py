@@ -0,0 +1,286 @@
+"""
+End-to-end latency benchmark of the agent pipeline on the chinook and happiness fixtures.
+
+Loads the pg_dump fixtures from tests/data into local SQLite stand-ins and runs
+the catalogue of questions in pipeline_questions.json through the real
+root_agent: its callbacks, tools, artifact handles, caches and scheduler. The
+model is replaced by one of:
+- "stub" (default): deterministic stand-ins for each agent (pipeline_stub.py),
+  with --model-latency seconds per call.
+- "replay": the recorded cassettes (LLM_BACKEND=replay, see llm_cassette).
+
+Reports per-stage timings (planning, sql, analysis, chart, narrative, and the
+orchestrator's own share) with p50/p95, the size of each stage's output and of
+what the orchestrator receives, and compares them with a stored baseline.
+Exits with status 1 when a stage regresses beyond the tolerance.
+
+Usage:
+    python benchmarks/pipeline_latency.py [--repeat 5] [--warmup 1] [--model-latency 0.0] [--backend stub|replay]
+        [--questions chinook_genres ...] [--save-baseline] [--tolerance 0.25] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+CATALOGUE_PATH = os.path.join(BENCHMARKS_DIR, "pipeline_questions.json")
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baselines", "pipeline_latency.json")
+
+STAGES = {
+    "planner_agent": "planning",
+    "data_engineer_agent_tool": "sql",
+    "descriptive_analyzer_agent_tool": "analysis",
+    "visualization_agent_tool": "chart",
+    "narrative_agent_tool": "narrative",
+}
+STAGE_ORDER = ["planning", "sql", "analysis", "chart", "narrative", "orchestrator", "total"]
+
+# Timings within this many milliseconds of the baseline are never regressions
+NOISE_FLOOR_MS = 5.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each question")
+    parser.add_argument("--warmup", type=int, default=1, help="Uncounted runs of each question first")
+    parser.add_argument("--backend", choices=["stub", "replay"], default="stub")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Seconds per stub model call")
+    parser.add_argument("--questions", nargs="*", help="Question ids to run (default: all)")
+    parser.add_argument("--warm-cache", action="store_true", help="Keep the schema and query caches between runs")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative increase over the baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    return parser.parse_args()
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def load_fixtures(catalogue, directory):
+    """Loads each fixture into a SQLite database; returns the database URL and message template per fixture."""
+    from pg_dump_sqlite import load_pg_dump
+
+    fixtures = {}
+    for name, fixture in catalogue["fixtures"].items():
+        path = os.path.join(directory, f"{name}.sqlite")
+        load_pg_dump(os.path.join(REPO_DIR, fixture["dump"]), path)
+        with open(os.path.join(REPO_DIR, fixture["message_template"]), encoding="utf-8") as f:
+            template = f.read()
+        fixtures[name] = {"url": f"sqlite:///{path}", "template": template}
+    return fixtures
+
+
+def user_message(template, question):
+    from google.genai import types
+
+    # The placeholder sits inside a JSON string
+    return types.Content.model_validate(json.loads(template.replace("{{userQuery}}", json.dumps(question)[1:-1])))
+
+
+def install_stub_models(root_agent, sql_by_question, latency):
+    from pipeline_stub import StubLlm
+
+    from ai_data_analyst.llm_scheduler import scheduler
+
+    stubs = {}
+    for agent in [root_agent] + [tool.agent for tool in root_agent.tools]:
+        # The stubs have no API quotas; otherwise the runs would measure the rate limiter
+        scheduler.configure(agent.model.model, rpm=1_000_000, max_concurrency=64)
+        stubs[agent.name] = agent.model.inner = StubLlm(
+            model=agent.model.model, role=agent.name, sql_by_question=sql_by_question, latency=latency
+        )
+    return stubs
+
+
+async def _collect(runner, session_id, message):
+    return [event async for event in runner.run_async(user_id="bench", session_id=session_id, new_message=message)]
+
+
+def run_question(root_agent, message):
+    """Runs one question; returns its per-stage seconds, payload sizes and whether it produced an answer."""
+    from google.adk.runners import InMemoryRunner
+
+    from ai_data_analyst import event_stream
+
+    runner = InMemoryRunner(agent=root_agent, app_name="benchmark")
+    session = runner.session_service.create_session_sync(app_name="benchmark", user_id="bench")
+    started_at = time.time()
+    events = asyncio.run(_collect(runner, session.id, message))
+    total = time.time() - started_at
+
+    timings = defaultdict(float)
+    output_chars = defaultdict(int)
+    orchestrator_chars = defaultdict(int)
+    calls = {}
+    for event in events:
+        for call in event.get_function_calls():
+            calls[call.id] = event.timestamp
+        for response in event.get_function_responses():
+            stage = STAGES.get(response.name)
+            if stage is None or response.id not in calls:
+                continue
+            timings[stage] += event.timestamp - calls[response.id]
+            orchestrator_chars[stage] += len(json.dumps(response.response, ensure_ascii=False))
+        for update in event_stream.interpret_event(event):
+            if update.kind == "step_finished" and update.step in STAGES:
+                output_chars[STAGES[update.step]] += len(update.text)
+    timings["orchestrator"] = max(0.0, total - sum(timings.values()))
+    timings["total"] = total
+    answered = bool(events) and events[-1].is_final_response() and bool(event_stream._text_of(events[-1]))
+    return timings, output_chars, orchestrator_chars, answered
+
+
+def summarize(samples, output_chars, orchestrator_chars, prompt_chars):
+    stages = {}
+    for stage in STAGE_ORDER:
+        values_ms = [value * 1000 for value in samples.get(stage, [])]
+        if not values_ms:
+            continue
+        stages[stage] = {
+            "p50_ms": round(percentile(values_ms, 0.5), 2),
+            "p95_ms": round(percentile(values_ms, 0.95), 2),
+            "output_chars": round(statistics.mean(output_chars[stage])) if output_chars.get(stage) else 0,
+            "orchestrator_chars": (
+                round(statistics.mean(orchestrator_chars[stage])) if orchestrator_chars.get(stage) else 0
+            ),
+        }
+    return {"stages": stages, "orchestrator_prompt_chars_max": max(prompt_chars) if prompt_chars else None}
+
+
+def print_report(summary, per_question):
+    print(f"\n{'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'output chars':>15}{'orchestrator chars':>20}")
+    for stage, values in summary["stages"].items():
+        print(
+            f"{stage:<14}{values['p50_ms']:>10.1f}{values['p95_ms']:>10.1f}"
+            f"{values['output_chars']:>15}{values['orchestrator_chars']:>20}"
+        )
+    if summary["orchestrator_prompt_chars_max"] is not None:
+        print(f"\nLargest orchestrator prompt: {summary['orchestrator_prompt_chars_max']} chars")
+    print(f"\n{'question':<30}{'p50 ms':>10}{'p95 ms':>10}")
+    for question_id, totals in per_question.items():
+        totals_ms = [value * 1000 for value in totals]
+        print(f"{question_id:<30}{percentile(totals_ms, 0.5):>10.1f}{percentile(totals_ms, 0.95):>10.1f}")
+
+
+def compare(summary, baseline, tolerance):
+    """Prints the changes against the baseline; returns the regressions."""
+    regressions = []
+    print(f"\nCompared with the baseline (tolerance {tolerance:.0%}):")
+    for stage, values in summary["stages"].items():
+        base = baseline["stages"].get(stage)
+        if not base:
+            continue
+        found = []
+        if values["p95_ms"] > base["p95_ms"] * (1 + tolerance) + NOISE_FLOOR_MS:
+            found.append(f"{stage} p95: {base['p95_ms']:.1f}ms -> {values['p95_ms']:.1f}ms")
+        for key in ("output_chars", "orchestrator_chars"):
+            if values[key] > base[key] * (1 + tolerance):
+                found.append(f"{stage} {key}: {base[key]} -> {values[key]}")
+        regressions += found
+        change = (values["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        print(f"  {stage:<14}p95 {base['p95_ms']:>8.1f} -> {values['p95_ms']:>8.1f} ms ({change:+.0%})"
+              f"{'  REGRESSION' if found else ''}")
+    base_prompt = baseline.get("orchestrator_prompt_chars_max")
+    prompt = summary["orchestrator_prompt_chars_max"]
+    if base_prompt and prompt and prompt > base_prompt * (1 + tolerance):
+        regressions.append(f"orchestrator prompt chars: {base_prompt} -> {prompt}")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    if args.backend == "replay":
+        os.environ["LLM_BACKEND"] = "replay"
+    sys.path.insert(0, REPO_DIR)
+    from ai_data_analyst.agent import root_agent
+    from ai_data_analyst.tools import postgres_mcp
+
+    # The agents log every step at INFO, and ADK warns about the sync session API
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with open(CATALOGUE_PATH, encoding="utf-8") as f:
+        catalogue = json.load(f)
+    questions = [q for q in catalogue["questions"] if not args.questions or q["id"] in args.questions]
+    stubs = {}
+    if args.backend == "stub":
+        stubs = install_stub_models(root_agent, {q["question"]: q["sql"] for q in questions}, args.model_latency)
+
+    samples = defaultdict(list)
+    output_chars = defaultdict(list)
+    orchestrator_chars = defaultdict(list)
+    per_question = defaultdict(list)
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = load_fixtures(catalogue, directory)
+        for repetition in range(args.warmup + args.repeat):
+            for question in questions:
+                fixture = fixtures[question["fixture"]]
+                os.environ["DATABASE_URL"] = fixture["url"]
+                if not args.warm_cache:
+                    postgres_mcp.schema_cache.invalidate()
+                    postgres_mcp.query_cache.invalidate()
+                timings, outputs, seen, answered = run_question(
+                    root_agent, user_message(fixture["template"], question["question"])
+                )
+                if not answered:
+                    print(f"{question['id']}: no answer", file=sys.stderr)
+                if repetition < args.warmup:
+                    continue
+                for stage, seconds in timings.items():
+                    samples[stage].append(seconds)
+                for stage, chars in outputs.items():
+                    output_chars[stage].append(chars)
+                for stage, chars in seen.items():
+                    orchestrator_chars[stage].append(chars)
+                per_question[question["id"]].append(timings["total"])
+
+    prompt_chars = stubs[root_agent.name].prompt_chars if stubs else []
+    summary = summarize(samples, output_chars, orchestrator_chars, prompt_chars)
+    summary["settings"] = {
+        "backend": args.backend,
+        "model_latency": args.model_latency,
+        "repeat": args.repeat,
+        "warmup": args.warmup,
+        "questions": [q["id"] for q in questions],
+        "warm_cache": args.warm_cache,
+    }
+    print_report(summary, per_question)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline to compare with; store one with --save-baseline")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != summary["settings"]:
+        print("\nThe baseline was recorded with other settings; comparing anyway:", baseline.get("settings"))
+    regressions = compare(summary, baseline, args.tolerance)
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Deterministic stand-ins for the agents' models, used by pipeline_latency.py.
+
+Each StubLlm plays one agent and produces the calls and outputs that agent
+would, from the request alone: the orchestrator walks the plan step by step
+(passing artifact handles along, like the real prompt asks), the data agent
+lists the schema and runs the catalogue's SQL for the question, and the other
+agents build their output from the data they receive. Everything else (tools,
+callbacks, routing, artifacts, caches) is the real pipeline.
+"""
+import asyncio
+import json
+import re
+from typing import Optional
+
+import pandas as pd
+from google.adk.models import BaseLlm, LlmResponse
+from google.genai import types
+
+ORCHESTRATOR = "ai_data_analyst_orchestrator"
+PLANNER = "planner_agent"
+DATA = "data_engineer_agent_tool"
+ANALYSIS = "descriptive_analyzer_agent_tool"
+VISUALIZATION = "visualization_agent_tool"
+NARRATIVE = "narrative_agent_tool"
+
+PIPELINE = [PLANNER, DATA, ANALYSIS, VISUALIZATION, NARRATIVE]
+
+_CHART_BLOCK_PATTERN = re.compile(r"```json\n.*?\n```", re.DOTALL)
+_decoder = json.JSONDecoder()
+
+
+def _text(text: str) -> LlmResponse:
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+def _call(name: str, args: dict) -> LlmResponse:
+    part = types.Part(function_call=types.FunctionCall(name=name, args=args))
+    return LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+def _function_responses(llm_request) -> list[tuple[str, dict]]:
+    return [
+        (part.function_response.name, part.function_response.response or {})
+        for content in llm_request.contents
+        for part in content.parts or []
+        if part.function_response
+    ]
+
+
+def _first_user_text(llm_request) -> str:
+    for content in llm_request.contents:
+        if content.role == "user":
+            return "".join(part.text or "" for part in content.parts or [])
+    return ""
+
+
+def find_rows(text: str) -> Optional[list[dict]]:
+    """The first JSON array of objects in `text`."""
+    for match in re.finditer(r"\[", text):
+        try:
+            value, _ = _decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(value, list) and value and all(isinstance(row, dict) for row in value):
+            return value
+    return None
+
+
+class StubLlm(BaseLlm):
+    """
+    Plays the agent `role`.
+
+    Args:
+        role: The agent's name.
+        sql_by_question: The SQL the data agent writes for each catalogue question.
+        latency: Seconds each call takes, to simulate the model.
+    """
+
+    role: str
+    sql_by_question: dict[str, str] = {}
+    latency: float = 0.0
+    prompt_chars: list[int] = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.prompt_chars.append(len(llm_request.model_dump_json(include={"contents"})))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        yield getattr(self, f"_{self.role}")(llm_request)
+
+    def _question(self, text: str) -> str:
+        try:
+            return json.loads(text)["user_request"]
+        except (ValueError, KeyError, TypeError):
+            return text
+
+    def _ai_data_analyst_orchestrator(self, llm_request) -> LlmResponse:
+        question = self._question(_first_user_text(llm_request))
+        responses = _function_responses(llm_request)
+        if len(responses) == len(PIPELINE):
+            return _text(responses[-1][1].get("result", ""))
+
+        def ref(step):
+            # Large outputs come back as handles, which the next tool call passes on
+            response = dict(responses)[step]
+            return response.get("artifact") or response.get("result", "")
+
+        step = PIPELINE[len(responses)]
+        requests = {
+            PLANNER: lambda: question,
+            DATA: lambda: question,
+            ANALYSIS: lambda: f"Analise os dados: {ref(DATA)}",
+            VISUALIZATION: lambda: f"Crie um gráfico de barras com os dados: {ref(DATA)}",
+            NARRATIVE: lambda: (
+                f"Pergunta: {question}\nDados: {ref(DATA)}\nAnálise: {ref(ANALYSIS)}\nGráfico: {ref(VISUALIZATION)}"
+            ),
+        }
+        return _call(step, {"request": requests[step]()})
+
+    def _planner_agent(self, llm_request) -> LlmResponse:
+        plan = [
+            {"step": number, "agent": agent, "instruction": f"Executar {agent}"}
+            for number, agent in enumerate(PIPELINE[1:], start=1)
+        ]
+        return _text(json.dumps({"plan": plan}))
+
+    def _data_engineer_agent_tool(self, llm_request) -> LlmResponse:
+        responses = _function_responses(llm_request)
+        if not responses:
+            return _call("list_tables_and_schemas", {})
+        if len(responses) == 1:
+            request = _first_user_text(llm_request)
+            sql = next(sql for question, sql in self.sql_by_question.items() if question in request)
+            return _call("execute_sql", {"query": sql})
+        return _text(responses[-1][1].get("result", ""))
+
+    def _descriptive_analyzer_agent_tool(self, llm_request) -> LlmResponse:
+        rows = find_rows(_first_user_text(llm_request)) or []
+        numeric = pd.DataFrame(rows).select_dtypes(include="number")
+        results = [
+            {"analysis_type": "descriptive_statistics", "column": column, "metrics": stats}
+            for column, stats in numeric.describe().round(4).to_dict().items()
+        ]
+        return _text(json.dumps({"results": results, "suggestions": []}, ensure_ascii=False))
+
+    def _visualization_agent_tool(self, llm_request) -> LlmResponse:
+        rows = find_rows(_first_user_text(llm_request)) or []
+        df = pd.DataFrame(rows)
+        numeric = df.select_dtypes(include="number").columns.tolist()
+        categorical = [column for column in df.columns if column not in numeric]
+        x = categorical[0] if categorical else df.columns[0]
+        y = numeric[-1] if numeric else df.columns[-1]
+        chart = {
+            "chart_spec": {
+                "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+                "data": {"values": rows},
+                "mark": "bar",
+                "encoding": {
+                    "x": {"field": x, "type": "nominal", "sort": "-y"},
+                    "y": {"field": y, "type": "quantitative"},
+                },
+            },
+            "filterable_columns": [x],
+        }
+        return _text(f"```json\n{json.dumps(chart, ensure_ascii=False)}\n```")
+
+    def _narrative_agent_tool(self, llm_request) -> LlmResponse:
+        request = _first_user_text(llm_request)
+        question = request.split("\n", 1)[0].removeprefix("Pergunta: ")
+        rows = find_rows(request) or []
+        lines = [f"## {question}", "", "Principais resultados:", ""]
+        lines += [f"- {', '.join(f'{key}: **{value}**' for key, value in row.items())}" for row in rows[:5]]
+        chart = _CHART_BLOCK_PATTERN.search(request)
+        if chart:
+            lines += ["", chart.group(0)]
+        lines += ["", "> Relatório gerado a partir dos dados consultados."]
+        return _text("\n".join(lines))
@@ -1,124 +1,134 @@
 import asyncio
-import json
 import os
-import re
+import time
 import uuid
 
 import pandas as pd
 import streamlit as st
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from google.genai import types
 
-from ai_data_analyst import config_manager
+from ai_data_analyst import config_manager, event_stream, render_cache, tracing
 from ai_data_analyst.agent import root_agent
-from ai_data_analyst.tools.postgres_mcp import list_tables_and_schemas
+from ai_data_analyst.job_queue import job_queue
+from ai_data_analyst.service_client import AgentServiceClient
+from ai_data_analyst.session_service import session_service
+from ai_data_analyst.tools import datasets
+from ai_data_analyst.tools.postgres_mcp import invalidate_schema_cache, list_tables_and_schemas
+
+# This is a single-user local app: every browser session acts as the same user,
+# which owns all the persisted chats.
+LOCAL_USER_ID = "local_user"
+
+# With AGENT_JOB_QUEUE set, questions are queued for the worker processes
+# (python -m ai_data_analyst.worker run) instead of running in the app, so an
+# analysis survives reruns, closed tabs and restarts of the app.
+AGENT_JOB_QUEUE = os.environ.get("AGENT_JOB_QUEUE", "").lower() in ("1", "true", "yes")
+JOB_POLL_SECONDS = 2
+
+# Span attributes listed in the trace panel
+TRACE_PANEL_ATTRIBUTES = [
+    "llm.prompt_tokens", "llm.completion_tokens", "llm.queue_wait_ms", "llm.attempts",
+    "tool.result_bytes", "db.rows", "db.result_bytes", "db.statement",
+]
 
 # --- Helper Functions ---
 
-def display_message_content(message_text):
-    """Display message content, rendering text and charts in order."""
-    # Regex to find vega-lite or JSON code blocks and the text around them
-    pattern = r'(.*?)(```(?:json|vega-lite)\n(.*?)\n```)'
+@st.cache_resource
+def _get_agent_service():
+    """The client of the agent services when AGENT_SERVICE_URL is set; otherwise the agents run in this app."""
+    return AgentServiceClient.from_env()
 
-    # Find all matches
-    matches = re.findall(pattern, message_text, re.DOTALL)
-    
-    # Keep track of where the last match ended
-    last_end = 0
-    
-    if not matches:
-        # If no charts are found, just display the whole message
-        st.markdown(message_text)
-        return
+def _answered_by_agent_service():
+    """Whether questions go to the agent service, whose agents query the database it is configured with."""
+    return _get_agent_service() is not None and not AGENT_JOB_QUEUE
 
-    # Iterate through matches and render content
-    for i, (pre_text, full_chart_block, chart_json_str) in enumerate(matches):
-        # Display the text that came before the chart
-        if pre_text.strip():
-            st.markdown(pre_text)
+def display_message_content(message_text):
+    """Display message content, rendering text and charts in order."""
+    # Parsing and DataFrame construction are cached by content hash, so
+    # reruns only pay the rendering cost for messages already seen.
+    prepared = render_cache.prepare_message(message_text)
+
+    for segment in prepared.segments:
+        if isinstance(segment, render_cache.TextSegment):
+            st.markdown(segment.text)
+            continue
+
+        i = segment.index
+        if segment.parse_error:
+            st.error(f"Failed to parse chart JSON: {segment.parse_error}")
+            st.code(segment.raw_json, language="json")
+            continue
+        if segment.prepare_error:
+            st.error(f"Failed to render chart {i+1}: {segment.prepare_error}")
+            st.json(segment.chart_json)
+            continue
+        if not segment.chart_spec:
+            # Log error for debugging, but don't show to user unless critical
+            # st.error("Chart specification is missing.")
+            continue
 
         # Process and display the chart
         try:
-            chart_json = json.loads(chart_json_str.strip())
-
-            # Determine if the JSON is a raw Vega-Lite spec or our custom wrapper
-            if "chart_spec" in chart_json:
-                # It's the wrapper format
-                chart_spec = chart_json.get("chart_spec", {})
-                filterable_columns = chart_json.get("filterable_columns", [])
-            else:
-                # Assume it's a raw Vega-Lite spec
-                chart_spec = chart_json
-                filterable_columns = [] # No filtering for raw specs
-
-            if not chart_spec:
-                # Log error for debugging, but don't show to user unless critical
-                # st.error("Chart specification is missing.")
-                continue
-
-            data = pd.DataFrame(chart_spec.get("data", {}).get("values", []))
-
             # If data is embedded and there are columns to filter on, show filters
-            if not data.empty and filterable_columns:
+            if segment.is_filterable:
                 st.sidebar.title(f"Chart Filters")
 
-                filtered_data = data.copy()
-
-                for col in filterable_columns:
-                    if col in data.columns:
-                        unique_values = data[col].unique()
-
-                        selected_values = st.sidebar.multiselect(
-                            label=f"Filter by {col}",
-                            options=unique_values,
-                            default=unique_values,
-                            key=f"filter_{i}_{col}"
-                        )
-
-                        filtered_data = filtered_data[filtered_data[col].isin(selected_values)]
-
-                # To avoid ambiguity when providing a filtered dataframe,
-                # create a spec without the original data.
-                spec_for_render = chart_spec.copy()
-                if 'data' in spec_for_render:
-                    del spec_for_render['data']
-
-                st.vega_lite_chart(filtered_data, spec_for_render, use_container_width=True)
+                # The filter index is built once per chart; combining selections
+                # is a test of precomputed codes and the filtered frames are memoized.
+                filter_index = segment.filter_index
+                selections = {}
+                for col in filter_index.columns:
+                    options = filter_index.options(col)
+                    selections[col] = st.sidebar.multiselect(
+                        label=f"Filter by {col}",
+                        options=options,
+                        default=options,
+                        key=f"filter_{i}_{col}"
+                    )
+
+                filtered_data = filter_index.filter(selections)
+                st.vega_lite_chart(filtered_data, segment.spec_without_data, use_container_width=True)
             else:
                 # For non-filterable charts (no filterable_columns) or charts
                 # with data from a URL (data is empty), render the spec directly.
-                st.vega_lite_chart(chart_spec, use_container_width=True)
+                st.vega_lite_chart(segment.chart_spec, use_container_width=True)
 
-        except json.JSONDecodeError as e:
-            st.error(f"Failed to parse chart JSON: {e}")
-            st.code(chart_json_str, language="json")
         except Exception as e:
             st.error(f"Failed to render chart {i+1}: {e}")
-            st.json(chart_json)
-        
-        # Update the position of the last match
-        last_end = message_text.find(full_chart_block, last_end) + len(full_chart_block)
-
-    # Display any remaining text after the last chart
-    remaining_text = message_text[last_end:].strip()
-    if remaining_text:
-        st.markdown(remaining_text)
+            st.json(segment.chart_json)
 
 def _setup_page():
     """Sets up the Streamlit page configuration and initializes the config database."""
     st.set_page_config(page_title="AI Data Analyst", layout="wide")
     config_manager.initialize_db()
+    session_service.initialize()
+    job_queue.initialize()
 
 def _render_sidebar_connection_selector(configs):
     """Renders the dropdown for selecting an active database connection."""
     st.sidebar.title("Database Connections")
     st.sidebar.caption("Select or manage your database connections.")
 
+    if _answered_by_agent_service():
+        # The service's agents never see the connection selected here
+        st.sidebar.selectbox("Active Connection", options=["Agent service database"], disabled=True)
+        st.sidebar.caption("Questions are answered by the agent service, on the database it is configured with.")
+        return None
+
     # Use session state to keep track of selected config
     if "selected_config_name" not in st.session_state:
         st.session_state.selected_config_name = configs[0] if configs else None
 
+    if AGENT_JOB_QUEUE and _has_pending_jobs():
+        # Queued questions are answered on the connection they were asked on; switching it meanwhile
+        # would show their answers next to another database's details
+        selected_name = st.session_state.selected_config_name
+        # Reassigned so Streamlit keeps the selection while its widget is not drawn
+        st.session_state.selected_config_name = selected_name
+        st.sidebar.selectbox("Active Connection", options=[selected_name], disabled=True)
+        st.sidebar.caption("The connection can be changed once the queued questions of this chat are answered.")
+        return selected_name
+
     # Dropdown to select a configuration
     selected_name = st.sidebar.selectbox(
         "Active Connection",
@@ -128,6 +138,11 @@ def _render_sidebar_connection_selector(configs):
     )
     return selected_name
 
+def _has_pending_jobs():
+    """Whether the current chat has questions the workers have not answered yet."""
+    session_id = st.session_state.get("current_chat_session_id")
+    return bool(session_id) and any(not job.finished for job in job_queue.list_jobs(session_id=session_id))
+
 def _render_sidebar_connection_crud(selected_name, configs):
     """Renders the UI for adding, editing, and deleting database connections."""
     # CRUD operations in an expander
@@ -190,6 +205,7 @@ def _render_schema_management(selected_name, config):
     if st.button(f"Load/Reload Schema for '{selected_name}'"):
         with st.spinner("Loading schema..."):
             try:
+                invalidate_schema_cache()
                 schema = list_tables_and_schemas()
                 config_manager.update_schema_and_context(
                     name=selected_name,
@@ -301,6 +317,42 @@ def _display_sidebar_active_config_info(active_config):
     else:
         st.sidebar.warning("Please select or create a database connection to proceed.")
 
+# --- Chat History Pagination ---
+# Only the most recent messages and sessions are loaded on each rerun. Older ones
+# are fetched on demand, and the messages kept in session state are capped so
+# memory per Streamlit session stays bounded.
+CHAT_PAGE_SIZE = 20
+MAX_MESSAGES_IN_STATE = 100
+SESSION_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE = 10
+
+def _load_latest_messages(session_id):
+    """Loads the most recent page of messages for a session into session state."""
+    messages, cursor = config_manager.get_chat_history_page(session_id, limit=CHAT_PAGE_SIZE)
+    st.session_state["messages"] = messages
+    st.session_state["messages_cursor"] = cursor
+    st.session_state["messages_has_newer"] = False
+
+def _load_older_messages(session_id):
+    """Prepends the previous page of messages, dropping the newest ones beyond the cap."""
+    older, cursor = config_manager.get_chat_history_page(
+        session_id, limit=CHAT_PAGE_SIZE, before=st.session_state["messages_cursor"]
+    )
+    messages = older + st.session_state["messages"]
+    if len(messages) > MAX_MESSAGES_IN_STATE:
+        messages = messages[:MAX_MESSAGES_IN_STATE]
+        st.session_state["messages_has_newer"] = True
+    st.session_state["messages"] = messages
+    st.session_state["messages_cursor"] = cursor
+
+def _append_message(message):
+    """Appends a stored message, dropping the oldest ones beyond the cap."""
+    messages = st.session_state["messages"]
+    messages.append(message)
+    if len(messages) > MAX_MESSAGES_IN_STATE:
+        del messages[:len(messages) - MAX_MESSAGES_IN_STATE]
+        st.session_state["messages_cursor"] = config_manager.message_cursor(messages[0])
+
 def _initialize_chat_components():
     """Initializes session state for chat messages and the ADK runner."""
     st.title("🤖 AI Data Analyst")
@@ -309,9 +361,10 @@ def _initialize_chat_components():
     # --- Constants ---
     APP_NAME = "ai_data_analyst_app"
     
-    # Initialize dynamic USER_ID and SESSION_ID if not already set
+    # Agent sessions are persisted, so the user id must be the same across
+    # browser sessions and restarts for past chats to be resumed.
     if "user_id" not in st.session_state:
-        st.session_state["user_id"] = str(uuid.uuid4())
+        st.session_state["user_id"] = LOCAL_USER_ID
 
     # If a chat is selected from history, use that session_id, otherwise generate a new one.
     # "selected_session_id" will be set by the chat history UI.
@@ -331,22 +384,22 @@ def _initialize_chat_components():
 
     # Initialize session state for messages and runner
     if "messages" not in st.session_state:
-        # Load chat history if available for the current_session_id
-        history = config_manager.get_chat_history(current_session_id)
-        if history:
-            st.session_state["messages"] = history
-        else:
-            st.session_state["messages"] = []
-
-    # The runner needs to be associated with the current_chat_session_id.
-    # If the session_id changes, we might need to re-initialize or update the runner's session.
-    # For ADK InMemorySessionService, creating a session with an existing ID should be fine
-    # or it might retrieve the existing one. If not, this part might need adjustment.
-    if "runner" not in st.session_state or \
-       st.session_state.get("runner_session_id") != current_session_id:
-        session_service = InMemorySessionService()
-        asyncio.run(session_service.create_session(app_name=APP_NAME, user_id=current_user_id, session_id=current_session_id))
+        # Load the most recent page of chat history for the current_session_id
+        _load_latest_messages(current_session_id)
+
+    # The agent session (state and events) lives in the shared SQLite session
+    # service, so resuming a past chat keeps the agents' earlier outputs.
+    # It is only created the first time the chat is used.
+    # With an agent service, the service runs the agents and creates the session.
+    if _get_agent_service():
+        return
+    if "runner" not in st.session_state:
         st.session_state["runner"] = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
+    if st.session_state.get("runner_session_id") != current_session_id:
+        if not session_service.has_session(app_name=APP_NAME, user_id=current_user_id, session_id=current_session_id):
+            asyncio.run(session_service.create_session(
+                app_name=APP_NAME, user_id=current_user_id, session_id=current_session_id
+            ))
         st.session_state["runner_session_id"] = current_session_id
 
 
@@ -364,50 +417,261 @@ def _display_chat_history():
         # If they are from a different session, _initialize_chat_components should clear and reload.
         pass # Relying on initialization logic for now.
 
+    current_session_id = st.session_state.get("current_chat_session_id")
+    if st.session_state.get("messages_cursor") and st.button("⬆️ Load older messages", key="load_older_messages"):
+        _load_older_messages(current_session_id)
+        st.rerun()
+
     for message in st.session_state.get("messages", []):
         with st.chat_message(message["role"]):
             display_message_content(message["content"])
 
+    has_newer = st.session_state.get("messages_has_newer")
+    if has_newer and st.button("⬇️ Back to latest messages", key="load_latest_messages"):
+        _load_latest_messages(current_session_id)
+        st.rerun()
+
 def _process_user_prompt(prompt, active_config):
     """Processes a user's chat prompt and gets a response from the AI."""
     current_session_id = st.session_state["current_chat_session_id"]
-    # Add user message to history and display it
-    st.session_state["messages"].append({"role": "user", "content": prompt})
-    config_manager.add_chat_message(current_session_id, "user", prompt) # Save user message
+    if st.session_state.get("messages_has_newer"):
+        # The window was scrolled back; new messages belong after the latest ones
+        _load_latest_messages(current_session_id)
+    # Save user message, add it to history and display it
+    _append_message(config_manager.add_chat_message(current_session_id, "user", prompt))
     with st.chat_message("user"):
         st.markdown(prompt)
 
     # Get and display assistant response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            if not active_config:
-                st.error("Please select an active database connection in the sidebar.")
-            elif not active_config.get("db_schema"):
-                st.error("Please load the database schema first for the selected connection.")
+        if _answered_by_agent_service():
+            _answer_prompt(prompt, "")
+        elif not active_config:
+            st.error("Please select an active database connection in the sidebar.")
+        elif not active_config.get("db_schema"):
+            st.error("Please load the database schema first for the selected connection.")
+        elif AGENT_JOB_QUEUE:
+            # The worker adds the answer to the chat; _render_pending_jobs shows it when it is ready
+            job_queue.submit(
+                prompt,
+                active_config.get('data_context', ''),
+                session_id=current_session_id,
+                user_id=st.session_state["user_id"],
+                save_to_chat=True,
+                config_id=active_config['id'],
+            )
+            st.rerun()
+        else:
+            _answer_prompt(prompt, active_config.get('data_context', ''))
+
+def _answer_prompt(prompt, data_context):
+    """Streams the agents' answer to the prompt and saves it to the chat."""
+    full_response = _stream_agent_response(prompt, data_context)
+    if full_response:
+        # Save assistant message and add it to history, with the data of its charts,
+        # which outlives the stored query results they were drawn from
+        full_response = datasets.inline_message_datasets(full_response)
+        current_session_id = st.session_state["current_chat_session_id"]
+        _append_message(config_manager.add_chat_message(current_session_id, "assistant", full_response))
+    else:
+        st.error("Sorry, I couldn't generate a response.")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _render_pending_jobs():
+    """Shows this chat's queued questions until the workers answer them, then reloads the chat."""
+    session_id = st.session_state["current_chat_session_id"]
+    pending = [job for job in job_queue.list_jobs(session_id=session_id) if not job.finished]
+    previous_ids = st.session_state.get("pending_job_ids", [])
+    st.session_state["pending_job_ids"] = [job.id for job in pending]
+    finished = [job_queue.get(job_id) for job_id in previous_ids if job_id not in st.session_state["pending_job_ids"]]
+    if finished:
+        st.session_state.setdefault("job_errors", []).extend(
+            f"{job.question}: {job.error}" for job in finished if job and job.status == "failed"
+        )
+        _load_latest_messages(session_id)
+        st.rerun()
+
+    for error in st.session_state.pop("job_errors", []):
+        st.error(f"The analysis failed: {error}")
+    for job in reversed(pending):
+        with st.chat_message("assistant"):
+            if job.status == "running":
+                st.info(f"Working on it (attempt {job.attempts})...")
             else:
-                structured_input = json.dumps({
-                    "user_request": prompt,
-                    "data_context": active_config.get('data_context', '')
-                })
-                content = types.Content(role="user", parts=[types.Part(text=structured_input)])
-                runner = st.session_state["runner"]
-                # Ensure runner is using the correct session_id from current_chat_session_id
-                events = runner.run(user_id=st.session_state["user_id"], session_id=st.session_state["current_chat_session_id"], new_message=content)
-
-                full_response = ""
-                for event in events:
-                    if event.is_final_response() and event.content:
-                        for part in event.content.parts:
-                            full_response += part.text
-
-                if full_response:
-                    display_message_content(full_response)
-                    st.session_state["messages"].append({"role": "assistant", "content": full_response})
-                    config_manager.add_chat_message(st.session_state["current_chat_session_id"], "assistant", full_response) # Save assistant message
-                else:
-                    st.error("Sorry, I couldn't generate a response.")
+                st.info("Queued; a worker will pick this question up shortly.")
+
+def _render_step_output(step, text):
+    """Shows the useful part of a finished step inside the progress panel."""
+    if step == event_stream.DATA_STEP:
+        records = event_stream.parse_json_output(text)
+        if isinstance(records, list) and records and isinstance(records[0], dict):
+            st.dataframe(pd.DataFrame(records), use_container_width=True, height=240)
+        elif isinstance(records, dict) and "dataset" in records:
+            # A large result stored on disk: only its first rows were returned
+            st.dataframe(pd.DataFrame(records.get("sample", [])), use_container_width=True, height=240)
+            st.caption(f"Primeiras linhas de {records.get('rows', 0):,} resultados.")
+    elif step == event_stream.VISUALIZATION_STEP:
+        # Rendered without the filter widgets, which belong to the final report
+        for segment in render_cache.prepare_message(text).segments:
+            if isinstance(segment, render_cache.ChartSegment) and segment.chart_spec:
+                st.vega_lite_chart(segment.chart_spec, use_container_width=True)
+
+def _stream_agent_response(prompt, data_context):
+    """
+    Runs the agents with streaming enabled, showing each step as it starts and
+    finishes, the data and chart as soon as they are ready, and the final
+    answer as it is generated. Returns the final answer.
+
+    The agents run in the agent service when one is configured, and in this
+    app otherwise.
+    """
+    session_id = st.session_state["current_chat_session_id"]
+    user_id = st.session_state["user_id"]
+    service = _get_agent_service()
+    if service:
+        try:
+            run_id = service.submit(prompt, data_context, session_id=session_id, user_id=user_id)
+        except Exception as e:
+            st.error(f"Could not reach the agent service: {e}")
+            return ""
+        full_response = _show_agent_events(service.updates(run_id))
+        try:
+            trace_id, spans = service.trace(run_id)
+        except Exception:
+            # The answer is still shown, without its trace
+            trace_id, spans = None, []
+    else:
+        with tracing.request_span(prompt, session_id=session_id) as span:
+            full_response = _show_agent_events(_local_updates(prompt, data_context, session_id, user_id))
+        trace_id = tracing.trace_id_of(span)
+        spans = tracing.get_trace(trace_id)
+    _render_trace_panel(trace_id, spans)
+    return full_response
+
+def _local_updates(prompt, data_context, session_id, user_id):
+    """Runs the agents in this app, yielding the updates of their events."""
+    events = event_stream.stream_events(
+        st.session_state["runner"],
+        user_id=user_id,
+        session_id=session_id,
+        new_message=event_stream.user_message(prompt, data_context),
+    )
+    for event in events:
+        yield from event_stream.interpret_event(event)
+
+def _show_agent_events(updates):
+    status = st.status("Thinking...", expanded=True)
+    answer_placeholder = st.empty()
+    streamed_text = ""
+    full_response = ""
+    step_started_at = {}
+
+    try:
+        for update in updates:
+            if update.kind == "step_started":
+                label = event_stream.step_label(update.step)
+                step_started_at[update.step] = time.perf_counter()
+                status.update(label=f"{label}...")
+            elif update.kind == "step_finished":
+                elapsed = time.perf_counter() - step_started_at.pop(update.step, time.perf_counter())
+                with status:
+                    st.markdown(f"✅ {event_stream.step_label(update.step)} ({elapsed:.1f}s)")
+                    _render_step_output(update.step, update.text)
+                if update.step == event_stream.NARRATIVE_STEP:
+                    # Show the report right away; the orchestrator's answer replaces it
+                    answer_placeholder.markdown(update.text)
+            elif update.kind == "partial_text":
+                streamed_text += update.text
+                answer_placeholder.markdown(streamed_text + "▌")
+            elif update.kind == "final_text":
+                full_response += update.text
+    except Exception as e:
+        status.update(label="Failed", state="error")
+        st.error(f"An error occurred while running the agents: {e}")
+        return ""
+
+    status.update(label="Done", state="complete", expanded=False)
+    answer_placeholder.empty()
+    if full_response:
+        display_message_content(full_response)
+    return full_response
+
+def _render_trace_panel(trace_id, spans):
+    """Shows where the time of the request went: its spans as an indented timeline."""
+    if not spans:
+        return
+    totals = {
+        "LLM calls": sum(1 for span in spans if span["name"].startswith("llm ")),
+        "tokens": sum(span["attributes"].get("llm.total_tokens", 0) for span in spans),
+        "SQL queries": sum(1 for span in spans if span["name"] == "sql"),
+        "rows": sum(span["attributes"].get("db.rows", 0) for span in spans),
+    }
+    with st.expander(f"Trace ({spans[0]['duration_ms'] / 1000:.1f}s)", expanded=False):
+        st.caption(" · ".join(f"{name}: {value}" for name, value in totals.items()))
+        rows = [{
+            "span": "· " * span["depth"] + span["name"],
+            "start (ms)": span["offset_ms"],
+            "duration (ms)": span["duration_ms"],
+            "details": ", ".join(
+                f"{key.split('.', 1)[1]}={span['attributes'][key]}"
+                for key in TRACE_PANEL_ATTRIBUTES if key in span["attributes"]
+            ),
+        } for span in spans]
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        st.caption(f"Trace {trace_id}")
 
 # --- Sidebar: Chat History Display ---
+def _open_chat_session(session_id):
+    """Switches the chat window to a past session."""
+    # 1. Store the selected session_id
+    st.session_state.selected_session_id = session_id
+
+    # 2. Update current_chat_session_id to the selected one
+    st.session_state.current_chat_session_id = session_id
+
+    # 3. Clear current messages to trigger reload in _initialize_chat_components
+    if "messages" in st.session_state:
+        del st.session_state["messages"]
+
+    # 4. Rerun the app to reload the chat and update the runner
+    st.rerun()
+
+def _render_sidebar_chat_search():
+    """
+    Renders the chat search box and, when a query is entered, its ranked results
+    in place of the session list. Returns True if results were shown.
+    """
+    query = st.sidebar.text_input("🔎 Search chats", key="chat_search_query").strip()
+    if not query:
+        return False
+
+    # Start from the first page whenever the query changes
+    if st.session_state.get("chat_search_last_query") != query:
+        st.session_state["chat_search_last_query"] = query
+        st.session_state["chat_search_offset"] = 0
+    offset = st.session_state["chat_search_offset"]
+
+    # One extra result tells whether there is a next page
+    results = config_manager.search_chat_history(query, limit=SEARCH_PAGE_SIZE + 1, offset=offset)
+    if not results:
+        st.sidebar.caption("No messages match your search.")
+        return True
+
+    for result in results[:SEARCH_PAGE_SIZE]:
+        icon = "🧑" if result["role"] == "user" else "🤖"
+        label = f"{icon} {result['snippet']} ({result['timestamp'].split('.')[0]})"
+        if st.sidebar.button(label, key=f"search_{result['id']}"):
+            _open_chat_session(result["session_id"])
+
+    previous_col, next_col = st.sidebar.columns(2)
+    if offset > 0 and previous_col.button("⬅️ Previous", key="search_previous"):
+        st.session_state["chat_search_offset"] = max(offset - SEARCH_PAGE_SIZE, 0)
+        st.rerun()
+    if len(results) > SEARCH_PAGE_SIZE and next_col.button("Next ➡️", key="search_next"):
+        st.session_state["chat_search_offset"] = offset + SEARCH_PAGE_SIZE
+        st.rerun()
+    return True
+
 def _render_sidebar_chat_history():
     """Renders the chat history list in the sidebar."""
     st.sidebar.markdown("---")
@@ -418,21 +682,24 @@ def _render_sidebar_chat_history():
         new_session_id = str(uuid.uuid4())
         st.session_state.current_chat_session_id = new_session_id
         st.session_state.selected_session_id = new_session_id # Ensure this new chat is "selected"
+        st.session_state["chat_sessions_page_cursors"] = [None] # Show the newest chats again
 
         # Clear existing messages from session state to start fresh
         if "messages" in st.session_state:
             del st.session_state["messages"]
 
-        # Potentially clear other session-specific states if necessary
-        # e.g. if runner holds onto old session data in a problematic way
-        if "runner" in st.session_state: # Force re-initialization of runner for the new session
-            del st.session_state["runner"]
-            if "runner_session_id" in st.session_state:
-                 del st.session_state["runner_session_id"]
+        # The agent session for the new chat is created on the next rerun
+        st.session_state.pop("runner_session_id", None)
 
         st.rerun() # Rerun to reflect the new chat state
 
-    chat_sessions = config_manager.get_chat_sessions_preview()
+    if _render_sidebar_chat_search():
+        return
+
+    # Sessions are shown one page at a time. The stack holds the keyset cursor
+    # of each page visited, so "Newer chats" can go back.
+    page_cursors = st.session_state.setdefault("chat_sessions_page_cursors", [None])
+    chat_sessions, next_cursor = config_manager.get_chat_sessions_page(limit=SESSION_PAGE_SIZE, before=page_cursors[-1])
 
     if not chat_sessions:
         st.sidebar.caption("No past chats found.")
@@ -447,19 +714,15 @@ def _render_sidebar_chat_history():
         # Using a button for each chat history item
         button_label = f"{preview} ({timestamp.split('.')[0]})" # Show timestamp without milliseconds
         if st.sidebar.button(button_label, key=f"chat_{session_id}"):
-            # When a chat is selected from history:
-            # 1. Store the selected session_id
-            st.session_state.selected_session_id = session_id
+            _open_chat_session(session_id)
 
-            # 2. Update current_chat_session_id to the selected one
-            st.session_state.current_chat_session_id = session_id
-
-            # 3. Clear current messages to trigger reload in _initialize_chat_components
-            if "messages" in st.session_state:
-                del st.session_state["messages"]
-
-            # 4. Rerun the app to reload the chat and update the runner
-            st.rerun()
+    newer_col, older_col = st.sidebar.columns(2)
+    if len(page_cursors) > 1 and newer_col.button("⬅️ Newer chats", key="newer_chats"):
+        page_cursors.pop()
+        st.rerun()
+    if next_cursor and older_col.button("Older chats ➡️", key="older_chats"):
+        page_cursors.append(next_cursor)
+        st.rerun()
 
 def main() -> None:
     """Main function to run the Streamlit AI Data Analyst application."""
@@ -477,11 +740,14 @@ def main() -> None:
     active_config = _get_and_set_active_db_config(selected_name)
 
     # --- Display Active Connection's Schema and Data Context in Sidebar ---
-    _display_sidebar_active_config_info(active_config)
+    if not _answered_by_agent_service():
+        _display_sidebar_active_config_info(active_config)
 
     # --- Main Content: AI Chat Interface ---
     _initialize_chat_components()
     _display_chat_history()
+    if AGENT_JOB_QUEUE:
+        _render_pending_jobs()
 
     prompt = st.chat_input("What would you like to know?")
     if prompt:
@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import artifacts, event_stream
+
+ROWS = json.dumps([{"uf": f"UF{i}", "media": 500 + i / 10} for i in range(200)])
+# How ROWS appears in a JSON-serialized request
+ROWS_IN_REQUEST = json.dumps(ROWS)[1:-1]
+
+
+class RecordingLlm(BaseLlm):
+    """Records the text of each request and returns the scripted responses in order."""
+    responses: list = []
+    prompts: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.prompts.append(llm_request.model_dump_json(include={"contents"}))
+        yield self.responses.pop(0)
+
+
+def _call(name, request):
+    part = types.Part(function_call=types.FunctionCall(name=name, args={"request": request}))
+    return LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+def _text(text):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+class FakeToolContext:
+    def __init__(self):
+        self.state = {}
+
+
+def test_resolve_handles_in_nested_arguments():
+    state = {"artifact://data_engineer_agent_tool/1": ROWS}
+
+    resolved = artifacts.resolve_handles(
+        {"request": "Plot artifact://data_engineer_agent_tool/1", "extra": ["artifact://x/9", 3]}, state
+    )
+
+    assert resolved == {"request": f"Plot {ROWS}", "extra": ["artifact://x/9", 3]}
+
+
+def test_store_keeps_the_most_recent_outputs(monkeypatch):
+    monkeypatch.setattr(artifacts, "MAX_ARTIFACTS", 2)
+    context = FakeToolContext()
+
+    handles = [artifacts.store(context, "data_engineer_agent_tool", f"output {i}") for i in range(3)]
+
+    assert handles[-1] == "artifact://data_engineer_agent_tool/3"
+    assert context.state[artifacts.ARTIFACT_INDEX_KEY] == handles[1:]
+    assert artifacts.lookup(handles[0], context.state) is None
+    assert artifacts.lookup(handles[2], context.state) == "output 2"
+
+
+def test_large_outputs_are_passed_by_handle():
+    data_agent = LlmAgent(name="data_engineer_agent_tool", model=RecordingLlm(model="fake", responses=[_text(ROWS)]))
+    visualization_agent = LlmAgent(
+        name="visualization_agent_tool", model=RecordingLlm(model="fake", responses=[_text('{"chart_spec": {}}')])
+    )
+    handle = "artifact://data_engineer_agent_tool/1"
+    root = LlmAgent(
+        name="orchestrator",
+        model=RecordingLlm(model="fake", responses=[
+            _call("data_engineer_agent_tool", "Média por UF"),
+            _call("visualization_agent_tool", f"Gráfico de barras de {handle}"),
+            _text("Relatório"),
+        ]),
+        tools=[AgentTool(agent=data_agent), AgentTool(agent=visualization_agent)],
+        before_tool_callback=artifacts.resolve_tool_arguments,
+        after_tool_callback=artifacts.store_large_output,
+    )
+    runner = InMemoryRunner(agent=root, app_name="app")
+    session = runner.session_service.create_session_sync(app_name="app", user_id="u")
+    message = types.Content(role="user", parts=[types.Part(text="Média por UF")])
+
+    events = list(runner.run(user_id="u", session_id=session.id, new_message=message))
+
+    session = runner.session_service.get_session_sync(app_name="app", user_id="u", session_id=session.id)
+    assert session.state[handle] == ROWS
+    # The orchestrator only ever sees the handle and a preview
+    assert all(ROWS_IN_REQUEST not in prompt for prompt in root.model.prompts)
+    assert handle in root.model.prompts[1]
+    # The visualization agent receives the dataset itself
+    assert ROWS_IN_REQUEST in visualization_agent.model.prompts[0]
+    # The stream shows the full output of the step
+    updates = [update for event in events for update in event_stream.interpret_event(event)]
+    data_step = next(u for u in updates if u.kind == "step_finished" and u.step == "data_engineer_agent_tool")
+    assert data_step.text == ROWS
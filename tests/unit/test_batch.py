@@ -0,0 +1,95 @@
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmResponse
+from google.genai import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import batch, llm_scheduler
+from ai_data_analyst.batch import BatchQuestion
+from ai_data_analyst.llm_scheduler import LlmScheduler
+from ai_data_analyst.tools import postgres_mcp
+from ai_data_analyst.tools.query_cache import QueryCache
+
+REPORT = """Média por estado:
+
+```json
+{"chart_spec": {"mark": "bar", "data": {"values": [{"sg_uf": "SP", "nota": 600}]}}}
+```
+"""
+
+
+class AnalystLlm(BaseLlm):
+    """Queries the database, then answers with a chart; records how many requests it served at once."""
+    active: int = 0
+    max_active: int = 0
+    lock: object = None
+
+    async def generate_content_async(self, llm_request, stream=False):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        last = llm_request.contents[-1].parts[0]
+        if last.function_response:
+            part = types.Part(text=REPORT)
+        elif "falhe" in last.text:
+            raise ValueError("model unavailable")
+        else:
+            query = "SELECT sg_uf, AVG(nu_nota_mt) FROM microdados_enem_2023 GROUP BY sg_uf"
+            part = types.Part(function_call=types.FunctionCall(name="execute_sql", args={"query": query}))
+        yield LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+@pytest.fixture
+def analyst(tmp_path, monkeypatch):
+    path = tmp_path / "enem.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE microdados_enem_2023 (sg_uf TEXT, nu_nota_mt REAL)")
+        conn.executemany("INSERT INTO microdados_enem_2023 VALUES (?, ?)", [("SP", 600.0), ("RJ", 550.0)])
+    monkeypatch.setattr(postgres_mcp, "_database_url", lambda: f"sqlite:///{path}")
+    monkeypatch.setattr(postgres_mcp, "_engines", {})
+    monkeypatch.setattr(postgres_mcp, "query_cache", QueryCache(ttl=60, max_entries=8))
+    monkeypatch.setattr(llm_scheduler, "scheduler", LlmScheduler())
+    model = AnalystLlm(model="analyst", lock=threading.Lock())
+    return model, LlmAgent(name="orchestrator", model=model, tools=[postgres_mcp.execute_sql])
+
+
+def test_questions_are_read_from_text_and_json_lines(tmp_path):
+    text = tmp_path / "questions.txt"
+    text.write_text("# Pacote SP\nQual a média em matemática?\n\nQuantos inscritos?\n", encoding="utf-8")
+    lines = tmp_path / "questions.jsonl"
+    lines.write_text('{"id": "sp_mt", "question": "Média?", "data_context": "ENEM 2023"}\n', encoding="utf-8")
+
+    assert [q.id for q in batch.load_questions(str(text))] == [
+        "001_qual_a_média_em_matemática", "002_quantos_inscritos"
+    ]
+    assert batch.load_questions(str(lines)) == [BatchQuestion("sp_mt", "Média?", "ENEM 2023")]
+
+
+def test_batch_writes_reports_charts_and_summary(analyst, tmp_path):
+    model, agent = analyst
+    questions = [BatchQuestion(f"q{i}", f"Média em matemática, pergunta {i}") for i in range(4)]
+    questions.append(BatchQuestion("broken", "falhe"))
+
+    results = batch.run_batch(questions, str(tmp_path / "out"), workers=4, agent=agent)
+
+    assert [result.status for result in results] == ["ok"] * 4 + ["error"]
+    assert model.max_active > 1
+    out = tmp_path / "out"
+    assert "Média por estado" in (out / "q0.md").read_text(encoding="utf-8")
+    assert json.loads((out / "q0_chart1.vl.json").read_text(encoding="utf-8"))["mark"] == "bar"
+    assert results[0].steps["execute_sql"] >= 0
+    summary = json.loads((out / "summary.json").read_text(encoding="utf-8"))
+    assert summary["succeeded"] == 4 and summary["results"][4]["error"] == "model unavailable"
+    with open(out / "summary.csv", encoding="utf-8") as f:
+        assert len(list(csv.DictReader(f))) == 5
@@ -0,0 +1,107 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst.tools.chart_filters import ChartFilterIndex
+
+DATA = pd.DataFrame({
+    "region": ["N", "S", "N", "SE", "S", None],
+    "school": ["public", "private", "private", "public", "public", "public"],
+    "score": [500, 620, 580, 540, 510, 470],
+})
+
+
+def _isin_filter(data, selections):
+    """The straightforward filtering the index replaces."""
+    filtered = data.copy()
+    for col, values in selections.items():
+        filtered = filtered[filtered[col].isin(values)]
+    return filtered
+
+
+def test_options_keep_order_of_appearance():
+    """Options match the column's unique values, missing values included."""
+    index = ChartFilterIndex(DATA, ["region", "school"])
+    assert index.options("school") == ["public", "private"]
+    assert index.options("region")[:3] == ["N", "S", "SE"]
+    assert pd.isna(index.options("region")[3])
+
+
+def test_unknown_columns_are_ignored():
+    """Filterable columns that are not in the data are skipped."""
+    index = ChartFilterIndex(DATA, ["region", "missing_column"])
+    assert index.columns == ["region"]
+
+
+def test_all_values_selected_returns_original_frame():
+    """No copy is made when every value of every column is selected."""
+    index = ChartFilterIndex(DATA, ["region", "school"])
+    selections = {col: index.options(col) for col in index.columns}
+    assert index.filter(selections) is DATA
+
+
+def test_combined_selections_match_isin_filtering():
+    """Bitmap intersection selects the same rows as successive isin masks."""
+    index = ChartFilterIndex(DATA, ["region", "school"])
+    selections = {"region": ["N", "S"], "school": ["public"]}
+
+    result = index.filter(selections)
+
+    pd.testing.assert_frame_equal(result, _isin_filter(DATA, selections))
+
+
+def test_missing_values_can_be_selected():
+    """A missing value is selectable like any other option."""
+    index = ChartFilterIndex(DATA, ["region"])
+    nan_option = index.options("region")[3]
+
+    result = index.filter({"region": [nan_option]})
+
+    assert result["score"].tolist() == [470]
+
+
+def test_empty_selection_filters_everything():
+    """Deselecting every value of a column yields an empty frame."""
+    index = ChartFilterIndex(DATA, ["region", "school"])
+    assert index.filter({"school": []}).empty
+    assert not index.mask({"school": []}).any()
+
+
+def test_filtered_frames_are_memoized():
+    """The same selection returns the memoized frame."""
+    index = ChartFilterIndex(DATA, ["region"])
+    first = index.filter({"region": ["S"]})
+    second = index.filter({"region": ["S"]})
+    assert first is second
+    assert np.array_equal(index.mask({"region": ["S"]}), (DATA["region"] == "S").to_numpy())
+
+
+def test_index_memory_grows_with_rows_not_distinct_values():
+    """A high-cardinality column costs one small code per row."""
+    data = pd.DataFrame({"school_id": np.arange(100_000) % 5_000})
+    index = ChartFilterIndex(data, ["school_id"])
+
+    assert index.nbytes == 2 * len(data)
+    assert len(index.filter({"school_id": [1, 4_999]})) == 40
+
+
+def test_equal_values_of_different_types_are_distinct_options():
+    data = pd.DataFrame({
+        "answer": [True, 1, 1.0, False, 0, True, [1, 2]],
+        "flag": [True, False, True, True, False, False, True],
+        "count": [1, 0, 1, 1, 0, 2, 1],
+    })
+    index = ChartFilterIndex(data, ["answer", "flag", "count"])
+
+    assert index.options("answer") == [True, 1, 1.0, False, 0, [1, 2]]
+    assert [type(option) for option in index.options("answer")[:3]] == [bool, int, float]
+    assert index.filter({"answer": [True]}).index.tolist() == [0, 5]
+    assert index.filter({"answer": [1]}).index.tolist() == [1]
+    assert index.filter({"answer": [[1, 2]]}).index.tolist() == [6]
+    # bool and int columns match selections of their own type only
+    assert index.filter({"flag": [True]}).index.tolist() == [0, 2, 3, 6]
+    assert index.filter({"count": [1]}).index.tolist() == [0, 2, 3, 6]
+    assert index.filter({"count": [True]}).empty
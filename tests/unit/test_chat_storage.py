@@ -0,0 +1,74 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import chat_storage
+
+ROWS = [{"region": f"region {i % 5}", "score": 400 + i} for i in range(200)]
+
+
+def _report(mark, rows=ROWS, title="Scores"):
+    spec = {"title": title, "data": {"values": rows}, "mark": mark, "encoding": {"x": {"field": "region"}}}
+    return f"## Report\n\nAverage scores by region.\n\n```json\n{json.dumps(spec, indent=2)}\n```\n\nDone."
+
+
+def _load(blobs):
+    return lambda keys: {key: chat_storage.compress(blobs[key]) for key in keys if key in blobs}
+
+
+def test_pack_roundtrip_is_exact():
+    content = _report("bar") + "\n\n" + _report("line", title="Trend")
+    packed = chat_storage.pack_message(content, preview_chars=200)
+
+    assert chat_storage.unpack_message(packed.data, _load(packed.blobs), chat_storage.BlobCache()) == content
+    assert packed.preview.startswith("## Report")
+    assert "\x00" not in packed.preview
+
+
+def test_missing_blob_is_shown_as_a_placeholder(caplog):
+    content = _report("bar")
+    packed = chat_storage.pack_message(content, preview_chars=200)
+    dataset_key = next(key for key, text in packed.blobs.items() if text.startswith("["))
+    blobs = {key: text for key, text in packed.blobs.items() if key != dataset_key}
+
+    unpacked = chat_storage.unpack_message(packed.data, _load(blobs), chat_storage.BlobCache())
+
+    assert unpacked.startswith("## Report") and unpacked.endswith("Done.")
+    assert chat_storage.MISSING_BLOB_TEXT.format(dataset_key) in unpacked
+    assert dataset_key in caplog.text
+
+
+def test_same_dataset_is_one_blob_across_specs():
+    """Different specs plotting the same data share the dataset blob."""
+    bar = chat_storage.pack_message(_report("bar"), preview_chars=50)
+    line = chat_storage.pack_message(_report("line"), preview_chars=50)
+
+    # One chart blob and one dataset blob each; only the dataset is shared
+    assert len(bar.blobs) == len(line.blobs) == 2
+    assert len(set(bar.blobs) & set(line.blobs)) == 1
+    assert len(bar.data) < len(_report("bar")) // 10
+
+
+def test_small_and_user_messages_are_not_packed():
+    assert not chat_storage.should_pack("assistant", "short answer")
+    assert not chat_storage.should_pack("user", _report("bar"))
+    assert not chat_storage.should_pack("assistant", _report("bar") + "\x00")
+    assert chat_storage.should_pack("assistant", _report("bar"))
+
+
+def test_small_charts_stay_inline():
+    content = _report("bar", rows=ROWS[:2]) + " " * chat_storage.PACK_MIN_CHARS
+    packed = chat_storage.pack_message(content, preview_chars=50)
+    assert packed.blobs == {}
+    assert chat_storage.unpack_message(packed.data, _load({}), chat_storage.BlobCache()) == content
+
+
+def test_blob_cache_is_bounded():
+    cache = chat_storage.BlobCache(max_bytes=10)
+    cache.put("a", "12345")
+    cache.put("b", "67890")
+    cache.put("c", "x")
+    assert cache.get("a") is None
+    assert cache.get("b") == "67890"
+    assert cache.get("c") == "x"
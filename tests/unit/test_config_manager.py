@@ -45,14 +45,21 @@ def temporary_db(monkeypatch):
     monkeypatch.setattr(config_manager, 'ENCRYPTION_KEY', new_key)
     monkeypatch.setattr(config_manager, 'fernet', Fernet(new_key))
 
+    # Cached configs from a previous test were encrypted with another key
+    config_manager.invalidate_config_cache()
+
     # Initialize the database schema in the test DB
     config_manager.initialize_db()
 
     yield # Test runs here
 
-    # Teardown: Remove the test database and key file after the test
-    if os.path.exists(TEST_DB_FILE):
-        os.remove(TEST_DB_FILE)
+    # Teardown: Stop the write-behind writer, close pooled connections,
+    # then remove the test database (and its WAL files) and key file
+    config_manager.disable_write_behind()
+    config_manager.close_all_connections()
+    for path in (TEST_DB_FILE, TEST_DB_FILE + "-wal", TEST_DB_FILE + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
     if os.path.exists(test_key_file):
         os.remove(test_key_file)
 
@@ -144,6 +151,432 @@ def test_get_chat_sessions_preview_content_truncation(temporary_db):
     assert len(previews[0]["preview_content"]) == 53 # 50 chars + "..."
     assert previews[0]["timestamp"] == "2023-01-03 10:00:00"
 
+@freeze_time("2023-01-04 08:00:00")
+def test_get_chat_sessions_preview_summary_and_pagination(temporary_db):
+    """The session summary tracks activity and supports paginated retrieval."""
+    for hour, session_id in enumerate(["session_1", "session_2", "session_3"]):
+        with freeze_time(f"2023-01-04 {10 + hour}:00:00"):
+            config_manager.add_chat_message(session_id, "user", f"Question for {session_id}")
+        with freeze_time(f"2023-01-04 {10 + hour}:05:00"):
+            config_manager.add_chat_message(session_id, "assistant", "Answer")
+
+    first_page = config_manager.get_chat_sessions_preview(limit=2)
+    second_page = config_manager.get_chat_sessions_preview(limit=2, offset=2)
+
+    assert [p["session_id"] for p in first_page] == ["session_3", "session_2"]
+    assert [p["session_id"] for p in second_page] == ["session_1"]
+    assert first_page[0]["message_count"] == 2
+    assert first_page[0]["last_activity"] == "2023-01-04 12:05:00"
+    assert first_page[0]["preview_content"] == "Question for session_3"
+
+def test_chat_sessions_backfilled_from_existing_history(temporary_db):
+    """History written before the summary table existed is summarized on initialization."""
+    conn = config_manager.get_db_connection()
+    conn.execute("DROP TRIGGER chat_history_update_session")
+    conn.execute("DROP TABLE chat_sessions")
+    conn.executemany(
+        "INSERT INTO chat_history (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+        [
+            ("legacy", "user", "Legacy question", "2022-12-31 09:00:00"),
+            ("legacy", "assistant", "Legacy answer", "2022-12-31 09:01:00"),
+        ]
+    )
+    conn.commit()
+
+    config_manager.initialize_db()
+
+    (preview,) = config_manager.get_chat_sessions_preview()
+    assert preview["session_id"] == "legacy"
+    assert preview["preview_content"] == "Legacy question"
+    assert preview["message_count"] == 2
+    assert preview["last_activity"] == "2022-12-31 09:01:00"
+
+def test_add_chat_message_returns_stored_message(temporary_db):
+    """The stored message is returned with its id and timestamp."""
+    with freeze_time("2023-01-05 10:00:00"):
+        message = config_manager.add_chat_message("session_ret", "user", "Hello")
+
+    assert message["role"] == "user"
+    assert message["content"] == "Hello"
+    assert message["timestamp"] == "2023-01-05 10:00:00"
+    assert config_manager.get_chat_history_page("session_ret")[0][0]["id"] == message["id"]
+
+def test_get_chat_history_page_keyset_pagination(temporary_db):
+    """Pages walk back through history by (timestamp, id), including identical timestamps."""
+    with freeze_time("2023-01-05 10:00:00"):
+        for i in range(3):
+            config_manager.add_chat_message("session_pages", "user", f"tied {i}")
+    for i in range(3, 5):
+        with freeze_time(f"2023-01-05 10:0{i}:00"):
+            config_manager.add_chat_message("session_pages", "assistant", f"message {i}")
+
+    latest, cursor = config_manager.get_chat_history_page("session_pages", limit=2)
+    middle, cursor2 = config_manager.get_chat_history_page("session_pages", limit=2, before=cursor)
+    oldest, cursor3 = config_manager.get_chat_history_page("session_pages", limit=2, before=cursor2)
+
+    assert [m["content"] for m in latest] == ["message 3", "message 4"]
+    assert [m["content"] for m in middle] == ["tied 1", "tied 2"]
+    assert [m["content"] for m in oldest] == ["tied 0"]
+    assert cursor == config_manager.message_cursor(latest[0])
+    assert cursor3 is None
+
+def test_get_chat_sessions_page_keyset_pagination(temporary_db):
+    """Session pages are newest first and end with a None cursor."""
+    for i in range(5):
+        with freeze_time(f"2023-01-06 1{i}:00:00"):
+            config_manager.add_chat_message(f"session_{i}", "user", f"Question {i}")
+
+    first, cursor = config_manager.get_chat_sessions_page(limit=3)
+    second, cursor2 = config_manager.get_chat_sessions_page(limit=3, before=cursor)
+
+    assert [s["session_id"] for s in first] == ["session_4", "session_3", "session_2"]
+    assert [s["session_id"] for s in second] == ["session_1", "session_0"]
+    assert cursor2 is None
+
+def test_connection_is_reused_and_tuned(temporary_db):
+    """The same thread reuses one connection, configured for WAL and NORMAL sync."""
+    first = config_manager.get_db_connection()
+    config_manager.get_all_config_names()
+    assert config_manager.get_db_connection() is first
+
+    assert first.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert first.execute("PRAGMA synchronous").fetchone()[0] == 1 # NORMAL
+    assert first.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+
+def test_connections_are_per_thread(temporary_db):
+    """Each thread gets its own connection, and writes are visible across threads."""
+    import threading
+    seen = {}
+
+    def worker():
+        seen["conn"] = config_manager.get_db_connection()
+        config_manager.add_config("from_thread", "localhost", 5432, "db", "user", "secret")
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert seen["conn"] is not config_manager.get_db_connection()
+    assert config_manager.get_all_config_names() == ["from_thread"]
+
+def test_connections_close_when_their_thread_ends(temporary_db):
+    """Short-lived threads (reruns, agent runs, heartbeats) do not leave connections open."""
+    import threading
+    manager = config_manager.connection_manager
+    config_manager.get_db_connection()
+    before = manager.open_connections
+
+    threads = [threading.Thread(target=config_manager.get_all_config_names) for _ in range(50)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+
+    assert manager.open_connections == before
+
+def test_db_metrics_record_operations(temporary_db):
+    """Latency metrics are recorded per operation."""
+    config_manager.add_chat_message("session_metrics", "user", "Hi")
+    config_manager.get_chat_history("session_metrics")
+    config_manager.get_chat_history("session_metrics")
+
+    metrics = config_manager.get_db_metrics()
+    assert metrics["get_chat_history"]["count"] >= 2
+    assert metrics["add_chat_message"]["max_ms"] >= 0
+
+def test_write_behind_batches_and_keeps_session_order(temporary_db):
+    """Queued messages from many threads are committed in batches, in order per session."""
+    import threading
+    config_manager.enable_write_behind()
+
+    def worker(n):
+        for i in range(50):
+            message = config_manager.add_chat_message(f"session_{n}", "user", f"message {i}")
+            assert message["id"] is None
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Reads wait for the queued writes
+    for n in range(4):
+        history = config_manager.get_chat_history(f"session_{n}")
+        assert [m["content"] for m in history] == [f"message {i}" for i in range(50)]
+    assert config_manager.chat_writer.pending == 0
+    assert config_manager.chat_writer.batches_written < 200
+    assert config_manager.get_chat_sessions_preview()[0]["message_count"] == 50
+
+def test_write_behind_drains_on_stop(temporary_db):
+    """Disabling write-behind commits everything still queued."""
+    config_manager.enable_write_behind()
+    for i in range(10):
+        config_manager.add_chat_message("session_drain", "assistant", f"answer {i}")
+    config_manager.disable_write_behind()
+
+    conn = sqlite3.connect(TEST_DB_FILE)
+    count = conn.execute("SELECT COUNT(*) FROM chat_history WHERE session_id = 'session_drain'").fetchone()[0]
+    conn.close()
+    assert count == 10
+
+def test_write_behind_keeps_failed_rows_and_reads_do_not_hang(temporary_db, monkeypatch):
+    """A batch that keeps failing stays queued and is written once the database recovers."""
+    insert = config_manager._insert_chat_messages
+    failing = {"on": True}
+
+    def flaky_insert(conn, rows):
+        if failing["on"]:
+            raise sqlite3.OperationalError("disk I/O error")
+        return insert(conn, rows)
+
+    monkeypatch.setattr(config_manager, "_insert_chat_messages", flaky_insert)
+    monkeypatch.setattr(config_manager, "WRITE_BEHIND_MAX_RETRIES", 1)
+    monkeypatch.setattr(config_manager, "WRITE_BEHIND_RETRY_INTERVAL", 0.05)
+    config_manager.enable_write_behind()
+    config_manager.add_chat_message("session_flaky", "assistant", "answer")
+
+    assert not config_manager.flush_chat_writes(timeout=2)
+    assert config_manager.chat_writer.pending == 1
+
+    failing["on"] = False
+    assert config_manager.flush_chat_writes(timeout=2)
+    assert [m["content"] for m in config_manager.get_chat_history("session_flaky")] == ["answer"]
+
+def test_flush_restarts_a_stopped_writer(temporary_db):
+    """Rows queued for a writer whose thread is gone are written when a read flushes them."""
+    writer = config_manager.ChatWriteBehind()
+    writer.enqueue(("session_restart", "user", "hello", config_manager.datetime.now()))
+
+    assert writer.flush(timeout=2)
+    writer.stop()
+    assert [m["content"] for m in config_manager.get_chat_history("session_restart")] == ["hello"]
+
+@freeze_time("2023-01-07 10:00:00")
+def test_history_page_before_queued_message(temporary_db):
+    """A cursor taken from a queued message (no id yet) still pages back correctly."""
+    config_manager.add_chat_message("session_q", "user", "stored")
+    config_manager.enable_write_behind()
+    with freeze_time("2023-01-07 10:01:00"):
+        queued = config_manager.add_chat_message("session_q", "assistant", "queued")
+
+    older, cursor = config_manager.get_chat_history_page("session_q", before=config_manager.message_cursor(queued))
+    assert [m["content"] for m in older] == ["stored"]
+    assert cursor is None
+
+def test_config_cache_serves_repeated_reads(temporary_db):
+    """Repeated reads skip the database, and callers get independent copies."""
+    config_manager.add_config("cached", "localhost", 5432, "db", "user", "secret")
+    config_manager.reset_db_metrics()
+
+    first = config_manager.get_config_by_name("cached")
+    first["db_host"] = "mutated"
+    second = config_manager.get_config_by_name("cached")
+    config_manager.get_all_config_names()
+    config_manager.get_all_config_names()
+
+    assert second["db_host"] == "localhost"
+    assert second["db_password"] == "secret"
+    metrics = config_manager.get_db_metrics()
+    assert metrics["get_config_by_name"]["count"] == 1
+    assert metrics["get_all_config_names"]["count"] == 1
+    assert config_manager.get_config_cache_stats()["hits"] >= 2
+
+def test_config_cache_is_invalidated_by_writes(temporary_db):
+    """Every write bumps the generation, so later reads see the new data."""
+    config_manager.add_config("cached", "localhost", 5432, "db", "user", "secret")
+    assert config_manager.get_config_by_name("missing") is None
+    config_manager.get_config_by_name("cached")
+    generation = config_manager.get_config_cache_stats()["generation"]
+
+    config_manager.update_config("cached", "renamed", "remote", 5433, "db", "user", "new_secret")
+    assert config_manager.get_config_cache_stats()["generation"] == generation + 1
+    assert config_manager.get_config_by_name("cached") is None
+    assert config_manager.get_config_by_name("renamed")["db_password"] == "new_secret"
+
+    config_manager.update_schema_and_context("renamed", "schema", "context")
+    assert config_manager.get_config_by_name("renamed")["db_schema"] == "schema"
+
+    config_manager.add_config("missing", "localhost", 5432, "db", "user", "pw")
+    assert config_manager.get_config_by_name("missing") is not None
+    config_manager.delete_config("renamed")
+    assert config_manager.get_config_by_name("renamed") is None
+    assert config_manager.get_all_config_names() == ["missing"]
+
+def test_config_cache_sees_writes_of_other_processes(temporary_db, monkeypatch):
+    """A process' cached config is dropped once another process edits the configurations."""
+    config_manager.add_config("cached", "localhost", 5432, "db", "user", "secret")
+    assert config_manager.get_config_by_name("cached")["db_host"] == "localhost"
+    assert config_manager.get_all_config_names() == ["cached"]
+    this_process = config_manager.config_cache
+
+    # Another process has a cache of its own
+    monkeypatch.setattr(config_manager, "config_cache", config_manager.ConfigCache())
+    config_manager.update_config("cached", "cached", "remote", 5433, "db", "user", "new_secret")
+    config_manager.add_config("other", "localhost", 5432, "db", "user", "pw")
+    monkeypatch.setattr(config_manager, "config_cache", this_process)
+
+    config = config_manager.get_config_by_name("cached")
+    assert (config["db_host"], config["db_password"]) == ("remote", "new_secret")
+    assert config_manager.get_all_config_names() == ["cached", "other"]
+
+def test_config_cache_redecrypts_expired_password(temporary_db, monkeypatch):
+    """An expired decrypted password is decrypted again from the cached token."""
+    monkeypatch.setattr(config_manager, "CONFIG_PASSWORD_TTL", 0)
+    config_manager.add_config("cached", "localhost", 5432, "db", "user", "secret")
+    config_manager.get_config_by_name("cached")
+
+    calls = []
+    original = config_manager._decrypt
+    monkeypatch.setattr(config_manager, "_decrypt", lambda token: calls.append(token) or original(token))
+
+    assert config_manager.get_config_by_name("cached")["db_password"] == "secret"
+    assert len(calls) == 1
+
+def _chart_report(mark):
+    import json
+    rows = [{"uf": f"UF{i % 27}", "nota": 500 + i} for i in range(300)]
+    spec = {"data": {"values": rows}, "mark": mark, "encoding": {"x": {"field": "uf"}}}
+    return f"Relatório de notas por UF.\n\n```json\n{json.dumps(spec)}\n```\n"
+
+def _blob_count():
+    conn = config_manager.get_db_connection()
+    return conn.execute("SELECT COUNT(*), COALESCE(SUM(refcount), 0) FROM chat_blobs").fetchone()
+
+def test_large_assistant_messages_are_packed_and_restored(temporary_db):
+    """Packed messages come back verbatim, and repeated datasets are stored once."""
+    config_manager.add_chat_message("session_pack", "user", "Notas por UF")
+    config_manager.add_chat_message("session_pack", "assistant", _chart_report("bar"))
+    config_manager.add_chat_message("session_pack", "assistant", _chart_report("line"))
+
+    history = config_manager.get_chat_history("session_pack")
+    assert [m["content"] for m in history[1:]] == [_chart_report("bar"), _chart_report("line")]
+    page, _ = config_manager.get_chat_history_page("session_pack")
+    assert page[2]["content"] == _chart_report("line")
+
+    row = config_manager.get_db_connection().execute(
+        "SELECT content, content_encoding, length(packed_content) FROM chat_history WHERE role = 'assistant'"
+    ).fetchone()
+    assert row[0] == "Relatório de notas por UF.\n\n```json\n"
+    assert row[1] == "zlib"
+    assert row[2] < 1000
+    # Two chart blobs and one shared dataset blob referenced twice
+    assert tuple(_blob_count()) == (3, 4)
+
+def test_delete_chat_session_releases_blobs(temporary_db):
+    """Blobs are deleted once no remaining message references them."""
+    config_manager.add_chat_message("session_a", "assistant", _chart_report("bar"))
+    config_manager.add_chat_message("session_b", "assistant", _chart_report("bar"))
+
+    config_manager.delete_chat_session("session_a")
+    assert tuple(_blob_count()) == (2, 2)
+    assert config_manager.get_chat_history("session_b")[0]["content"] == _chart_report("bar")
+    assert [s["session_id"] for s in config_manager.get_chat_sessions_preview()] == ["session_b"]
+
+    config_manager.delete_chat_session("session_b")
+    assert tuple(_blob_count()) == (0, 0)
+
+def test_pack_chat_history_packs_existing_rows(temporary_db):
+    """Rows stored before packing existed are packed in place."""
+    conn = config_manager.get_db_connection()
+    conn.execute(
+        "INSERT INTO chat_history (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+        ("session_old", "assistant", _chart_report("bar"), "2023-01-01 10:00:00")
+    )
+    conn.commit()
+
+    assert config_manager.pack_chat_history() == 1
+    assert config_manager.pack_chat_history() == 0
+    assert config_manager.get_chat_history("session_old")[0]["content"] == _chart_report("bar")
+
+def _drop_search_index(conn):
+    conn.execute("DROP TABLE chat_history_fts")
+
+def test_search_chat_history_ranks_matches(temporary_db):
+    """Search matches words by prefix, ignores accents and chart JSON, and pages results."""
+    config_manager.add_chat_message("session_math", "user", "Qual a média de matemática por região?")
+    config_manager.add_chat_message(
+        "session_math", "assistant", "A média de matemática é maior no Sudeste." + _chart_report("bar")
+    )
+    config_manager.add_chat_message("session_essay", "user", "Notas de redação por escola pública")
+
+    results = config_manager.search_chat_history("matematica medi")
+    assert {r["session_id"] for r in results} == {"session_math"}
+    assert len(results) == 2
+    assert "**" in results[0]["snippet"]
+
+    # Words that only occur inside chart JSON are not indexed
+    assert config_manager.search_chat_history("encoding") == []
+    assert [r["session_id"] for r in config_manager.search_chat_history("redação")] == ["session_essay"]
+    assert len(config_manager.search_chat_history("matemática", limit=1, offset=1)) == 1
+
+def test_search_chat_history_handles_fts_syntax(temporary_db):
+    """Quotes, operators and empty queries are treated as plain text."""
+    config_manager.add_chat_message("session_q", "user", 'Compare "NOT" AND OR scores')
+    assert config_manager.search_chat_history('"NOT" AND (')[0]["session_id"] == "session_q"
+    assert config_manager.search_chat_history("  *  ") == []
+
+def test_search_falls_back_to_like_only_without_index_or_on_fts_syntax_errors(temporary_db, monkeypatch):
+    config_manager.add_chat_message("session_q", "user", "taxa de abstenção")
+    monkeypatch.setattr(config_manager, "_fts_query", lambda terms: "AND (")
+    assert [r["session_id"] for r in config_manager.search_chat_history("taxa")] == ["session_q"]
+
+    monkeypatch.setattr(config_manager, "SEARCH_MAX_CANDIDATES", "missing_column")
+    with pytest.raises(sqlite3.OperationalError, match="missing_column"):
+        config_manager.search_chat_history("taxa")
+
+    conn = config_manager.get_db_connection()
+    _drop_search_index(conn)
+    conn.commit()
+    assert [r["session_id"] for r in config_manager.search_chat_history("taxa")] == ["session_q"]
+
+def test_search_index_follows_deletes_and_backfills(temporary_db):
+    """Deleted messages leave the index, and old rows are indexed when the index is created."""
+    config_manager.add_chat_message("session_del", "user", "evasão escolar")
+    config_manager.delete_chat_session("session_del")
+    assert config_manager.search_chat_history("evasao") == []
+
+    conn = config_manager.get_db_connection()
+    _drop_search_index(conn)
+    conn.execute(
+        "INSERT INTO chat_history (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+        ("session_old", "user", "taxa de abstenção", "2023-01-01 10:00:00")
+    )
+    conn.commit()
+    config_manager.initialize_db()
+    assert [r["session_id"] for r in config_manager.search_chat_history("abstencao")] == ["session_old"]
+
+def test_search_index_does_not_store_message_text(temporary_db):
+    """The index is contentless, and an index reading a stored copy of the text is replaced."""
+    conn = config_manager.get_db_connection()
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(chat_history)")}
+    assert "search_text" not in columns
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'chat_history_fts_content'").fetchone()[0] == 0
+
+    _drop_search_index(conn)
+    conn.execute("ALTER TABLE chat_history ADD COLUMN search_text TEXT")
+    conn.execute(
+        "INSERT INTO chat_history (session_id, role, content, timestamp, search_text) VALUES (?, ?, ?, ?, ?)",
+        ("session_v1", "user", "taxa de evasão", "2023-01-01 10:00:00", "taxa de evasão")
+    )
+    conn.execute("""
+        CREATE VIRTUAL TABLE chat_history_fts USING fts5(search_text, content='chat_history', content_rowid='id')
+    """)
+    conn.commit()
+    config_manager.initialize_db()
+
+    assert "search_text" not in {row[1] for row in conn.execute("PRAGMA table_info(chat_history)")}
+    assert [r["session_id"] for r in config_manager.search_chat_history("evasao")] == ["session_v1"]
+
+def test_search_falls_back_to_like_without_index(temporary_db):
+    config_manager.add_chat_message("session_like", "user", "nota_final por estado")
+    conn = config_manager.get_db_connection()
+    _drop_search_index(conn)
+    conn.commit()
+
+    results = config_manager.search_chat_history("nota_final")
+    assert [r["session_id"] for r in results] == ["session_like"]
+    assert config_manager.search_chat_history("nota_fina1") == []
+
 # To run these tests, navigate to the root of the project and run:
 # python -m pytest tests/unit/test_config_manager.py
 # (Ensure pytest and freezegun are installed: pip install pytest freezegun)
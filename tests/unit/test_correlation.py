@@ -0,0 +1,126 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst.tools import correlation
+from ai_data_analyst.tools.chart_helpers import analyze_chart_data
+
+
+@pytest.fixture
+def wide_scores():
+    """Noise columns plus two score columns with planted relationships."""
+    rng = np.random.default_rng(42)
+    df = pd.DataFrame(rng.normal(size=(300, 40)), columns=[f"col_{i}" for i in range(40)])
+    df["nu_nota_mt"] = df["col_0"] * 3 + rng.normal(scale=0.2, size=300)
+    df["nu_nota_cn"] = -df["col_7"] + rng.normal(scale=0.3, size=300)
+    df["tp_escola"] = rng.choice(["publica", "privada"], size=300)
+    return df
+
+
+def _reference_pairs(df, method, threshold):
+    """Pairs found by scanning the full pandas matrix pair by pair."""
+    numeric = df.select_dtypes(include=["number"])
+    matrix = numeric.corr(method=method)
+    columns = numeric.columns
+    return [
+        (a, b, matrix.loc[a, b])
+        for i, a in enumerate(columns)
+        for b in columns[i + 1:]
+        if not pd.isna(matrix.loc[a, b]) and abs(matrix.loc[a, b]) > threshold
+    ]
+
+
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+@pytest.mark.parametrize("block_size", [4, 64])
+def test_correlated_pairs_match_pandas(wide_scores, method, block_size):
+    """Blockwise upper-triangle extraction finds the same pairs as the full matrix."""
+    result = correlation.correlated_pairs(wide_scores, method=method, threshold=0.1, block_size=block_size)
+    expected = _reference_pairs(wide_scores, method, 0.1)
+
+    assert [pair[:2] for pair in result] == [pair[:2] for pair in expected]
+    np.testing.assert_allclose([pair[2] for pair in result], [pair[2] for pair in expected])
+
+
+def test_correlated_pairs_with_missing_values(wide_scores):
+    """Missing values use pairwise-complete observations, like pandas."""
+    df = wide_scores.copy()
+    df.loc[df.index[:60], "nu_nota_mt"] = np.nan
+    df.loc[df.index[30:90], "col_0"] = np.nan
+
+    result = correlation.correlated_pairs(df, threshold=0.1, block_size=8)
+    expected = _reference_pairs(df, "pearson", 0.1)
+
+    assert [pair[:2] for pair in result] == [pair[:2] for pair in expected]
+    np.testing.assert_allclose([pair[2] for pair in result], [pair[2] for pair in expected])
+
+
+def test_constant_columns_are_ignored():
+    """Columns without variance have no correlation."""
+    df = pd.DataFrame({"a": [1.0, 2.0, 3.0], "b": [2.0, 4.0, 6.5], "constant": [5.0, 5.0, 5.0]})
+    assert [pair[:2] for pair in correlation.correlated_pairs(df)] == [("a", "b")]
+
+
+def test_unsupported_method_raises():
+    with pytest.raises(ValueError):
+        correlation.correlated_pairs(pd.DataFrame({"a": [1, 2], "b": [2, 1]}), method="kendall")
+
+
+def test_cramers_v_for_coded_answers():
+    """Perfectly dependent answers have V = 1 and independent ones V = 0."""
+    q001 = pd.Series(list("ABCD") * 25)
+    q002 = q001.map({"A": "E", "B": "F", "C": "G", "D": "H"})
+    q003 = pd.Series(list("AABB") * 25)
+
+    assert correlation.cramers_v(q001, q002) == pytest.approx(1.0)
+    assert correlation.cramers_v(q003, pd.Series(list("ABAB") * 25)) == pytest.approx(0.0)
+
+
+def test_associated_categorical_pairs():
+    """Only associated categorical pairs above the threshold are returned."""
+    df = pd.DataFrame({
+        "Q001": list("ABCD") * 25,
+        "Q002": list("EFGH") * 25,
+        "Q003": ["A"] * 48 + ["B"] * 52,
+    })
+    pairs = correlation.associated_categorical_pairs(df)
+    assert [pair[:2] for pair in pairs] == [("Q001", "Q002")]
+
+
+def test_correlation_sql_statements_cover_upper_triangle():
+    """Blocked statements cover every pair exactly once with quoted identifiers."""
+    columns = ["nu_nota_mt", "nu_nota_cn", "nu_nota_lc", "nu_nota_ch", "nu_nota_redacao"]
+    statements = correlation.correlation_sql_statements("public.enem", columns, block_size=2)
+
+    pairs = [pair for _, block_pairs in statements for pair in block_pairs]
+    assert len(pairs) == len(set(pairs)) == 10
+    assert all(columns.index(a) < columns.index(b) for a, b in pairs)
+    sql, block_pairs = statements[0]
+    assert sql == 'SELECT corr("nu_nota_mt", "nu_nota_cn") AS c0 FROM "public"."enem"'
+
+
+def test_spearman_sql_ranks_in_subquery():
+    (sql, _), = correlation.correlation_sql_statements("enem", ["a", "b"], method="spearman")
+    assert "rank() OVER (ORDER BY \"a\" NULLS LAST)" in sql
+    assert sql.endswith("AS ranked")
+
+
+def test_threshold_pairs_skips_null_coefficients():
+    pairs = [("a", "b"), ("a", "c"), ("b", "c")]
+    assert correlation.threshold_pairs(pairs, [0.9, None, -0.75]) == [("a", "b", 0.9), ("b", "c", -0.75)]
+
+
+def test_analyze_chart_data_reports_strong_correlations(wide_scores):
+    analysis = analyze_chart_data(wide_scores[["col_0", "nu_nota_mt", "col_1", "tp_escola"]])
+    assert list(analysis["correlations"]) == ["col_0-nu_nota_mt"]
+    assert any("strong positive correlation" in insight for insight in analysis["insights"])
+
+
+def test_analyze_chart_data_reports_associated_answers():
+    df = pd.DataFrame({"Q001": list("ABCD") * 25, "Q002": list("EFGH") * 25, "nu_nota_mt": range(100)})
+    analysis = analyze_chart_data(df)
+    assert list(analysis["associations"]) == ["Q001-Q002"]
+    assert any("Cramér's V 1.00" in insight for insight in analysis["insights"])
@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import render_cache
+from ai_data_analyst.sub_agents import visualization_agent
+from ai_data_analyst.tools import datasets, postgres_mcp
+from ai_data_analyst.tools.chart_validation import validate_chart_spec
+from ai_data_analyst.tools.query_cache import QueryCache
+
+QUERY = "SELECT sg_uf, tp_escola, nu_nota_mt FROM microdados_enem_2023"
+
+
+@pytest.fixture
+def sqlite_database(tmp_path, monkeypatch):
+    path = tmp_path / "enem.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE microdados_enem_2023 (sg_uf TEXT, tp_escola INTEGER, nu_nota_mt REAL)")
+        conn.executemany(
+            "INSERT INTO microdados_enem_2023 VALUES (?, ?, ?)",
+            [(uf, school, 400.0 + i) for i, (uf, school) in enumerate([("SP", 1), ("RJ", 2)] * 50)],
+        )
+    monkeypatch.setattr(postgres_mcp, "_database_url", lambda: f"sqlite:///{path}")
+    monkeypatch.setattr(postgres_mcp, "_engines", {})
+    monkeypatch.setattr(postgres_mcp, "query_cache", QueryCache(ttl=60, max_entries=8))
+    monkeypatch.setattr(datasets, "QUERY_SPILL_CHARS", 1000)
+    monkeypatch.setattr(datasets, "WORKSPACE_DIR", str(tmp_path / "workspace"))
+
+
+def test_large_result_is_spilled_and_summarized(sqlite_database):
+    tool_context = SimpleNamespace(state={})
+
+    summary = json.loads(postgres_mcp.execute_sql(QUERY, tool_context=tool_context))
+
+    assert summary["dataset"].startswith(f"dataset://{tool_context.state[datasets.WORKSPACE_KEY]}/")
+    assert summary["rows"] == 100 and len(summary["sample"]) == datasets.SAMPLE_ROWS
+    assert summary["schema"]["nu_nota_mt"] == "double"
+    assert summary["profile"]["nu_nota_mt"]["min"] == 400.0
+    assert summary["profile"]["sg_uf"]["top"] == {"SP": 50, "RJ": 50}
+    # Without an agent session (e.g. the prefetch) the full result is still returned
+    assert len(json.loads(postgres_mcp.execute_sql(QUERY))) == 100
+
+
+def test_each_session_spills_a_shared_result_to_its_own_workspace(sqlite_database):
+    first, second = SimpleNamespace(state={}), SimpleNamespace(state={})
+
+    first_summary = json.loads(postgres_mcp.execute_sql(QUERY, tool_context=first))
+    second_summary = json.loads(postgres_mcp.execute_sql(QUERY, tool_context=second))
+
+    assert postgres_mcp.query_cache.stats()["hits"] == 1
+    assert first_summary["dataset"].startswith(f"dataset://{first.state[datasets.WORKSPACE_KEY]}/")
+    assert second_summary["dataset"].startswith(f"dataset://{second.state[datasets.WORKSPACE_KEY]}/")
+    assert second_summary["schema"] == first_summary["schema"]
+    assert second_summary["profile"] == first_summary["profile"]
+
+
+def test_dataset_is_read_by_column_and_described_by_group(sqlite_database):
+    handle = json.loads(postgres_mcp.execute_sql(QUERY, tool_context=SimpleNamespace(state={})))["dataset"]
+
+    assert list(datasets.load_dataset(handle, columns=["nu_nota_mt"]).columns) == ["nu_nota_mt"]
+    described = json.loads(datasets.describe_dataset(handle, group_by=["sg_uf"]))
+    assert described["rows"] == 100 and described["groups_total"] == 2
+    assert {group["sg_uf"]: group["nu_nota_mt_count"] for group in described["groups"]} == {"SP": 50, "RJ": 50}
+    assert "error" in json.loads(datasets.describe_dataset("dataset://missing/result-1"))
+
+
+def test_chart_referring_to_a_dataset_is_filled_in_when_rendered(sqlite_database):
+    handle = json.loads(postgres_mcp.execute_sql(QUERY, tool_context=SimpleNamespace(state={})))["dataset"]
+    spec = {
+        "data": {"dataset": handle},
+        "mark": "point",
+        "encoding": {
+            "x": {"field": "tp_escola", "type": "ordinal"},
+            "y": {"field": "nu_nota_mt", "type": "quantitative"},
+        },
+    }
+    assert validate_chart_spec(spec) == (True, None)
+
+    segment = render_cache.prepare_message(f"```json\n{json.dumps(spec)}\n```").segments[0]
+
+    assert segment.prepare_error is None and segment.dataset == handle
+    values = segment.chart_spec["data"]["values"]
+    assert len(values) == 100 and set(values[0]) == {"tp_escola", "nu_nota_mt"}
+
+
+def test_saved_message_embeds_the_data_of_its_charts(sqlite_database):
+    handle = json.loads(postgres_mcp.execute_sql(QUERY, tool_context=SimpleNamespace(state={})))["dataset"]
+    chart = {
+        "chart_spec": {"data": {"dataset": handle}, "mark": "bar", "encoding": {"x": {"field": "sg_uf"}}},
+        "filterable_columns": ["sg_uf"],
+    }
+    message = f"Resultado:\n```json\n{json.dumps(chart)}\n```\nFim."
+
+    saved = datasets.inline_message_datasets(message)
+
+    assert saved.startswith("Resultado:\n```json\n") and saved.endswith("\n```\nFim.")
+    embedded = json.loads(saved.split("```json\n")[1].split("\n```")[0])
+    assert embedded["filterable_columns"] == ["sg_uf"]
+    assert embedded["chart_spec"]["data"]["values"][:2] == [{"sg_uf": "SP"}, {"sg_uf": "RJ"}]
+    assert datasets.inline_message_datasets(message.replace(handle, "dataset://missing/result-1")) == (
+        message.replace(handle, "dataset://missing/result-1")
+    )
+
+
+def test_dataset_too_large_to_chart_is_not_cut(sqlite_database, monkeypatch):
+    monkeypatch.setattr(datasets, "CHART_MAX_ROWS", 50)
+    handle = json.loads(postgres_mcp.execute_sql(QUERY, tool_context=SimpleNamespace(state={})))["dataset"]
+    spec = {"data": {"dataset": handle}, "mark": "bar", "encoding": {"x": {"field": "sg_uf"}}}
+    message = f"```json\n{json.dumps(spec)}\n```"
+
+    assert "100 rows" in visualization_agent.generate_chart("bar", json.dumps(spec))
+    assert datasets.inline_message_datasets(message) == message
+    assert "100 rows" in render_cache.prepare_message(message).segments[0].prepare_error
+
+
+def test_result_served_from_the_cache_is_spilled_with_its_column_types(sqlite_database, tmp_path):
+    with sqlite3.connect(tmp_path / "enem.sqlite") as conn:
+        conn.execute("UPDATE microdados_enem_2023 SET nu_nota_mt = nu_nota_mt + 0.123456789012345")
+    postgres_mcp.execute_sql(QUERY)
+
+    handle = json.loads(postgres_mcp.execute_sql(QUERY, tool_context=SimpleNamespace(state={})))["dataset"]
+
+    assert postgres_mcp.query_cache.stats()["hits"] == 1
+    # Its JSON keeps 10 decimals only
+    assert datasets.load_dataset(handle)["nu_nota_mt"].min() == 400.123456789012345
@@ -0,0 +1,99 @@
+import contextvars
+import os
+import sys
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import event_stream
+
+REQUEST_ID = contextvars.ContextVar("request_id", default=None)
+ROWS = '```json\n[{"uf": "SP", "media": 540.2}]\n```'
+
+
+class ScriptedLlm(BaseLlm):
+    """Returns the scripted responses of each turn; a turn is a list of LlmResponse."""
+    turns: list = []
+    seen_request_ids: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.seen_request_ids.append(REQUEST_ID.get())
+        for response in self.turns.pop(0):
+            yield response
+
+
+def _text(text, partial=None):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]), partial=partial)
+
+
+def _runner(root_turns, data_turns):
+    data_agent = LlmAgent(name=event_stream.DATA_STEP, model=ScriptedLlm(model="fake", turns=data_turns))
+    root = LlmAgent(
+        name="orchestrator",
+        model=ScriptedLlm(model="fake", turns=root_turns),
+        tools=[AgentTool(agent=data_agent)],
+    )
+    service = InMemorySessionService()
+    service.create_session_sync(app_name="app", user_id="u", session_id="s")
+    return Runner(agent=root, app_name="app", session_service=service), root
+
+
+def _message():
+    return types.Content(role="user", parts=[types.Part(text="Média por UF")])
+
+
+def test_stream_reports_steps_and_streams_the_answer():
+    call = types.Part(function_call=types.FunctionCall(name=event_stream.DATA_STEP, args={"request": "media por uf"}))
+    runner, root = _runner(
+        root_turns=[
+            [LlmResponse(content=types.Content(role="model", parts=[call]))],
+            [_text("A média ", partial=True), _text("é 540.", partial=True), _text("A média é 540.")],
+        ],
+        data_turns=[[_text(ROWS)]],
+    )
+
+    token = REQUEST_ID.set("req-1")
+    try:
+        events = list(event_stream.stream_events(runner, user_id="u", session_id="s", new_message=_message()))
+    finally:
+        REQUEST_ID.reset(token)
+    updates = [update for event in events for update in event_stream.interpret_event(event)]
+
+    assert [(u.kind, u.step) for u in updates] == [
+        ("step_started", event_stream.DATA_STEP),
+        ("step_finished", event_stream.DATA_STEP),
+        ("partial_text", None),
+        ("partial_text", None),
+        ("final_text", None),
+    ]
+    assert event_stream.parse_json_output(updates[1].text) == [{"uf": "SP", "media": 540.2}]
+    assert "".join(u.text for u in updates if u.kind == "partial_text") == updates[-1].text
+    # The caller's context is visible inside the run
+    assert root.model.seen_request_ids[0] == "req-1"
+
+
+def test_stream_reraises_run_errors():
+    class BrokenLlm(BaseLlm):
+        async def generate_content_async(self, llm_request, stream=False):
+            raise RuntimeError("quota exceeded")
+            yield
+
+    root = LlmAgent(name="orchestrator", model=BrokenLlm(model="fake"))
+    service = InMemorySessionService()
+    service.create_session_sync(app_name="app", user_id="u", session_id="s")
+    runner = Runner(agent=root, app_name="app", session_service=service)
+
+    with pytest.raises(RuntimeError, match="quota exceeded"):
+        list(event_stream.stream_events(runner, user_id="u", session_id="s", new_message=_message()))
+
+
+def test_parse_json_output_accepts_plain_and_fenced_json():
+    assert event_stream.parse_json_output('{"a": 1}') == {"a": 1}
+    assert event_stream.parse_json_output(ROWS) == [{"uf": "SP", "media": 540.2}]
+    assert event_stream.parse_json_output("not json") is None
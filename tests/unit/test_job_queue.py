@@ -0,0 +1,148 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmResponse
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import config_manager, llm_scheduler, worker
+from ai_data_analyst import job_queue as job_queue_module
+from ai_data_analyst.job_queue import JobQueue
+from ai_data_analyst.llm_scheduler import LlmScheduler
+
+TEST_DB_FILE = "test_jobs.db"
+
+
+class AnswerLlm(BaseLlm):
+    async def generate_content_async(self, llm_request, stream=False):
+        question = json.loads(llm_request.contents[-1].parts[0].text)["user_request"]
+        if "falhe" in question:
+            raise ValueError("model unavailable")
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=f"Resposta: {question}")]))
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(config_manager, "DB_FILE", TEST_DB_FILE)
+    monkeypatch.setattr(job_queue_module, "JOB_RETRY_DELAY", 0)
+    config_manager.initialize_db()
+    queue = JobQueue()
+    queue.initialize()
+    yield queue
+    config_manager.close_all_connections()
+    for path in (TEST_DB_FILE, TEST_DB_FILE + "-wal", TEST_DB_FILE + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_jobs_of_a_session_run_in_order_one_at_a_time(queue):
+    first = queue.submit("Média por UF?", session_id="s1")
+    second = queue.submit("E por escola?", session_id="s1")
+    other = queue.submit("Inscritos?", session_id="s2")
+
+    assert queue.claim("w1").id == first
+    assert queue.claim("w2").id == other
+    assert queue.claim("w3") is None
+
+    assert queue.complete(first, "w1", "Resposta")
+    assert queue.claim("w3").id == second
+    assert queue.get(first).answer == "Resposta" and queue.get(first).status == "done"
+
+
+def test_concurrent_workers_never_claim_the_same_job(queue):
+    submitted = {queue.submit(f"Pergunta {i}") for i in range(40)}
+    claimed = []
+
+    def claim_all(worker_id):
+        while (job := queue.claim(worker_id)) is not None:
+            claimed.append(job.id)
+
+    threads = [threading.Thread(target=claim_all, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(submitted)
+
+
+def test_abandoned_job_is_taken_over(queue):
+    job_id = queue.submit("Média por UF?")
+    queue.claim("crashed")
+    impatient = JobQueue(heartbeat_timeout=-1)
+
+    job = impatient.claim("w2")
+
+    assert job.id == job_id and job.attempts == 2
+    assert not queue.heartbeat(job_id, "crashed")
+    assert not queue.complete(job_id, "crashed", "late answer")
+    assert impatient.complete(job_id, "w2", "Resposta")
+
+
+def test_failed_job_is_retried_until_its_last_attempt(queue):
+    job_id = queue.submit("Média por UF?", max_attempts=2)
+
+    queue.fail(queue.claim("w1").id, "w1", "timeout")
+    assert queue.get(job_id).status == "queued"
+    queue.fail(queue.claim("w1").id, "w1", "timeout again")
+
+    job = queue.get(job_id)
+    assert (job.status, job.attempts, job.error) == ("failed", 2, "timeout again")
+    assert queue.claim("w1") is None
+
+
+def test_answer_is_added_to_the_chat_only_with_the_job(queue):
+    job_id = queue.submit("Média por UF?", session_id="chat-1", save_to_chat=True)
+    queue.claim("w1")
+
+    assert not queue.complete(job_id, "w2", "Resposta", chat_session_id="chat-1")
+    assert config_manager.get_chat_history("chat-1") == []
+    assert queue.complete(job_id, "w1", "Resposta", chat_session_id="chat-1")
+    assert [message["content"] for message in config_manager.get_chat_history("chat-1")] == ["Resposta"]
+
+
+def test_worker_answers_jobs_and_saves_them_to_the_chat(queue, monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "scheduler", LlmScheduler())
+    answered = queue.submit("Média por UF?", session_id="chat-1", save_to_chat=True)
+    failing = queue.submit("falhe", max_attempts=1)
+
+    jobs_run = worker.work(
+        "w1", threading.Event(), queue=queue, agent=LlmAgent(name="orchestrator", model=AnswerLlm(model="answer")),
+        session_store=InMemorySessionService(), max_jobs=2,
+    )
+
+    assert jobs_run == 2
+    assert queue.get(answered).answer == "Resposta: Média por UF?"
+    assert queue.get(answered).trace_id
+    assert queue.get(failing).status == "failed" and "model unavailable" in queue.get(failing).error
+    history = config_manager.get_chat_history("chat-1")
+    assert [(message["role"], message["content"]) for message in history] == [("assistant", "Resposta: Média por UF?")]
+
+
+class DatabaseLlm(BaseLlm):
+    async def generate_content_async(self, llm_request, stream=False):
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=os.environ["POSTGRES_DB"])]))
+
+
+def test_worker_answers_on_the_connection_the_job_was_queued_with(queue, monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "scheduler", LlmScheduler())
+    for name in ("POSTGRES_HOST", "POSTGRES_PORT", "POSTGRES_DB", "POSTGRES_USER", "POSTGRES_PASSWORD"):
+        monkeypatch.setenv(name, "selected later")
+    config_manager.add_config("ENEM", "localhost", 5432, "enem", "analyst", "secret")
+    config_manager.add_config("Outro", "localhost", 5432, "outro", "analyst", "secret")
+    on_enem = queue.submit("Média por UF?", config_id=config_manager.get_config_by_name("ENEM")["id"])
+    on_deleted = queue.submit("Inscritos?", config_id=config_manager.get_config_by_name("Outro")["id"])
+    config_manager.delete_config("Outro")
+
+    worker.work(
+        "w1", threading.Event(), queue=queue, agent=LlmAgent(name="orchestrator", model=DatabaseLlm(model="db")),
+        session_store=InMemorySessionService(), max_jobs=2,
+    )
+
+    assert queue.get(on_enem).answer == "enem"
+    assert queue.get(on_deleted).status == "queued" and "deleted" in queue.get(on_deleted).error
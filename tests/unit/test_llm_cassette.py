@@ -0,0 +1,126 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import llm_cassette, llm_scheduler
+from ai_data_analyst.llm_scheduler import LlmScheduler, ScheduledLlm
+
+ROWS = '[{"uf": "SP", "media": 540.2}]'
+
+
+class ScriptedLlm(BaseLlm):
+    """Stands in for the live model while recording."""
+    responses: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        yield self.responses.pop(0)
+
+
+def _call(name, request):
+    part = types.Part(function_call=types.FunctionCall(name=name, args={"request": request}))
+    return LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+def _text(text):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """Sets the backend mode, with cassettes in a temporary directory."""
+    monkeypatch.setattr(llm_cassette, "CASSETTE_DIR", str(tmp_path))
+    monkeypatch.setattr(llm_cassette, "_cassettes", {})
+    monkeypatch.setattr(llm_scheduler, "scheduler", LlmScheduler())
+
+    def set_mode(mode, latency="0"):
+        monkeypatch.setattr(llm_cassette, "LLM_BACKEND", mode)
+        monkeypatch.setattr(llm_cassette, "REPLAY_LATENCY", latency)
+        # Each run starts with fresh cassettes, as a new process would
+        monkeypatch.setattr(llm_cassette, "_cassettes", {})
+    return set_mode
+
+
+def _pipeline(root_inner=None, data_inner=None):
+    data_agent = LlmAgent(
+        name="data_engineer_agent_tool",
+        model=ScheduledLlm(model="gemini-2.5-flash", agent="data_engineer_agent_tool", inner=data_inner),
+    )
+    return LlmAgent(
+        name="orchestrator",
+        model=ScheduledLlm(model="gemini-2.5-pro", agent="orchestrator", inner=root_inner),
+        tools=[AgentTool(agent=data_agent)],
+    )
+
+
+def _run(root):
+    runner = InMemoryRunner(agent=root, app_name="app")
+    session = runner.session_service.create_session_sync(app_name="app", user_id="u")
+    message = types.Content(role="user", parts=[types.Part(text="Média por UF")])
+    events = list(runner.run(user_id="u", session_id=session.id, new_message=message))
+    return events[-1].content.parts[0].text
+
+
+def _request(text, call_id=None, model="gemini-2.5-pro"):
+    call = types.Part(function_call=types.FunctionCall(id=call_id, name="tool", args={"q": 1}))
+    return LlmRequest(model=model, contents=[
+        types.Content(role="user", parts=[types.Part(text=text)]),
+        types.Content(role="model", parts=[call]),
+    ])
+
+
+def test_request_key_ignores_call_ids_and_model():
+    key = llm_cassette.request_key(_request("a", call_id="adk-1"), stream=False)
+
+    assert llm_cassette.request_key(_request("a", call_id="adk-2", model="gemini-2.5-flash"), stream=False) == key
+    assert llm_cassette.request_key(_request("b", call_id="adk-1"), stream=False) != key
+    assert llm_cassette.request_key(_request("a", call_id="adk-1"), stream=True) != key
+
+
+def test_recorded_pipeline_replays_offline(backend, tmp_path):
+    backend(llm_cassette.RECORD)
+    recorded = _run(_pipeline(
+        root_inner=ScriptedLlm(model="live", responses=[
+            _call("data_engineer_agent_tool", "média por UF"), _text("A média de SP é 540,2."),
+        ]),
+        data_inner=ScriptedLlm(model="live", responses=[_text(ROWS)]),
+    ))
+
+    assert sorted(os.listdir(tmp_path)) == ["data_engineer_agent_tool.jsonl", "orchestrator.jsonl"]
+
+    # No live model: every call must be answered from the cassettes
+    backend(llm_cassette.REPLAY)
+    assert _run(_pipeline()) == recorded == "A média de SP é 540,2."
+
+
+def test_replay_simulates_latency(backend):
+    backend(llm_cassette.RECORD)
+    _run(_pipeline(
+        root_inner=ScriptedLlm(model="live", responses=[_text("Oi")]),
+        data_inner=ScriptedLlm(model="live", responses=[]),
+    ))
+
+    backend(llm_cassette.REPLAY, latency="0.2")
+    started = time.perf_counter()
+    _run(_pipeline())
+
+    assert time.perf_counter() - started >= 0.2
+
+
+def test_unrecorded_request_fails_in_replay(backend):
+    backend(llm_cassette.REPLAY)
+    llm = ScheduledLlm(model="gemini-2.5-pro", agent="orchestrator")
+
+    async def call():
+        return [response async for response in llm.generate_content_async(_request("never recorded"))]
+
+    with pytest.raises(llm_cassette.CassetteMiss):
+        asyncio.run(call())
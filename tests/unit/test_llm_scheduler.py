@@ -0,0 +1,195 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import errors, types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import llm_scheduler
+from ai_data_analyst.llm_scheduler import BATCH, INTERACTIVE, LlmScheduler, ScheduledLlm
+
+MODEL = "fake-model"
+
+
+class FakeLlm(BaseLlm):
+    """A local stand-in for the model endpoint: sleeps, then answers; fails the first `failures` calls."""
+    latency: float = 0.02
+    failures: list = []
+    active: int = 0
+    max_active: int = 0
+    calls: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.failures:
+                raise self.failures.pop(0)
+            label = llm_request.contents[0].parts[0].text
+            self.calls.append(label)
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=label)]))
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = LlmScheduler()
+    monkeypatch.setattr(llm_scheduler, "scheduler", scheduler)
+    monkeypatch.setattr(llm_scheduler, "backoff_delay", lambda attempt: 0.01)
+    return scheduler
+
+
+def _request(label):
+    return LlmRequest(model=MODEL, contents=[types.Content(role="user", parts=[types.Part(text=label)])])
+
+
+async def _call(llm, label):
+    return [response async for response in llm.generate_content_async(_request(label))]
+
+
+def _quota_error():
+    return errors.ClientError(
+        429, {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}}
+    )
+
+
+def test_concurrency_is_capped_across_threads_and_event_loops(scheduler):
+    scheduler.configure(MODEL, rpm=100_000, max_concurrency=2)
+    fake = FakeLlm(model=MODEL)
+    llm = ScheduledLlm(model=MODEL, inner=fake)
+
+    async def session(name):
+        await asyncio.gather(*(_call(llm, f"{name}-{i}") for i in range(3)))
+
+    threads = [threading.Thread(target=asyncio.run, args=(session(f"s{i}"),)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(fake.calls) == 9
+    assert fake.max_active == 2
+    stats = scheduler.stats()[MODEL]
+    assert stats["calls"] == 9
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["max_queue_depth"] >= 4
+    assert stats["wait_max"] > 0
+
+
+def test_interactive_calls_are_served_before_batch_calls(scheduler):
+    scheduler.configure(MODEL, rpm=100_000, max_concurrency=1)
+    fake = FakeLlm(model=MODEL, latency=0.05)
+    llm = ScheduledLlm(model=MODEL, inner=fake)
+
+    async def run():
+        first = asyncio.create_task(_call(llm, "first"))
+        await asyncio.sleep(0.01)
+        with llm_scheduler.priority(BATCH):
+            batch = [asyncio.create_task(_call(llm, f"batch-{i}")) for i in range(2)]
+        await asyncio.sleep(0.01)
+        with llm_scheduler.priority(INTERACTIVE):
+            interactive = asyncio.create_task(_call(llm, "interactive"))
+        await asyncio.gather(first, interactive, *batch)
+
+    asyncio.run(run())
+
+    assert fake.calls == ["first", "interactive", "batch-0", "batch-1"]
+
+
+def test_request_rate_is_limited(scheduler, monkeypatch):
+    # 10 requests per second, with a bucket of a single request
+    monkeypatch.setattr(llm_scheduler, "BURST_SECONDS", 0.1)
+    scheduler.configure(MODEL, rpm=600, max_concurrency=10)
+    llm = ScheduledLlm(model=MODEL, inner=FakeLlm(model=MODEL, latency=0))
+
+    async def run():
+        await asyncio.gather(*(_call(llm, str(i)) for i in range(4)))
+
+    started = time.monotonic()
+    asyncio.run(run())
+
+    assert time.monotonic() - started >= 0.25
+
+
+def test_quota_errors_are_retried(scheduler):
+    fake = FakeLlm(model=MODEL, failures=[_quota_error(), _quota_error()])
+    llm = ScheduledLlm(model=MODEL, inner=fake)
+
+    responses = asyncio.run(_call(llm, "hello"))
+
+    assert responses[0].content.parts[0].text == "hello"
+    assert scheduler.stats()[MODEL]["retries"] == 2
+    assert scheduler.stats()[MODEL]["in_flight"] == 0
+
+
+def test_other_errors_are_not_retried(scheduler):
+    bad_request = errors.ClientError(400, {"error": {"code": 400, "message": "Bad request", "status": "INVALID"}})
+    llm = ScheduledLlm(model=MODEL, inner=FakeLlm(model=MODEL, failures=[bad_request]))
+
+    with pytest.raises(errors.ClientError):
+        asyncio.run(_call(llm, "hello"))
+    assert scheduler.stats()[MODEL]["retries"] == 0
+    assert scheduler.stats()[MODEL]["failures"] == 1
+
+
+def test_waiting_stops_at_the_deadline(scheduler):
+    # A bucket of one request that refills in 10s
+    scheduler.configure(MODEL, rpm=6, max_concurrency=10)
+    llm = ScheduledLlm(model=MODEL, inner=FakeLlm(model=MODEL, latency=0))
+
+    async def run():
+        await _call(llm, "first")
+        with llm_scheduler.deadline(0.1):
+            await _call(llm, "second")
+
+    started = time.monotonic()
+    with pytest.raises(llm_scheduler.DeadlineExceeded):
+        asyncio.run(run())
+    assert time.monotonic() - started < 1
+    assert scheduler.stats()[MODEL]["queue_depth"] == 0
+
+
+def test_slot_is_released_before_the_caller_handles_the_response(scheduler):
+    """A sub-agent called as a tool gets a slot while the orchestrator's response is being handled."""
+    scheduler.configure(MODEL, rpm=100_000, max_concurrency=1)
+    llm = ScheduledLlm(model=MODEL, inner=FakeLlm(model=MODEL))
+
+    async def run():
+        nested = []
+        async for _ in llm.generate_content_async(_request("orchestrator")):
+            # ADK runs the tools the response calls here
+            nested.extend(await _call(llm, "sub-agent"))
+        return nested
+
+    nested = asyncio.run(asyncio.wait_for(run(), 5))
+
+    assert [response.content.parts[0].text for response in nested] == ["sub-agent"]
+    assert scheduler.stats()[MODEL]["in_flight"] == 0
+
+
+def test_scheduled_model_uses_the_routed_model(scheduler):
+    """Without an inner model, the model registered for the request's model name is used."""
+    llm = llm_scheduler.scheduled_model("gemini-2.5-pro")
+
+    assert llm._inner_for("gemini-2.5-flash").model == "gemini-2.5-flash"
+    assert llm._inner_for("gemini-2.5-flash") is llm._inner_for("gemini-2.5-flash")
+
+
+def test_routed_models_are_not_shared_across_event_loops(scheduler):
+    llm = llm_scheduler.scheduled_model("gemini-2.5-pro")
+
+    async def inner_models():
+        return llm._inner_for("gemini-2.5-flash"), llm._inner_for("gemini-2.5-flash")
+
+    first, again = asyncio.run(inner_models())
+    second, _ = asyncio.run(inner_models())
+
+    assert first is again
+    assert first is not second
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+from logging.handlers import QueueListener
+
+from opentelemetry.sdk.trace import TracerProvider
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import logging_config
+from ai_data_analyst.logging_config import DeferredQueueHandler, JsonFormatter, payload, sampled
+from ai_data_analyst.tools import postgres_mcp
+from ai_data_analyst.tools.query_cache import QueryCache
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class CountingValue:
+    """Counts how often it is converted to text."""
+    conversions = 0
+
+    def __repr__(self):
+        CountingValue.conversions += 1
+        return "x" * 1000
+
+
+def _queued_logger(name, handler, maxsize=0):
+    log_queue = queue.Queue(maxsize)
+    queue_handler = DeferredQueueHandler(log_queue)
+    logger = logging.getLogger(name)
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger, queue_handler, QueueListener(log_queue, handler)
+
+
+def test_payloads_are_cut_and_only_formatted_when_written():
+    handler = ListHandler()
+    logger, _, listener = _queued_logger("test.payload", handler)
+    value = CountingValue()
+
+    logger.debug("result: %s", payload(value, max_chars=10))
+    assert CountingValue.conversions == 0
+
+    listener.start()
+    logger.info("result: %s", payload(value, max_chars=10))
+    listener.stop()
+    assert CountingValue.conversions == 1
+    assert handler.lines == ["result: xxxxxxxxxx... (1000 chars)"]
+
+
+def test_sampled_records_are_dropped_but_warnings_kept():
+    handler = ListHandler()
+    logger, _, listener = _queued_logger("test.sampling", handler)
+    listener.start()
+    for _ in range(100):
+        logger.info("frequent", extra=sampled(0))
+    logger.warning("important", extra=sampled(0))
+    listener.stop()
+
+    assert handler.lines == ["important"]
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = ListHandler()
+    logger, queue_handler, _ = _queued_logger("test.full", handler, maxsize=2)
+    for i in range(5):
+        logger.info("record %d", i)
+
+    assert queue_handler.dropped == 3
+
+
+def test_json_records_carry_the_current_trace():
+    handler = ListHandler()
+    handler.setFormatter(JsonFormatter())
+    logger, _, listener = _queued_logger("test.json", handler)
+    tracer = TracerProvider().get_tracer("test")
+    listener.start()
+    with tracer.start_as_current_span("request") as span:
+        logger.info("rows: %d", 2, extra={"table": "microdados_enem_2023"})
+    listener.stop()
+
+    entry = json.loads(handler.lines[0])
+    assert entry["message"] == "rows: 2"
+    assert entry["table"] == "microdados_enem_2023"
+    assert entry["trace_id"] == f"{span.get_span_context().trace_id:032x}"
+
+
+def test_query_results_are_not_printed(tmp_path, monkeypatch, capsys, caplog):
+    path = tmp_path / "enem.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE microdados_enem_2023 (sg_uf TEXT)")
+        conn.executemany("INSERT INTO microdados_enem_2023 VALUES (?)", [("SP",)] * 1000)
+    monkeypatch.setattr(postgres_mcp, "_database_url", lambda: f"sqlite:///{path}")
+    monkeypatch.setattr(postgres_mcp, "_engines", {})
+    monkeypatch.setattr(postgres_mcp, "query_cache", QueryCache(ttl=60, max_entries=8))
+    monkeypatch.setattr(logging_config, "LOG_MAX_PAYLOAD_CHARS", 50)
+
+    with caplog.at_level(logging.DEBUG, logger=postgres_mcp.__name__):
+        result = postgres_mcp.execute_sql("SELECT sg_uf FROM microdados_enem_2023")
+
+    assert capsys.readouterr().out == ""
+    assert len(caplog.messages) == 1 and len(caplog.messages[0]) < 200
+    assert len(result) > 10_000
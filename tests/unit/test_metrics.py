@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import sys
+import urllib.request
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.trace import Status, StatusCode
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import metrics
+from ai_data_analyst.metrics import MetricsRegistry, MetricsSpanProcessor
+from ai_data_analyst.tools import postgres_mcp
+from ai_data_analyst.tools.query_cache import QueryCache
+
+
+@pytest.fixture
+def sqlite_database(tmp_path, monkeypatch):
+    path = tmp_path / "enem.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE microdados_enem_2023 (sg_uf TEXT, nu_nota_mt REAL)")
+        conn.executemany("INSERT INTO microdados_enem_2023 VALUES (?, ?)", [("SP", 600.0), ("RJ", 550.0)])
+    monkeypatch.setattr(postgres_mcp, "_database_url", lambda: f"sqlite:///{path}")
+    monkeypatch.setattr(postgres_mcp, "_engines", {})
+    monkeypatch.setattr(postgres_mcp, "query_cache", QueryCache(ttl=60, max_entries=8))
+    monkeypatch.setattr(postgres_mcp, "schema_cache", QueryCache(ttl=60, max_entries=8))
+
+
+def test_exposition_uses_the_prometheus_text_format():
+    registry = MetricsRegistry(prefix="test")
+    calls = registry.counter("calls_total", "Calls.")
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    calls.inc(agent='say "hi"')
+    calls.inc(2, agent='say "hi"')
+    for value in (0.05, 0.1, 0.5, 5):
+        latency.observe(value)
+
+    assert registry.exposition().splitlines() == [
+        "# HELP test_calls_total Calls.",
+        "# TYPE test_calls_total counter",
+        'test_calls_total{agent="say \\"hi\\""} 3',
+        "# HELP test_latency_seconds Latency.",
+        "# TYPE test_latency_seconds histogram",
+        'test_latency_seconds_bucket{le="0.1"} 2',
+        'test_latency_seconds_bucket{le="1"} 3',
+        'test_latency_seconds_bucket{le="+Inf"} 4',
+        "test_latency_seconds_sum 5.65",
+        "test_latency_seconds_count 4",
+    ]
+
+
+def test_metrics_are_derived_from_spans():
+    provider = TracerProvider()
+    provider.add_span_processor(MetricsSpanProcessor())
+    tracer = provider.get_tracer("test")
+    runs = metrics.agent_runs_total.value(agent="planner_agent", status="ok")
+    failed_queries = metrics.sql_queries_total.value(status="error")
+    llm_calls = metrics.llm_prompt_tokens.count(model="gemini-2.5-flash")
+
+    with (
+        tracer.start_as_current_span("agent_run [planner_agent]"),
+        tracer.start_as_current_span("llm gemini-2.5-flash", attributes={
+            "llm.model": "gemini-2.5-flash", "llm.agent": "planner_agent",
+            "llm.prompt_tokens": 1200, "llm.completion_tokens": 80, "llm.queue_wait_ms": 5.0,
+        }),
+    ):
+        pass
+    with tracer.start_as_current_span("execute_tool (merged)", attributes={"gen_ai.tool.name": "(merged tools)"}):
+        pass
+    with tracer.start_as_current_span("sql") as span:
+        span.set_status(Status(StatusCode.ERROR, "syntax error"))
+
+    assert metrics.agent_runs_total.value(agent="planner_agent", status="ok") == runs + 1
+    assert metrics.sql_queries_total.value(status="error") == failed_queries + 1
+    assert metrics.llm_prompt_tokens.count(model="gemini-2.5-flash") == llm_calls + 1
+    assert metrics.tool_calls_total.value(tool="(merged tools)", status="ok") == 0
+
+
+def test_cache_and_pool_gauges(sqlite_database):
+    postgres_mcp.execute_sql("SELECT COUNT(*) FROM microdados_enem_2023")
+    postgres_mcp.execute_sql("SELECT COUNT(*) FROM microdados_enem_2023")
+
+    exposition = metrics.registry.exposition()
+    assert 'ai_data_analyst_cache_hit_ratio{cache="query"} 0.5' in exposition
+    assert "ai_data_analyst_db_pool_checked_out{database=" in exposition
+
+
+def test_metrics_are_served_over_http():
+    server = metrics.start_metrics_server(0, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode()
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert "# TYPE ai_data_analyst_requests_total counter" in body
+    finally:
+        server.shutdown()
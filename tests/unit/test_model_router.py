@@ -0,0 +1,122 @@
+import json
+import os
+import sys
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import model_router
+
+
+class RecordingLlm(BaseLlm):
+    """Records the model of each request and returns the scripted responses in order."""
+    responses: list = []
+    seen_models: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.seen_models.append(llm_request.model)
+        yield self.responses.pop(0)
+
+
+def _call(name):
+    part = types.Part(function_call=types.FunctionCall(name=name, args={"request": "go"}))
+    return LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+def _text(text):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+def _run(request, root_responses, planner_responses, analysis_responses=()):
+    planner = LlmAgent(
+        name=model_router.PLANNER,
+        model=RecordingLlm(model=model_router.STRONG_MODEL, responses=list(planner_responses)),
+        before_model_callback=model_router.apply_model_route,
+    )
+    analysis = LlmAgent(
+        name=model_router.ANALYSIS,
+        model=RecordingLlm(model=model_router.FAST_MODEL, responses=list(analysis_responses)),
+        before_agent_callback=model_router.skip_if_routed,
+    )
+    root = LlmAgent(
+        name=model_router.ORCHESTRATOR,
+        model=RecordingLlm(model=model_router.STRONG_MODEL, responses=list(root_responses)),
+        tools=[AgentTool(agent=planner), AgentTool(agent=analysis)],
+        before_agent_callback=model_router.route_request,
+        before_model_callback=model_router.apply_model_route,
+        after_agent_callback=model_router.log_routed_latency,
+    )
+    runner = InMemoryRunner(agent=root, app_name="app")
+    session = runner.session_service.create_session_sync(app_name="app", user_id="u")
+    message = types.Content(role="user", parts=[types.Part(text=json.dumps({"user_request": request}))])
+    events = list(runner.run(user_id="u", session_id=session.id, new_message=message))
+    session = runner.session_service.get_session_sync(app_name="app", user_id="u", session_id=session.id)
+    return events, session, root, planner, analysis
+
+
+@pytest.mark.parametrize("request_text, complexity", [
+    ("Quantos candidatos fizeram o ENEM em 2023?", "simple"),
+    ("How many candidates in 2023?", "simple"),
+    ("Média de matemática por UF", "simple"),
+    ("Distribuição das notas de redação por UF", "standard"),
+    ("Qual a correlação entre a renda familiar e a nota de matemática, e como ela evoluiu entre 2019 e 2023?",
+     "complex"),
+])
+def test_classify_request(request_text, complexity):
+    decision = model_router.classify_request(request_text)
+
+    assert decision.complexity == complexity
+    assert decision.models == model_router.ROUTES[complexity]["models"]
+    assert decision.skip_agents == model_router.ROUTES[complexity]["skip_agents"]
+
+
+def test_simple_request_uses_fast_models_and_skips_analysis():
+    events, session, root, planner, analysis = _run(
+        "Quantos candidatos fizeram o ENEM em 2023?",
+        root_responses=[_call(model_router.PLANNER), _call(model_router.ANALYSIS), _text("3.9 milhões")],
+        planner_responses=[_text('{"plan": []}')],
+    )
+
+    assert session.state[model_router.ROUTING_STATE_KEY]["complexity"] == "simple"
+    assert root.model.seen_models == [model_router.FAST_MODEL] * 3
+    assert planner.model.seen_models == [model_router.FAST_MODEL]
+    assert analysis.model.seen_models == []
+    analysis_result = next(
+        response.response["result"] for event in events for response in event.get_function_responses()
+        if response.name == model_router.ANALYSIS
+    )
+    assert json.loads(analysis_result)["results"][0]["analysis_type"] == "skipped"
+
+
+def test_complex_request_keeps_configured_models():
+    _, session, root, planner, analysis = _run(
+        "Compare a evolução das notas de escolas públicas e privadas entre 2019 e 2023",
+        root_responses=[_call(model_router.PLANNER), _call(model_router.ANALYSIS), _text("Relatório")],
+        planner_responses=[_text('{"plan": []}')],
+        analysis_responses=[_text('{"results": [], "suggestions": []}')],
+    )
+
+    assert session.state[model_router.ROUTING_STATE_KEY]["complexity"] == "complex"
+    assert root.model.seen_models == [model_router.STRONG_MODEL] * 3
+    assert planner.model.seen_models == [model_router.STRONG_MODEL]
+    assert analysis.model.seen_models == [model_router.FAST_MODEL]
+
+
+def test_routing_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTING_ENABLED", False)
+
+    _, session, root, _, analysis = _run(
+        "How many candidates in 2023?",
+        root_responses=[_call(model_router.ANALYSIS), _text("3.9 milhões")],
+        planner_responses=[],
+        analysis_responses=[_text('{"results": [], "suggestions": []}')],
+    )
+
+    assert model_router.ROUTING_STATE_KEY not in session.state
+    assert root.model.seen_models == [model_router.STRONG_MODEL] * 2
+    assert analysis.model.seen_models == [model_router.FAST_MODEL]
@@ -0,0 +1,127 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst.tools import postgres_mcp
+from ai_data_analyst.tools.query_cache import QueryCache
+
+
+@pytest.fixture
+def sqlite_database(tmp_path, monkeypatch):
+    """Points the database tools at a small SQLite database, with empty caches."""
+    path = tmp_path / "enem.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE microdados_enem_2023 (sg_uf TEXT, nu_nota_mt REAL)")
+        conn.executemany("INSERT INTO microdados_enem_2023 VALUES (?, ?)", [("SP", 600.0), ("RJ", 550.0)])
+    monkeypatch.setattr(postgres_mcp, "_database_url", lambda: f"sqlite:///{path}")
+    monkeypatch.setattr(postgres_mcp, "_engines", {})
+    monkeypatch.setattr(postgres_mcp, "query_cache", QueryCache(ttl=60, max_entries=8))
+    return path
+
+
+def test_cache_expires_and_evicts():
+    cache = QueryCache(ttl=0.05, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.get_or_compute(key, lambda key=key: key.upper())
+
+    assert cache.get("a") is None
+    assert cache.get("c") == "C"
+    time.sleep(0.06)
+    assert cache.get("c") is None
+
+
+def test_concurrent_requests_share_one_computation():
+    cache = QueryCache(ttl=60, max_entries=8)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_query():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "[]"
+
+    thread = threading.Thread(target=cache.get_or_compute, args=("q", slow_query))
+    thread.start()
+    started.wait(5)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_compute("q", slow_query)))
+    waiter.start()
+    release.set()
+    thread.join()
+    waiter.join()
+
+    assert results == ["[]"]
+    assert len(calls) == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_waiters_compute_their_own_value_when_a_load_is_not_shared():
+    cache = QueryCache(ttl=60, max_entries=8)
+    started = threading.Event()
+    release = threading.Event()
+
+    def cancelled_query():
+        started.set()
+        release.wait(5)
+        return '{"error": "canceling statement due to statement timeout"}'
+
+    thread = threading.Thread(
+        target=cache.get_or_compute,
+        args=("q", cancelled_query),
+        kwargs={"should_cache": lambda value: False, "should_share": lambda value: False},
+    )
+    thread.start()
+    started.wait(5)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_compute("q", lambda: "[]")))
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    thread.join()
+    waiter.join()
+
+    assert results == ["[]"]
+    assert cache.stats() == {"hits": 0, "misses": 2, "size": 1}
+
+
+def test_execute_sql_caches_results_by_normalized_query(sqlite_database):
+    first = postgres_mcp.execute_sql("SELECT sg_uf, nu_nota_mt FROM microdados_enem_2023 ORDER BY sg_uf")
+    with sqlite3.connect(sqlite_database) as conn:
+        conn.execute("DELETE FROM microdados_enem_2023")
+
+    second = postgres_mcp.execute_sql("SELECT sg_uf,  nu_nota_mt\nFROM microdados_enem_2023 ORDER BY sg_uf;")
+
+    assert json.loads(first) == [{"sg_uf": "RJ", "nu_nota_mt": 550.0}, {"sg_uf": "SP", "nu_nota_mt": 600.0}]
+    assert second == first
+    assert postgres_mcp.query_cache.stats()["hits"] == 1
+
+
+def test_errors_are_not_cached(sqlite_database):
+    assert "error" in json.loads(postgres_mcp.execute_sql("SELECT * FROM missing_table"))
+    with sqlite3.connect(sqlite_database) as conn:
+        conn.execute("CREATE TABLE missing_table (x INTEGER)")
+
+    assert postgres_mcp.execute_sql("SELECT * FROM missing_table") == "[]"
+
+
+def test_prefetched_query_is_served_to_execute_sql(sqlite_database):
+    postgres_mcp.prefetch_query("SELECT COUNT(*) AS total FROM microdados_enem_2023", timeout_ms=1000)
+
+    assert json.loads(postgres_mcp.execute_sql("SELECT COUNT(*) AS total FROM microdados_enem_2023")) == [{"total": 2}]
+    assert postgres_mcp.query_cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_schema_listing_works_without_information_schema(sqlite_database, monkeypatch):
+    monkeypatch.setattr(postgres_mcp, "schema_cache", QueryCache(ttl=60, max_entries=8))
+
+    assert postgres_mcp.list_tables_and_schemas() == (
+        "**Table: `microdados_enem_2023`**\n- `sg_uf` (text)\n- `nu_nota_mt` (real)"
+    )
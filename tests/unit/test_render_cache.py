@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import render_cache
+from ai_data_analyst.render_cache import ChartSegment, RenderCache, TextSegment
+
+CHART = {
+    "chart_spec": {
+        "mark": "bar",
+        "encoding": {"x": {"field": "region", "type": "nominal"}},
+        "data": {"values": [{"region": "N", "score": 500}, {"region": "S", "score": 550}]},
+    },
+    "filterable_columns": ["region"],
+}
+
+
+def _message_with_chart(chart=CHART, before="Intro text.\n", after="\nClosing text."):
+    return f"{before}```json\n{json.dumps(chart)}\n```{after}"
+
+
+def test_parse_plain_text_message():
+    """A message without charts is a single text segment."""
+    prepared = render_cache.parse_message_content("Just **markdown**.")
+    assert prepared.segments == (TextSegment("Just **markdown**."),)
+
+
+def test_parse_text_and_filterable_chart():
+    """Text around a chart is kept in order and the chart frame is pre-built."""
+    prepared = render_cache.parse_message_content(_message_with_chart())
+
+    assert [type(s) for s in prepared.segments] == [TextSegment, ChartSegment, TextSegment]
+    assert prepared.segments[0].text == "Intro text.\n"
+    assert prepared.segments[2].text == "Closing text."
+
+    chart = prepared.segments[1]
+    assert chart.is_filterable
+    assert chart.data["region"].tolist() == ["N", "S"]
+    assert "data" not in chart.spec_without_data
+    assert chart.filterable_columns == ["region"]
+
+
+def test_parse_raw_spec_is_not_filterable():
+    """Raw Vega-Lite specs are rendered as-is, without building a frame."""
+    prepared = render_cache.parse_message_content(_message_with_chart(CHART["chart_spec"], before="", after=""))
+
+    (chart,) = prepared.segments
+    assert chart.data is None
+    assert not chart.is_filterable
+    assert chart.chart_spec["mark"] == "bar"
+
+
+def test_parse_invalid_chart_json():
+    """Invalid JSON is reported on the segment instead of raising."""
+    prepared = render_cache.parse_message_content("```vega-lite\n{not json}\n```")
+
+    (chart,) = prepared.segments
+    assert chart.parse_error
+    assert chart.raw_json == "{not json}"
+
+
+def test_cache_hits_for_repeated_content():
+    """The same content is parsed once and served from the cache afterwards."""
+    cache = RenderCache()
+    message = _message_with_chart()
+
+    first = cache.get_or_prepare(message)
+    second = cache.get_or_prepare(message)
+
+    assert first is second
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    """The cache stays within its entry bound, evicting the oldest entries first."""
+    cache = RenderCache(max_entries=2)
+    cache.get_or_prepare("a")
+    cache.get_or_prepare("b")
+    cache.get_or_prepare("a")
+    cache.get_or_prepare("c")
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    # "b" was the least recently used entry
+    cache.get_or_prepare("b")
+    assert cache.stats()["misses"] == 4
+
+
+@pytest.mark.parametrize("max_bytes", [1, 10])
+def test_cache_respects_byte_bound(max_bytes):
+    """Entries larger than the byte budget are returned but never cached."""
+    cache = RenderCache(max_bytes=max_bytes)
+    cache.get_or_prepare("a message longer than the budget")
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmResponse
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import llm_scheduler
+from ai_data_analyst.llm_scheduler import LlmScheduler
+from ai_data_analyst.service import create_app
+from ai_data_analyst.service_client import AgentServiceClient, AgentServiceError
+
+
+class EchoLlm(BaseLlm):
+    """Answers with the question after a pause; records how many requests it served at once, per session."""
+    active: dict = {}
+    answered: list = []
+    max_active: int = 0
+    max_active_per_session: int = 0
+    lock: object = None
+
+    async def generate_content_async(self, llm_request, stream=False):
+        question = json.loads(llm_request.contents[-1].parts[0].text)["user_request"]
+        if "falhe" in question:
+            raise ValueError("model unavailable")
+        session = question.split("|")[0]
+        with self.lock:
+            self.active[session] = self.active.get(session, 0) + 1
+            self.max_active = max(self.max_active, sum(self.active.values()))
+            self.max_active_per_session = max(self.max_active_per_session, self.active[session])
+        await asyncio.sleep(0.1)
+        with self.lock:
+            self.active[session] -= 1
+            self.answered.append(question)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=f"Resposta: {question}")]))
+
+
+@pytest.fixture
+def service(request, monkeypatch):
+    """The service's model and a client of the service, with 4 workers unless parametrized with another number."""
+    monkeypatch.setattr(llm_scheduler, "scheduler", LlmScheduler())
+    model = EchoLlm(model="echo", lock=threading.Lock(), active={}, answered=[])
+    app = create_app(
+        agent=LlmAgent(name="orchestrator", model=model),
+        session_store=InMemorySessionService(),
+        workers=getattr(request, "param", 4),
+    )
+    with TestClient(app) as http:
+        yield model, AgentServiceClient(["http://testserver"], http_client=http)
+
+
+def test_question_is_streamed_and_its_result_kept(service):
+    _, client = service
+    run_id = client.submit("Média em matemática?", "ENEM 2023", session_id="s1", user_id="u1")
+
+    updates = list(client.updates(run_id))
+
+    assert [update.kind for update in updates][-1] == "final_text"
+    assert "Média em matemática?" in updates[-1].text
+    result = client.result(run_id)
+    assert result["status"] == "done" and result["answer"] == updates[-1].text
+    assert result["session_id"] == "s1" and result["trace_id"]
+
+
+def test_sessions_run_concurrently_but_each_session_in_order(service):
+    model, client = service
+    run_ids = [
+        client.submit(f"s{session}|pergunta {i}", "", session_id=f"s{session}", user_id="u1")
+        for session in range(3) for i in range(2)
+    ]
+    for run_id in run_ids:
+        list(client.updates(run_id))
+
+    assert model.max_active > 1
+    assert model.max_active_per_session == 1
+
+
+@pytest.mark.parametrize("service", [2], indirect=True)
+def test_a_busy_session_does_not_hold_the_workers(service):
+    model, client = service
+    run_ids = [client.submit(f"s1|pergunta {i}", "", session_id="s1", user_id="u1") for i in range(3)]
+    run_ids.append(client.submit("s2|pergunta 0", "", session_id="s2", user_id="u1"))
+    for run_id in run_ids:
+        list(client.updates(run_id))
+
+    assert model.answered.index("s2|pergunta 0") < model.answered.index("s1|pergunta 1")
+
+
+def test_failed_run_is_reported(service):
+    _, client = service
+    run_id = client.submit("falhe", "", session_id="s1", user_id="u1")
+
+    with pytest.raises(AgentServiceError, match="model unavailable"):
+        list(client.updates(run_id))
+    assert client.result(run_id)["status"] == "failed"
+
+
+def test_a_session_always_goes_to_the_same_service():
+    client = AgentServiceClient(["http://a:8080", "http://b:8080", "http://c:8080"])
+    owners = {session: client.url_for(session) for session in map(str, range(300))}
+
+    assert all(client.url_for(session) == url for session, url in owners.items())
+    assert len(set(owners.values())) == 3
+    # Removing a service only moves its own sessions
+    smaller = AgentServiceClient(["http://a:8080", "http://b:8080"])
+    assert all(smaller.url_for(s) == url for s, url in owners.items() if url != "http://c:8080")
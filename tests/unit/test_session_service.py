@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+from google.adk.events import Event, EventActions
+from google.adk.sessions.base_session_service import GetSessionConfig
+from google.genai import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import config_manager
+from ai_data_analyst.chat_storage import compress
+from ai_data_analyst.session_service import SqliteSessionService
+
+TEST_DB_FILE = "test_sessions.db"
+APP = "test_app"
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(config_manager, "DB_FILE", TEST_DB_FILE)
+    service = SqliteSessionService(loaded_invocations=2)
+    service.initialize()
+    yield service
+    config_manager.close_all_connections()
+    for path in (TEST_DB_FILE, TEST_DB_FILE + "-wal", TEST_DB_FILE + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _event(invocation_id, text, state_delta=None, partial=None):
+    return Event(
+        invocation_id=invocation_id,
+        author="data_engineer_agent_tool",
+        content=types.Content(role="model", parts=[types.Part(text=text)]),
+        actions=EventActions(state_delta=state_delta or {}),
+        partial=partial,
+    )
+
+
+def test_state_prefixes_are_persisted_like_in_memory(service):
+    """Session state, app: and user: state are stored; temp: state is not."""
+    session = asyncio.run(service.create_session(app_name=APP, user_id="u1", session_id="s1", state={"initial": 1}))
+    delta = {"data_engineer_agent_output_key": "[{\"uf\": \"SP\"}]", "app:model": "flash", "user:lang": "pt",
+             "temp:scratch": "x"}
+    asyncio.run(service.append_event(session, _event("inv1", "rows", delta)))
+
+    restored = asyncio.run(service.get_session(app_name=APP, user_id="u1", session_id="s1"))
+    assert restored.state == {
+        "initial": 1, "data_engineer_agent_output_key": "[{\"uf\": \"SP\"}]", "app:model": "flash", "user:lang": "pt",
+    }
+
+    # app: and user: state are shared with the other sessions of the app and user
+    other = asyncio.run(service.create_session(app_name=APP, user_id="u1", session_id="s2"))
+    assert other.state == {"app:model": "flash", "user:lang": "pt"}
+    stranger = asyncio.run(service.create_session(app_name=APP, user_id="u2"))
+    assert stranger.state == {"app:model": "flash"}
+
+
+def test_events_are_restored_from_recent_invocations(service):
+    """Events round-trip intact and only the most recent invocations are loaded by default."""
+    session = asyncio.run(service.create_session(app_name=APP, user_id="u1", session_id="s1"))
+    for invocation in ("inv1", "inv2", "inv3"):
+        asyncio.run(service.append_event(session, _event(invocation, f"{invocation} call")))
+        asyncio.run(service.append_event(session, _event(invocation, f"{invocation} answer")))
+    asyncio.run(service.append_event(session, _event("inv3", "streamed chunk", partial=True)))
+
+    restored = asyncio.run(service.get_session(app_name=APP, user_id="u1", session_id="s1"))
+    assert [e.content.parts[0].text for e in restored.events] == [
+        "inv2 call", "inv2 answer", "inv3 call", "inv3 answer",
+    ]
+    assert restored.events[-1] == session.events[-1]
+
+    last = asyncio.run(service.get_session(
+        app_name=APP, user_id="u1", session_id="s1", config=GetSessionConfig(num_recent_events=1)
+    ))
+    assert [e.content.parts[0].text for e in last.events] == ["inv3 answer"]
+
+    everything = SqliteSessionService(loaded_invocations=None)
+    assert len(asyncio.run(everything.get_session(app_name=APP, user_id="u1", session_id="s1")).events) == 6
+
+
+def test_list_has_and_delete_sessions(service):
+    asyncio.run(service.create_session(app_name=APP, user_id="u1", session_id="s1"))
+    asyncio.run(service.create_session(app_name=APP, user_id="u1", session_id="s2"))
+
+    listed = asyncio.run(service.list_sessions(app_name=APP, user_id="u1"))
+    assert sorted(s.id for s in listed.sessions) == ["s1", "s2"]
+    assert service.has_session(app_name=APP, user_id="u1", session_id="s1")
+
+    asyncio.run(service.delete_session(app_name=APP, user_id="u1", session_id="s1"))
+    assert not service.has_session(app_name=APP, user_id="u1", session_id="s1")
+    assert asyncio.run(service.get_session(app_name=APP, user_id="u1", session_id="s1")) is None
+
+
+def test_sessions_survive_a_new_service_instance(service):
+    """A restarted process sees the same sessions."""
+    session = asyncio.run(service.create_session(app_name=APP, user_id="u1", session_id="s1"))
+    asyncio.run(service.append_event(session, _event("inv1", "answer", {"narrative_output": "report"})))
+    config_manager.close_all_connections()
+
+    restored = asyncio.run(SqliteSessionService().get_session(app_name=APP, user_id="u1", session_id="s1"))
+    assert restored.state["narrative_output"] == "report"
+    assert restored.events[0].content.parts[0].text == "answer"
+
+
+def test_events_only_write_the_keys_they_change(service):
+    """A large value already in state is not rewritten by later events, and a key set to None keeps None."""
+    session = asyncio.run(service.create_session(app_name=APP, user_id="u1", session_id="s1"))
+    asyncio.run(service.append_event(session, _event("inv1", "rows", {"artifact://data/1": "x" * 100_000})))
+    conn = config_manager.get_db_connection()
+    stored = conn.execute("SELECT rowid, value FROM adk_session_state WHERE key = 'artifact://data/1'").fetchone()
+
+    asyncio.run(service.append_event(session, _event("inv2", "chart", {"artifact_count": 2})))
+    assert tuple(conn.execute(
+        "SELECT rowid, value FROM adk_session_state WHERE key = 'artifact://data/1'"
+    ).fetchone()) == tuple(stored)
+
+    asyncio.run(service.append_event(session, _event("inv3", "clear", {"artifact://data/1": None})))
+    restored = asyncio.run(service.get_session(app_name=APP, user_id="u1", session_id="s1"))
+    assert restored.state == {"artifact://data/1": None, "artifact_count": 2}
+
+
+def test_whole_state_of_older_sessions_is_migrated(service):
+    conn = config_manager.get_db_connection()
+    conn.execute(
+        "INSERT INTO adk_sessions (app_name, user_id, session_id, state, create_time, update_time) "
+        "VALUES (?, ?, ?, ?, 0, 0)",
+        (APP, "u1", "old", compress(json.dumps({"narrative_output": "report"})))
+    )
+    conn.commit()
+    service.initialize()
+
+    restored = asyncio.run(service.get_session(app_name=APP, user_id="u1", session_id="old"))
+    assert restored.state == {"narrative_output": "report"}
+    assert conn.execute("SELECT state FROM adk_sessions WHERE session_id = 'old'").fetchone()[0] is None
@@ -0,0 +1,50 @@
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import speculation
+from ai_data_analyst.tools import postgres_mcp
+from ai_data_analyst.tools.query_cache import QueryCache
+
+SCHEMA = (
+    "**Table: `microdados_enem_2022`**\n- `sg_uf` (text)\n\n"
+    "**Table: `microdados_enem_2023`**\n- `sg_uf` (text)"
+)
+
+
+@pytest.mark.parametrize("request_text, queries", [
+    ("Quantos candidatos fizeram o ENEM em 2023?", ["SELECT COUNT(*) AS total FROM microdados_enem_2023"]),
+    ("How many candidates in 2022?", ["SELECT COUNT(*) AS total FROM microdados_enem_2022"]),
+    # Ambiguous table
+    ("Quantos candidatos fizeram o ENEM?", []),
+    # Not a count
+    ("Média de matemática por UF em 2023", []),
+])
+def test_candidate_queries(request_text, queries):
+    assert speculation.candidate_queries(request_text, SCHEMA) == queries
+
+
+def test_speculation_prefetches_schema_and_candidate_count(tmp_path, monkeypatch):
+    path = tmp_path / "enem.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE microdados_enem_2023 (sg_uf TEXT)")
+        conn.executemany("INSERT INTO microdados_enem_2023 VALUES (?)", [("SP",), ("RJ",), ("MG",)])
+    monkeypatch.setattr(postgres_mcp, "_database_url", lambda: f"sqlite:///{path}")
+    monkeypatch.setattr(postgres_mcp, "_engines", {})
+    monkeypatch.setattr(postgres_mcp, "query_cache", QueryCache(ttl=60, max_entries=8))
+    # SQLite has no information_schema
+    monkeypatch.setattr(postgres_mcp, "_load_tables_and_schemas", lambda: SCHEMA)
+    monkeypatch.setattr(postgres_mcp, "schema_cache", QueryCache(ttl=60, max_entries=8))
+    monkeypatch.setattr(speculation, "SPECULATION_ENABLED", True)
+
+    speculation.start("Quantos candidatos fizeram o ENEM em 2023?").result(timeout=10)
+
+    assert postgres_mcp.list_tables_and_schemas() == SCHEMA
+    result = postgres_mcp.execute_sql("SELECT COUNT(*) AS total FROM microdados_enem_2023")
+    assert json.loads(result) == [{"total": 3}]
+    assert postgres_mcp.get_cache_stats()["schema"]["hits"] == 1
+    assert postgres_mcp.get_cache_stats()["query"]["hits"] == 1
@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from ai_data_analyst import event_stream, llm_scheduler, tracing
+from ai_data_analyst.llm_scheduler import LlmScheduler, ScheduledLlm
+from ai_data_analyst.tools import postgres_mcp
+from ai_data_analyst.tools.query_cache import QueryCache
+
+QUERY = "SELECT sg_uf, nu_nota_mt FROM microdados_enem_2023"
+
+
+class ScriptedLlm(BaseLlm):
+    responses: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        response = self.responses.pop(0)
+        response.usage_metadata = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=100, candidates_token_count=20, total_token_count=120
+        )
+        yield response
+
+
+def _call(name, args):
+    part = types.Part(function_call=types.FunctionCall(name=name, args=args))
+    return LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+def _text(text):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+@pytest.fixture
+def traced(tmp_path, monkeypatch):
+    """Traces into memory only, with the database tools on a small SQLite database."""
+    monkeypatch.setattr(tracing, "TRACE_DIR", "")
+    tracing.configure_tracing()
+    path = tmp_path / "enem.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE microdados_enem_2023 (sg_uf TEXT, nu_nota_mt REAL)")
+        conn.executemany("INSERT INTO microdados_enem_2023 VALUES (?, ?)", [("SP", 600.0), ("RJ", 550.0)])
+    monkeypatch.setattr(postgres_mcp, "_database_url", lambda: f"sqlite:///{path}")
+    monkeypatch.setattr(postgres_mcp, "_engines", {})
+    monkeypatch.setattr(postgres_mcp, "query_cache", QueryCache(ttl=60, max_entries=8))
+    monkeypatch.setattr(llm_scheduler, "scheduler", LlmScheduler())
+
+
+def _pipeline():
+    data_agent = LlmAgent(
+        name="data_engineer_agent_tool",
+        model=ScheduledLlm(model="gemini-2.5-flash", agent="data_engineer_agent_tool", inner=ScriptedLlm(
+            model="live", responses=[_call("execute_sql", {"query": QUERY}), _text("2 linhas")],
+        )),
+        tools=[postgres_mcp.execute_sql],
+        after_tool_callback=tracing.record_tool_result,
+    )
+    return LlmAgent(
+        name="orchestrator",
+        model=ScheduledLlm(model="gemini-2.5-pro", agent="orchestrator", inner=ScriptedLlm(
+            model="live", responses=[_call("data_engineer_agent_tool", {"request": "notas"}), _text("Pronto.")],
+        )),
+        tools=[AgentTool(agent=data_agent)],
+    )
+
+
+def _path(spans, span):
+    """The names from the root of the trace down to `span`."""
+    by_id = {s["span_id"]: s for s in spans}
+    names = []
+    while span:
+        names.insert(0, span["name"])
+        span = by_id.get(span["parent_id"])
+    return names
+
+
+def test_request_is_traced_down_to_sql_and_llm_calls(traced):
+    runner = InMemoryRunner(agent=_pipeline(), app_name="app")
+    session = runner.session_service.create_session_sync(app_name="app", user_id="u")
+    message = types.Content(role="user", parts=[types.Part(text="Notas por UF")])
+    with tracing.request_span("Notas por UF", session_id=session.id) as span:
+        list(event_stream.stream_events(runner, user_id="u", session_id=session.id, new_message=message))
+
+    spans = tracing.get_trace(tracing.trace_id_of(span))
+    sql = next(s for s in spans if s["name"] == "sql")
+    assert _path(spans, sql) == [
+        "request", "invocation", "agent_run [orchestrator]", "call_llm", "execute_tool data_engineer_agent_tool",
+        "invocation", "agent_run [data_engineer_agent_tool]", "call_llm", "execute_tool execute_sql", "sql",
+    ]
+    assert sql["attributes"]["db.rows"] == 2
+    assert sql["attributes"]["db.result_bytes"] == len(postgres_mcp.execute_sql(QUERY))
+
+    llm_calls = [s for s in spans if s["name"].startswith("llm ")]
+    assert len(llm_calls) == 4
+    assert all(s["attributes"]["llm.total_tokens"] == 120 for s in llm_calls)
+    tool = next(s for s in spans if s["name"] == "execute_tool execute_sql")
+    assert tool["attributes"]["tool.result_bytes"] == sql["attributes"]["db.result_bytes"]
+    # Tree order, starting at the request
+    assert spans[0]["name"] == "request" and spans[0]["depth"] == 0
+
+
+def test_spans_are_exported_as_otlp_json_lines(tmp_path):
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(tracing.JsonlSpanExporter(str(tmp_path))))
+    tracer = provider.get_tracer("test")
+    with (
+        tracer.start_as_current_span("request"),
+        tracer.start_as_current_span("sql", attributes={"db.rows": 2, "db.statement": "x" * 5000}),
+    ):
+        pass
+
+    lines = [json.loads(line) for file in tmp_path.iterdir() for line in file.read_text().splitlines()]
+    spans = [span for line in lines for span in line["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    sql, request = spans
+    assert sql["parentSpanId"] == request["spanId"] and sql["traceId"] == request["traceId"]
+    attributes = {a["key"]: a["value"] for a in sql["attributes"]}
+    assert attributes["db.rows"] == {"intValue": "2"}
+    assert len(attributes["db.statement"]["stringValue"]) < 5000